@@ -0,0 +1,319 @@
+import asyncio
+import base64
+import hashlib
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+import backend.crud as crud
+from backend.core.models import (
+    Address as AddressModel,
+    Block,
+    Transaction as TransactionModel,
+)
+from backend.src.bchain import Block as BlockClass, Chain
+
+MAGIC = b"BCHAIN"
+VERSION = 1
+
+
+class ChainArchive:
+    # MAGIC and a version byte, then chunks of consecutive blocks. A chunk
+    # header has the block count, the first height, the compressed size and
+    # the sha256 of the compressed bytes. A header without blocks ends the
+    # file with the block total and the sha256 over all chunk digests, so a
+    # truncated file or a dropped chunk is noticed.
+    HEADER = struct.Struct(">IQI32s")
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.blocks = 0
+        self.digests = hashlib.sha256()
+
+    @staticmethod
+    def encodeBlocks(blocks: list[tuple[str, str]]) -> bytes:
+        # Raw hash and datastring bytes, the base64 of datastrings compresses
+        # badly
+        ret = bytearray()
+        for hash, datastring in blocks:
+            raw = base64.b64decode(datastring)
+            ret += bytes.fromhex(hash) + struct.pack(">I", len(raw)) + raw
+        return zlib.compress(bytes(ret), 6)
+
+    @staticmethod
+    def decodeBlocks(body: bytes) -> list[tuple[str, str]]:
+        raw = zlib.decompress(body)
+        ret = []
+        pos = 0
+        while pos < len(raw):
+            hash = raw[pos : pos + 32].hex()
+            (size,) = struct.unpack_from(">I", raw, pos + 32)
+            pos += 36
+            ret.append((hash, base64.b64encode(raw[pos : pos + size]).decode("ascii")))
+            pos += size
+        return ret
+
+    def writeStart(self) -> None:
+        self.f.write(MAGIC + bytes([VERSION]))
+
+    def writeChunk(self, height: int, blocks: list[tuple[str, str]]) -> None:
+        body = self.encodeBlocks(blocks)
+        digest = hashlib.sha256(body).digest()
+        self.f.write(self.HEADER.pack(len(blocks), height, len(body), digest))
+        self.f.write(body)
+        self.digests.update(digest)
+        self.blocks += len(blocks)
+
+    def writeEnd(self) -> None:
+        self.f.write(self.HEADER.pack(0, self.blocks, 0, self.digests.digest()))
+
+    def readStart(self) -> None:
+        if self.f.read(len(MAGIC) + 1) != MAGIC + bytes([VERSION]):
+            raise ValueError("Not a chain export file of a known version")
+
+    def readChunks(self):
+        # Yields (first height, compressed body) of every intact chunk
+        while True:
+            header = self.f.read(self.HEADER.size)
+            if len(header) != self.HEADER.size:
+                raise ValueError("File is truncated")
+            count, height, size, digest = self.HEADER.unpack(header)
+            if count == 0:
+                if height != self.blocks or digest != self.digests.digest():
+                    raise ValueError("File doesn't match its end record")
+                return
+            if height != self.blocks:
+                raise ValueError(f"Chunk at height {height} is out of order")
+            body = self.f.read(size)
+            if len(body) != size:
+                raise ValueError("File is truncated")
+            if hashlib.sha256(body).digest() != digest:
+                raise ValueError(f"Chunk at height {height} is corrupted")
+            self.digests.update(digest)
+            self.blocks += count
+            yield height, body
+
+
+def verify_chunk(height: int, body: bytes) -> list[tuple]:
+    # Runs in a worker process: proof of work and signatures of every block
+    # and the links inside the chunk. Returns plain tuples for the inserts.
+    ret = []
+    prev = None
+    for hash, datastring in ChainArchive.decodeBlocks(body):
+        # validate_link checks the signatures, decoding doesn't
+        block = BlockClass.fromDatastring(datastring, hash, verify=False)
+        if block.data["id"] != height + len(ret):
+            raise ValueError(f"Block {height + len(ret)} is out of order")
+        if not Chain.validate_link(prev, block):
+            raise ValueError(f"Block {block.data['id']} doesn't follow the previous")
+        transactions = []
+        for num in range(block.getTransactionListLen()):
+            tr = block.getTransaction(num)
+            transactions.append(
+                (
+                    tr.data["ttype"].value,
+                    tr.data["timestamp"],
+                    None
+                    if tr.data["fromAddr"] is None
+                    else tr.data["fromAddr"].address,
+                    tr.data["toAddr"].address,
+                    tr.data["pkey"],
+                    tr.data["value"],
+                    tr.data["fee"],
+                    tr.datastring,
+                    tr.signature,
+                )
+            )
+        ret.append(
+            (
+                block.data["id"],
+                block.data["prevHash"],
+                hash,
+                block.data["nonce"],
+                datastring,
+                transactions,
+            )
+        )
+        prev = block
+    return ret
+
+
+async def export_chain(session_factory: async_sessionmaker, f, chunk_size: int) -> int:
+    # Keyset pages in height order, row ids can have gaps after a reorg
+    archive = ChainArchive(f)
+    archive.writeStart()
+    height = 0
+    while True:
+        async with session_factory() as session:
+            stmt = (
+                select(Block.height, Block.hash, Block.datastring)
+                .where(Block.height >= height)
+                .order_by(Block.height)
+                .limit(chunk_size)
+            )
+            rows = (await session.execute(stmt)).all()
+        if not rows:
+            break
+        if rows[-1].height - height + 1 != len(rows):
+            raise ValueError(f"Blocks from height {height} aren't consecutive")
+        archive.writeChunk(height, [(row.hash, row.datastring) for row in rows])
+        height += len(rows)
+    archive.writeEnd()
+    return archive.blocks
+
+
+class ChainImport:
+    # Chunks are verified in a process pool while earlier ones are inserted.
+    # The indexes of the block and transaction tables are dropped for the
+    # inserts and built once at the end, all in one DB transaction. Undo
+    # records are left out, a reorg computes them for these blocks. Rows get
+    # explicit ids, block ids are height + 1 like on a chain that never
+    # reorganized.
+
+    def __init__(self, workers: int, window: int) -> None:
+        self.workers = workers
+        self.window = window
+        self.blocks = 0
+        self.prev_hash = None
+        self.addresses: dict[str, int] = {}
+        self.next_address_id = 1
+        self.next_transaction_id = 1
+
+    async def run(
+        self, engine: AsyncEngine, session_factory: async_sessionmaker, f
+    ) -> int:
+        archive = ChainArchive(f)
+        archive.readStart()
+        async with session_factory() as session:
+            if await session.scalar(select(Block.id).limit(1)) is not None:
+                raise ValueError("The database already has blocks")
+            for id, address in await session.execute(
+                select(AddressModel.id, AddressModel.address)
+            ):
+                self.addresses[address] = id
+            self.next_address_id = max(self.addresses.values(), default=0) + 1
+            self.next_transaction_id = (
+                await session.scalar(select(func.max(TransactionModel.id))) or 0
+            ) + 1
+
+        indexes = [
+            index
+            for table in (Block.__table__, TransactionModel.__table__)
+            for index in table.indexes
+        ]
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                async with engine.begin() as conn:
+                    for index in indexes:
+                        await conn.run_sync(
+                            lambda sync, index=index: index.drop(sync, checkfirst=True)
+                        )
+                    await self.load(conn, pool, archive)
+                    await self.reset_sequences(conn)
+        finally:
+            # SQLite commits DDL at once, so the indexes are rebuilt after the
+            # inserts are committed or rolled back
+            async with engine.begin() as conn:
+                for index in indexes:
+                    await conn.run_sync(
+                        lambda sync, index=index: index.create(sync, checkfirst=True)
+                    )
+
+        async with session_factory() as session:
+            await crud.rebuild_balances(session)
+            await crud.rebuild_chain_tip(session)
+        return self.blocks
+
+    @staticmethod
+    async def reset_sequences(conn) -> None:
+        # Explicit ids don't advance Postgres sequences, the next block or
+        # transaction would get the id of an imported row
+        if conn.dialect.name != "postgresql":
+            return
+        for table in (
+            AddressModel.__table__,
+            Block.__table__,
+            TransactionModel.__table__,
+        ):
+            await conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"max(id)) FROM {table.name}"
+                )
+            )
+
+    async def load(self, conn, pool: ProcessPoolExecutor, archive: ChainArchive):
+        # At most `window` chunks are verifying or waiting to be inserted
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        try:
+            for height, body in archive.readChunks():
+                pending.append(loop.run_in_executor(pool, verify_chunk, height, body))
+                if len(pending) >= self.window:
+                    await self.insert(conn, await pending.popleft())
+            while pending:
+                await self.insert(conn, await pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def insert(self, conn, blocks: list[tuple]) -> None:
+        first = blocks[0]
+        if first[0] != self.blocks or (
+            self.prev_hash is not None and first[1] != self.prev_hash
+        ):
+            raise ValueError(f"Block {first[0]} doesn't follow the previous")
+        addresses = []
+        for block in blocks:
+            for tr in block[5]:
+                for address in tr[2:4]:
+                    if address is not None and address not in self.addresses:
+                        self.addresses[address] = self.next_address_id
+                        addresses.append(
+                            {"id": self.next_address_id, "address": address, "ckey": ""}
+                        )
+                        self.next_address_id += 1
+        if addresses:
+            await conn.execute(insert(AddressModel.__table__), addresses)
+        await conn.execute(
+            insert(Block.__table__),
+            [
+                {
+                    "id": height + 1,
+                    "height": height,
+                    "prevHash": prev_hash,
+                    "hash": hash,
+                    "nonce": nonce,
+                    "datastring": datastring,
+                }
+                for height, prev_hash, hash, nonce, datastring, _ in blocks
+            ],
+        )
+        transactions = []
+        for block in blocks:
+            for ttype, ts, from_addr, to_addr, pkey, value, fee, data, sig in block[5]:
+                transactions.append(
+                    {
+                        "id": self.next_transaction_id,
+                        "ttype": ttype,
+                        "ttimestamp": ts,
+                        "fromAddr": None
+                        if from_addr is None
+                        else self.addresses[from_addr],
+                        "toAddr": self.addresses[to_addr],
+                        "pkey": pkey,
+                        "value": value,
+                        "fee": fee,
+                        "data": data,
+                        "block_id": block[0] + 1,
+                        "signature": sig,
+                    }
+                )
+                self.next_transaction_id += 1
+        await conn.execute(insert(TransactionModel.__table__), transactions)
+        self.blocks += len(blocks)
+        self.prev_hash = blocks[-1][2]
@@ -0,0 +1,147 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend.core.config import settings
+from backend.core.models import Block, Transaction as TransactionModel
+from backend.src.bchain import Block as BlockClass, Chain
+from backend.workers import batch_pool
+
+
+class ChainAudit:
+    def __init__(self, chunk_size: int) -> None:
+        self.chunk_size = chunk_size
+        self.status = "idle"
+        self.total = 0
+        self.checked = 0
+        self.height = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "total": self.total,
+            "checked": self.checked,
+            "height": self.height,
+            "error": self.error,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    def start(self, session_factory: async_sessionmaker) -> None:
+        self.status = "running"
+        self._task = asyncio.create_task(self.run(session_factory))
+
+    async def run(
+        self, session_factory: async_sessionmaker, progress=None, after: int = 0
+    ) -> bool:
+        # Checks the blocks with row ids above `after`, the block at `after`
+        # is trusted. Chunks are checked in the batch pool, a few at a time,
+        # and their results are taken in order.
+        self.status = "running"
+        self.checked = 0
+        self.height = None
+        self.error = None
+        self.started = datetime.now()
+        self.finished = None
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        try:
+            prev = None
+            async with session_factory() as session:
+                self.total = await session.scalar(
+                    select(func.count(Block.id)).where(Block.id > after)
+                )
+                if after:
+                    row = await session.get(Block, after)
+                    prev = (row.datastring, row.hash)
+            async for rows in self.stream(session_factory, after):
+                pending.append(
+                    loop.run_in_executor(batch_pool.pool, check_chunk, prev, rows)
+                )
+                prev = rows[-1][1:3]
+                if len(pending) > max(batch_pool.workers, 1):
+                    self.collect(await pending.popleft(), progress)
+            while pending:
+                self.collect(await pending.popleft(), progress)
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        else:
+            self.status = "ok"
+        finally:
+            for future in pending:
+                future.cancel()
+        self.finished = datetime.now()
+        return self.status == "ok"
+
+    def collect(self, result: tuple, progress) -> None:
+        checked, height, error = result
+        self.checked += checked
+        if height is not None:
+            self.height = height
+        if progress is not None:
+            progress(self)
+        if error is not None:
+            raise ValueError(error)
+
+    async def stream(self, session_factory: async_sessionmaker, last_id: int = 0):
+        # Keyset pages over the row id, one list of rows per chunk
+        while True:
+            async with session_factory() as session:
+                stmt = (
+                    select(Block.id, Block.datastring, Block.hash)
+                    .where(Block.id > last_id)
+                    .order_by(Block.id)
+                    .limit(self.chunk_size)
+                )
+                rows = (await session.execute(stmt)).all()
+                if not rows:
+                    return
+                stmt = select(
+                    TransactionModel.block_id, TransactionModel.signature
+                ).where(TransactionModel.block_id.in_([row.id for row in rows]))
+                signatures = {row.id: [] for row in rows}
+                for block_id, signature in await session.execute(stmt):
+                    signatures[block_id].append(signature)
+            yield [
+                (row.id, row.datastring, row.hash, signatures[row.id]) for row in rows
+            ]
+            last_id = rows[-1].id
+
+
+def check_chunk(prev: tuple | None, rows: list[tuple]) -> tuple:
+    # Runs in a worker process: proof of work, signatures and links of
+    # (row id, datastring, hash, signatures) rows. prev is the datastring and
+    # hash of the block before them. Returns the number of valid blocks, the
+    # last valid height and the error of the first bad block.
+    if prev is not None:
+        prev = BlockClass.fromDatastring(*prev, verify=False)
+    height = None
+    for num, (row_id, datastring, hash, signatures) in enumerate(rows):
+        try:
+            # validate_link checks the signatures, decoding doesn't
+            block = BlockClass.fromDatastring(datastring, hash, verify=False)
+            if not Chain.validate_link(prev, block):
+                raise ValueError("Block doesn't follow the previous block")
+            expected = [pair[1] for pair in block.data["transactionList"].getPairs()]
+            if sorted(signatures) != sorted(expected):
+                raise ValueError("Stored transactions don't match the datastring")
+        except Exception as e:
+            return num, height, f"Block row {row_id}: {e}"
+        prev = block
+        height = block.data["id"]
+    return len(rows), height, None
+
+
+chain_audit = ChainAudit(chunk_size=settings.audit_chunk_size)
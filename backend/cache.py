@@ -0,0 +1,91 @@
+from collections import OrderedDict
+
+from backend.core.config import settings
+from backend.schemas import ChainTip
+
+
+class ChainTipCache:
+    # Mirrors the chain_tip row for this process, writers refresh it after commit
+    def __init__(self) -> None:
+        self.tip: ChainTip | None = None
+
+    def get(self) -> ChainTip | None:
+        return self.tip
+
+    def set(self, tip: ChainTip | None) -> None:
+        self.tip = tip
+
+    def clear(self) -> None:
+        self.tip = None
+
+
+class CachedBlock:
+    __slots__ = ["id", "hash", "body", "height"]
+
+    def __init__(self, id: int, hash: str, body: bytes, height: int) -> None:
+        self.id = id
+        self.hash = hash
+        self.body = body
+        self.height = height
+
+    @property
+    def etag(self) -> str:
+        # The hash commits to the whole block, so it is a strong validator
+        return f'"{self.hash}"'
+
+
+class BlockCache:
+    # Serialized block responses keyed by row id, with a hash index on top
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[int, CachedBlock] = OrderedDict()
+        self._hashes: dict[str, int] = {}
+
+    def get(self, id: int) -> CachedBlock | None:
+        entry = self._data.get(id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(id)
+        self.hits += 1
+        return entry
+
+    def get_by_hash(self, hash: str) -> CachedBlock | None:
+        id = self._hashes.get(hash)
+        if id is None:
+            self.misses += 1
+            return None
+        return self.get(id)
+
+    def add(self, entry: CachedBlock) -> None:
+        self.discard(entry.id)
+        self._data[entry.id] = entry
+        self._hashes[entry.hash] = entry.id
+        while len(self._data) > self.maxsize:
+            _, oldest = self._data.popitem(last=False)
+            self._hashes.pop(oldest.hash, None)
+
+    def discard(self, id: int) -> None:
+        entry = self._data.pop(id, None)
+        if entry is not None:
+            self._hashes.pop(entry.hash, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._hashes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+chain_tip_cache = ChainTipCache()
+block_cache = BlockCache(settings.block_cache_size)
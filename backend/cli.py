@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import os
+import sys
+
+import backend.crud as crud
+from backend.archive import ChainImport, export_chain
+from backend.audit import ChainAudit
+from backend.core.config import settings
+from backend.core.models import db_helper
+from backend.migrations import head, migrate as run_migrations
+from backend.snapshot import state_snapshots
+from backend.workers import batch_pool
+
+
+def print_progress(audit: ChainAudit) -> None:
+    if audit.checked % audit.chunk_size == 0 or audit.checked == audit.total:
+        print(f"Checked {audit.checked}/{audit.total} blocks", file=sys.stderr)
+
+
+async def audit(args: argparse.Namespace) -> int:
+    chain_audit = ChainAudit(chunk_size=args.chunk_size)
+    batch_pool.start()
+    try:
+        await chain_audit.run(db_helper.session_factory, progress=print_progress)
+    finally:
+        await batch_pool.shutdown()
+    await db_helper.engine.dispose()
+    if chain_audit.status != "ok":
+        print(f"Audit failed: {chain_audit.error}", file=sys.stderr)
+        return 1
+    print(f"Chain is valid up to block {chain_audit.height}")
+    return 0
+
+
+async def rebuild_balances(args: argparse.Namespace) -> int:
+    async with db_helper.session_factory() as session:
+        count = await crud.rebuild_balances(session)
+    await db_helper.engine.dispose()
+    print(f"Rebuilt balances for {count} addresses")
+    return 0
+
+
+async def rebuild_tip(args: argparse.Namespace) -> int:
+    async with db_helper.session_factory() as session:
+        tip = await crud.rebuild_chain_tip(session)
+    await db_helper.engine.dispose()
+    if tip is None:
+        print("Chain is empty")
+    else:
+        print(f"Chain tip is block {tip.height} ({tip.hash}), {tip.length} blocks")
+    return 0
+
+
+async def migrate(args: argparse.Namespace) -> int:
+    applied = await run_migrations(db_helper.engine, args.revision)
+    await db_helper.engine.dispose()
+    if not applied:
+        print("Schema is up to date")
+    for revision in applied:
+        print(f"Applied revision {revision}")
+    return 0
+
+
+async def snapshot(args: argparse.Namespace) -> int:
+    if not state_snapshots.enabled:
+        print("Snapshots need SNAPSHOT_PATH with this database", file=sys.stderr)
+        return 1
+    path = await state_snapshots.save(db_helper.session_factory)
+    await db_helper.engine.dispose()
+    if path is None:
+        print(state_snapshots.error or "Chain is empty", file=sys.stderr)
+        return 1
+    print(f"Wrote {path}")
+    return 0
+
+
+async def export(args: argparse.Namespace) -> int:
+    with open(args.path, "wb") as f:
+        count = await export_chain(db_helper.session_factory, f, args.chunk_size)
+    await db_helper.engine.dispose()
+    print(f"Exported {count} blocks to {args.path}")
+    return 0
+
+
+async def import_(args: argparse.Namespace) -> int:
+    await run_migrations(db_helper.engine)
+    try:
+        with open(args.path, "rb") as f:
+            count = await ChainImport(args.workers, args.window).run(
+                db_helper.engine, db_helper.session_factory, f
+            )
+    except ValueError as e:
+        await db_helper.engine.dispose()
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    # Every block has been verified, the next start doesn't audit them again
+    if state_snapshots.enabled:
+        await state_snapshots.save(db_helper.session_factory)
+    await db_helper.engine.dispose()
+    print(f"Imported {count} blocks")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Blockchain node tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    audit_parser = subparsers.add_parser("audit", help="Validate the stored chain")
+    audit_parser.add_argument(
+        "--chunk-size", type=int, default=settings.audit_chunk_size
+    )
+    audit_parser.set_defaults(handler=audit)
+
+    balances_parser = subparsers.add_parser(
+        "rebuild-balances", help="Regenerate the balances table from transactions"
+    )
+    balances_parser.set_defaults(handler=rebuild_balances)
+
+    tip_parser = subparsers.add_parser(
+        "rebuild-tip", help="Regenerate the chain tip record from the blocks"
+    )
+    tip_parser.set_defaults(handler=rebuild_tip)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Upgrade or downgrade the database schema"
+    )
+    migrate_parser.add_argument("--revision", type=int, default=head())
+    migrate_parser.set_defaults(handler=migrate)
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Write a state snapshot for fast startup"
+    )
+    snapshot_parser.set_defaults(handler=snapshot)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Write the chain to a checksummed file"
+    )
+    export_parser.add_argument("path")
+    export_parser.add_argument(
+        "--chunk-size", type=int, default=settings.archive_chunk_size
+    )
+    export_parser.set_defaults(handler=export)
+
+    import_parser = subparsers.add_parser(
+        "import", help="Load an exported chain into an empty database"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    import_parser.add_argument("--window", type=int, default=8)
+    import_parser.set_defaults(handler=import_)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,6 @@
-from pydantic_settings import BaseSettings
-
-
-class Settings(BaseSettings):
-    db_url: str = "sqlite+aiosqlite:///./db.sqlite3"
-    db_echo: bool = True
-
+import os
 
-settings = Settings()
+from pydantic_settings import BaseSettings
 
 WHITELIST = [
     "http://localhost:5000/",
@@ -14,3 +8,50 @@ WHITELIST = [
     "http://localhost:5002/",
     "http://localhost:5003/",
 ]
+
+
+class Settings(BaseSettings):
+    db_url: str = "sqlite+aiosqlite:///./db.sqlite3"
+    db_echo: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout: int = 5000
+    mining_workers: int = 1
+    miner_address_id: int = 1
+    mining_tip_poll_interval: float = 1.0
+    audit_chunk_size: int = 500
+    archive_chunk_size: int = 500
+    page_size: int = 100
+    max_page_size: int = 1000
+    stream_chunk_size: int = 500
+    block_cache_size: int = 1024
+    block_confirmations: int = 6
+    # Cache lifetime of confirmed blocks requested by id, a reorg can reuse ids
+    block_max_age: int = 60
+    mempool_size: int = 50000
+    batch_max_size: int = 500
+    # Processes for signing and verifying batches, 0 keeps them in this process
+    batch_workers: int = os.cpu_count() or 1
+    # Nodes to sync and relay with, e.g. PEERS='["http://localhost:5001/"]'
+    peers: list[str] = []
+    sync_timeout: float = 10
+    sync_connections: int = 20
+    sync_header_batch: int = 2000
+    sync_window: int = 16
+    sync_parallel: int = 4
+    # Empty puts snapshots next to an SQLite database, other databases need a path
+    snapshot_path: str = ""
+    snapshot_interval: float = 600
+    snapshot_keep: int = 2
+    # Validates the stored blocks after the newest snapshot, or all of them
+    # without one, on every start
+    startup_audit: bool = False
+    sql_metrics: bool = True
+
+
+settings = Settings()
@@ -5,9 +5,8 @@ from sqlalchemy.orm import (
     declared_attr,
     relationship,
 )
-from sqlalchemy import func, String, ForeignKey
+from sqlalchemy import func, event, make_url, String, ForeignKey, JSON
 from sqlalchemy.ext.asyncio import (
-    async_scoped_session,
     create_async_engine,
     async_sessionmaker,
     AsyncSession,
@@ -15,7 +14,6 @@ from sqlalchemy.ext.asyncio import (
 from typing import List, Optional
 from typing_extensions import Annotated
 from datetime import datetime
-from asyncio import current_task
 from backend.core.config import settings
 
 
@@ -36,37 +34,107 @@ timestamp = Annotated[
 
 
 class Address(Base):
-    address: Mapped[str] = mapped_column(String(42))
+    address: Mapped[str] = mapped_column(String(42), unique=True, index=True)
     ckey: Mapped[str]
 
 
 class Transaction(Base):
     ttype: Mapped[int]
-    ttimestamp: Mapped[timestamp] = mapped_column(server_default=func.UTC_TIMESTAMP())
-    fromAddr: Mapped[int] = mapped_column(ForeignKey("address_table.id"), nullable=True)
-    toAddr: Mapped[int] = mapped_column(ForeignKey("address_table.id"), nullable=True)
+    ttimestamp: Mapped[timestamp]
+    fromAddr_id: Mapped[int] = mapped_column(
+        "fromAddr", ForeignKey("address_table.id"), nullable=True, index=True
+    )
+    toAddr_id: Mapped[int] = mapped_column(
+        "toAddr", ForeignKey("address_table.id"), nullable=True, index=True
+    )
+    fromAddr: Mapped[Optional["Address"]] = relationship(
+        foreign_keys=[fromAddr_id], lazy="selectin"
+    )
+    toAddr: Mapped[Optional["Address"]] = relationship(
+        foreign_keys=[toAddr_id], lazy="selectin"
+    )
     pkey: Mapped[str]
     value: Mapped[int]
-    fee: Mapped[int]
+    fee: Mapped[int] = mapped_column(index=True)
     data: Mapped[str]
-    block_id: Mapped[int] = mapped_column(ForeignKey("block_table.id"), nullable=True)
-    signature: Mapped[str]
+    block_id: Mapped[int] = mapped_column(
+        ForeignKey("block_table.id"), nullable=True, index=True
+    )
+    signature: Mapped[str] = mapped_column(index=True)
 
 
 class Block(Base):
     prevHash: Mapped[str]
-    hash: Mapped[str]
-    transactionList: Mapped[List["Transaction"]] = relationship(lazy="immediate")
+    hash: Mapped[str] = mapped_column(unique=True, index=True)
+    # Row ids aren't heights, a reorg on Postgres doesn't reuse them
+    height: Mapped[int] = mapped_column(unique=True, index=True)
+    transactionList: Mapped[List["Transaction"]] = relationship(lazy="selectin")
     nonce: Mapped[int]
     datastring: Mapped[str]
 
 
+class Balance(Base):
+    address_id: Mapped[int] = mapped_column(ForeignKey("address_table.id"), unique=True)
+    confirmed: Mapped[int] = mapped_column(default=0)
+    pending: Mapped[int] = mapped_column(default=0)
+
+
+class ChainTip(Base):
+    block_id: Mapped[int] = mapped_column(ForeignKey("block_table.id"))
+    height: Mapped[int]
+    hash: Mapped[str]
+    length: Mapped[int]
+    # Hex, cumulative work quickly outgrows a 64-bit integer column
+    work: Mapped[str] = mapped_column(String(64))
+
+
+class BlockUndo(Base):
+    # What connecting a block changed, so a reorg can take it back without
+    # looking at the rest of the chain. Keys of the balance deltas are
+    # address ids.
+    block_id: Mapped[int] = mapped_column(ForeignKey("block_table.id"), unique=True)
+    confirmed: Mapped[dict] = mapped_column(JSON)
+    pending: Mapped[dict] = mapped_column(JSON)
+    transactions: Mapped[list] = mapped_column(JSON)
+    rewards: Mapped[list] = mapped_column(JSON)
+
+
 class DatabaseHelper:
-    def __init__(self, url: str, echo: bool = False):
-        self.engine = create_async_engine(
-            url=url,
-            echo=echo,
+    def __init__(
+        self,
+        url: str,
+        echo: bool = False,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        sqlite_pragmas: dict | None = None,
+    ):
+        self.url = make_url(self.normalize_url(url))
+        kwargs = {}
+        if not self.is_memory:
+            kwargs = {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_timeout": pool_timeout,
+                "pool_recycle": pool_recycle,
+                "pool_pre_ping": pool_pre_ping,
+            }
+        self.engine = create_async_engine(url=self.url, echo=echo, **kwargs)
+        self.sqlite_pragmas = sqlite_pragmas or {}
+        self.counters = dict.fromkeys(
+            ["connects", "checkouts", "checkins", "invalidations", "sessions"], 0
         )
+        self.sessions_open = 0
+        pool_events = {
+            "connect": self._on_connect,
+            "checkout": self._counter("checkouts"),
+            "checkin": self._counter("checkins"),
+            "invalidate": self._counter("invalidations"),
+        }
+        for name, listener in pool_events.items():
+            event.listen(self.engine.sync_engine, name, listener)
         self.session_factory = async_sessionmaker(
             bind=self.engine,
             autoflush=False,
@@ -74,20 +142,77 @@ class DatabaseHelper:
             expire_on_commit=False,
         )
 
-    def get_scoped_session(self):
-        session = async_scoped_session(
-            session_factory=self.session_factory,
-            scopefunc=current_task,
-        )
-        return session
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        # Plain postgres URLs get the async driver that ships with the project
+        for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+            if url.startswith(prefix):
+                return "postgresql+asyncpg://" + url[len(prefix) :]
+        return url
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.url.get_backend_name() == "sqlite"
+
+    @property
+    def is_memory(self) -> bool:
+        return self.is_sqlite and self.url.database in (None, "", ":memory:")
+
+    def _counter(self, name: str):
+        def listener(*args) -> None:
+            self.counters[name] += 1
+
+        return listener
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self.counters["connects"] += 1
+        if not self.is_sqlite or not self.sqlite_pragmas:
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in self.sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        ret = {
+            "backend": self.url.get_backend_name(),
+            "driver": self.url.get_driver_name(),
+            "pool": type(pool).__name__,
+            "sessions_open": self.sessions_open,
+            **self.counters,
+        }
+        if hasattr(pool, "checkedout"):
+            ret.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        return ret
 
     async def scoped_session_dependency(self) -> AsyncSession:
-        session = self.get_scoped_session()
-        yield session
-        await session.close()
+        # The session is closed even if the request handler raises
+        async with self.session_factory() as session:
+            self.sessions_open += 1
+            self.counters["sessions"] += 1
+            try:
+                yield session
+            finally:
+                self.sessions_open -= 1
 
 
 db_helper = DatabaseHelper(
     url=settings.db_url,
     echo=settings.db_echo,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    sqlite_pragmas={
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout,
+    },
 )
@@ -1,13 +1,20 @@
+from collections import defaultdict
+
 from fastapi import HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.engine import Result
-from sqlalchemy.ext.asyncio import AsyncSession
-from backend.src.bchain.block import Block as BlockClass, TransactionList
+from sqlalchemy import select, insert, update, delete, func, bindparam, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from backend.src.bchain.block import TransactionList
+from backend.src.bchain.constants import Constants
+from backend.cache import chain_tip_cache, block_cache
+from backend.mempool import mempool, MempoolEntry, REWARD_TYPES
 
 from backend.core.models import (
     Block,
     Transaction as TransactionModel,
     Address as AddressModel,
+    Balance as BalanceModel,
+    ChainTip as ChainTipModel,
+    BlockUndo as BlockUndoModel,
 )
 from backend.schemas import (
     AddressCreate,
@@ -17,6 +24,7 @@ from backend.schemas import (
     TransactionUpdate,
     BlockUpdatePartial,
     TransactionUpdatePartial,
+    ChainTip as ChainTipSchema,
 )
 
 
@@ -25,6 +33,8 @@ async def create_address(
 ) -> AddressModel:
     address = AddressModel(**address_inp.model_dump())
     session.add(address)
+    await session.flush()
+    session.add(BalanceModel(address_id=address.id, confirmed=0, pending=0))
     await session.commit()
     return address
 
@@ -33,72 +43,406 @@ async def create_transaction(
     session: AsyncSession, transaction_inp: TransactionCreate
 ) -> TransactionModel:
     temp_dict = transaction_inp.model_dump()
-    fromaddr = temp_dict.pop("fromAddr")
-    if fromaddr is not None:
-        temp_dict["fromAddr"] = fromaddr
-    toaddr = temp_dict.pop("toAddr")
-    if toaddr is not None:
-        temp_dict["toAddr"] = toaddr
+    temp_dict["fromAddr_id"] = temp_dict.pop("fromAddr")
+    temp_dict["toAddr_id"] = temp_dict.pop("toAddr")
 
     transaction = TransactionModel(**temp_dict)
     session.add(transaction)
+    await session.flush()
+    await update_balances(
+        session=session,
+        deltas=await get_balance_deltas(session, [transaction.id]),
+        confirm=transaction.block_id is not None,
+        pending=transaction.block_id is None,
+    )
     await session.commit()
+    add_to_mempool(transaction)
     return transaction
 
 
-async def create_block(session: AsyncSession, block_inp: BlockCreate) -> Block:
-    tr_list = []
-    for tr in block_inp.transactionList:
-        tr_cur = await get_transaction_by_id(session=session, transaction_id=tr)
-        tr_list.append(tr_cur)
-    dump = block_inp.model_dump()
-    dump["transactionList"] = tr_list.copy()
-    block = Block(**dump)
-    session.add(block)
+async def create_transactions(
+    session: AsyncSession,
+    transactions_inp: list[TransactionCreate],
+    commit: bool = True,
+) -> list[int | None]:
+    # One multi-row INSERT and one commit for the whole batch. Without commit
+    # the rows join the caller's transaction and stay out of the mempool.
+    # Committed rows the mempool turns away are deleted again, their id is None.
+    if not transactions_inp:
+        return []
+    rows = []
+    for transaction_inp in transactions_inp:
+        temp_dict = transaction_inp.model_dump()
+        temp_dict["fromAddr_id"] = temp_dict.pop("fromAddr")
+        temp_dict["toAddr_id"] = temp_dict.pop("toAddr")
+        rows.append(temp_dict)
+    stmt = insert(TransactionModel).returning(
+        TransactionModel.id, sort_by_parameter_order=True
+    )
+    ids = list(await session.scalars(stmt, rows))
+    await update_balances(
+        session=session,
+        deltas=balance_deltas(
+            (row["fromAddr_id"], row["toAddr_id"], row["value"], row["fee"])
+            for row in rows
+        ),
+    )
+    if not commit:
+        return ids
     await session.commit()
-    for tr in block.transactionList:
-        await update_transaction_parent(
-            session=session, transaction_id=tr.id, inp_block_id=block.id
+    added = []
+    for id, row in zip(ids, rows):
+        if row["ttype"] not in REWARD_TYPES:
+            mempool.add(MempoolEntry(id, row["fee"], row["data"], row["signature"]))
+            added.append(id)
+    # Checked after the whole batch, a later row may have evicted an earlier one
+    rejected = {id for id in added if not mempool.has_id(id)}
+    if rejected:
+        await update_balances(
+            session=session,
+            deltas={
+                address_id: -delta
+                for address_id, delta in balance_deltas(
+                    (row["fromAddr_id"], row["toAddr_id"], row["value"], row["fee"])
+                    for id, row in zip(ids, rows)
+                    if id in rejected
+                ).items()
+            },
         )
+        await session.execute(
+            delete(TransactionModel).where(TransactionModel.id.in_(rejected))
+        )
+        await session.commit()
+    return [None if id in rejected else id for id in ids]
+
+
+def add_to_mempool(transaction: TransactionModel) -> bool:
+    # Rewards only exist as part of the block they are created for
+    if transaction.block_id is not None or transaction.ttype in REWARD_TYPES:
+        return False
+    return mempool.add(MempoolEntry.fromModel(transaction))
+
+
+async def load_mempool(session: AsyncSession) -> int:
+    stmt = (
+        select(
+            TransactionModel.id,
+            TransactionModel.fee,
+            TransactionModel.data,
+            TransactionModel.signature,
+        )
+        .where(
+            TransactionModel.block_id.is_(None),
+            TransactionModel.ttype.not_in(REWARD_TYPES),
+        )
+        .order_by(TransactionModel.fee.desc(), TransactionModel.id)
+        .limit(mempool.maxsize)
+    )
+    mempool.clear()
+    for row in await session.execute(stmt):
+        mempool.add(MempoolEntry(row.id, row.fee, row.data, row.signature))
+    return len(mempool)
+
+
+async def create_block(
+    session: AsyncSession, block_inp: BlockCreate, commit: bool = True
+) -> Block:
+    # Everything below is one DB transaction, a failure rolls all of it back.
+    # Without commit the caller commits and then updates the caches.
+    transaction_ids = block_inp.transactionList
+    dump = block_inp.model_dump()
+    dump.pop("transactionList")
+    try:
+        # Blocks always extend the tip
+        height = await session.scalar(select(ChainTipModel.height).with_for_update())
+        block = Block(**dump, height=0 if height is None else height + 1)
+        session.add(block)
+        await session.flush()
+        stmt = (
+            update(TransactionModel)
+            .where(
+                TransactionModel.id.in_(transaction_ids),
+                TransactionModel.block_id.is_(None),
+            )
+            .values(block_id=block.id)
+        )
+        result = await session.execute(stmt)
+        if result.rowcount != len(set(transaction_ids)):
+            raise ValueError("Some transactions don't exist or are already in a block")
+        undo = await compute_block_undo(session, block.id)
+        session.add(undo)
+        # Balances move from pending to confirmed in the same commit as the block
+        await update_balances(
+            session=session,
+            deltas={int(k): delta for k, delta in undo.confirmed.items()},
+            confirm=True,
+        )
+        tip = await advance_chain_tip(session, block)
+        if not commit:
+            return block
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    chain_tip_cache.set(tip)
+    mempool.discard_ids(transaction_ids)
+    await session.refresh(block, ["transactionList"])
     return block
 
 
+async def compute_block_undo(session: AsyncSession, block_id: int) -> BlockUndoModel:
+    stmt = select(
+        TransactionModel.id,
+        TransactionModel.ttype,
+        TransactionModel.fromAddr_id,
+        TransactionModel.toAddr_id,
+        TransactionModel.value,
+        TransactionModel.fee,
+    ).where(TransactionModel.block_id == block_id)
+    rows = (await session.execute(stmt)).all()
+    others = [row for row in rows if row.ttype not in REWARD_TYPES]
+    return BlockUndoModel(
+        block_id=block_id,
+        confirmed=json_deltas(rows),
+        pending=json_deltas(others),
+        transactions=[row.id for row in others],
+        rewards=[row.id for row in rows if row.ttype in REWARD_TYPES],
+    )
+
+
+def json_deltas(rows) -> dict[str, int]:
+    return {
+        str(address_id): delta
+        for address_id, delta in balance_deltas(
+            (row.fromAddr_id, row.toAddr_id, row.value, row.fee) for row in rows
+        ).items()
+    }
+
+
+async def get_block_undo(session: AsyncSession, block_id: int) -> BlockUndoModel:
+    # Blocks connected before undo records existed get theirs computed
+    stmt = select(BlockUndoModel).where(BlockUndoModel.block_id == block_id)
+    undo = await session.scalar(stmt)
+    return undo if undo is not None else await compute_block_undo(session, block_id)
+
+
+async def disconnect_block(
+    session: AsyncSession, block_id: int, prev_hash: str
+) -> list[int]:
+    # Takes the tip block back inside the caller's transaction. Rewards are
+    # deleted, the other transactions become pending again and are returned.
+    undo = await get_block_undo(session, block_id)
+    await update_balances(
+        session=session,
+        deltas={int(k): -delta for k, delta in undo.confirmed.items()},
+        confirm=True,
+        pending=False,
+    )
+    await update_balances(
+        session=session,
+        deltas={int(k): delta for k, delta in undo.pending.items()},
+    )
+    await session.execute(
+        update(TransactionModel)
+        .where(TransactionModel.id.in_(undo.transactions))
+        .values(block_id=None)
+    )
+    await session.execute(
+        delete(TransactionModel).where(TransactionModel.id.in_(undo.rewards))
+    )
+    await session.execute(
+        delete(BlockUndoModel).where(BlockUndoModel.block_id == block_id)
+    )
+    parent = (
+        await session.execute(
+            select(Block.id, Block.hash).where(Block.hash == prev_hash)
+        )
+    ).first()
+    await retreat_chain_tip(session, parent)
+    await session.execute(delete(Block).where(Block.id == block_id))
+    return undo.transactions
+
+
+async def readd_to_mempool(session: AsyncSession, transaction_ids: list[int]) -> int:
+    stmt = select(
+        TransactionModel.id,
+        TransactionModel.fee,
+        TransactionModel.data,
+        TransactionModel.signature,
+    ).where(
+        TransactionModel.id.in_(transaction_ids),
+        TransactionModel.block_id.is_(None),
+    )
+    added = 0
+    for row in await session.execute(stmt):
+        added += mempool.add(MempoolEntry(row.id, row.fee, row.data, row.signature))
+    return added
+
+
+async def get_balance_deltas(
+    session: AsyncSession, transaction_ids: list[int]
+) -> dict[int, int]:
+    stmt = select(
+        TransactionModel.fromAddr_id,
+        TransactionModel.toAddr_id,
+        TransactionModel.value,
+        TransactionModel.fee,
+    ).where(TransactionModel.id.in_(transaction_ids))
+    return balance_deltas(await session.execute(stmt))
+
+
+def balance_deltas(rows) -> dict[int, int]:
+    # rows are (fromAddr_id, toAddr_id, value, fee)
+    deltas = defaultdict(int)
+    for fromaddr, toaddr, value, fee in rows:
+        if toaddr is not None:
+            deltas[toaddr] += value
+        if fromaddr is not None:
+            deltas[fromaddr] -= value + fee
+    return deltas
+
+
+async def update_balances(
+    session: AsyncSession,
+    deltas: dict[int, int],
+    confirm: bool = False,
+    pending: bool = True,
+) -> None:
+    # confirm adds the deltas to the confirmed balance, pending adds them to
+    # the pending one, both together move them from pending to confirmed
+    deltas = {address_id: delta for address_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    stmt = select(BalanceModel.address_id).where(
+        BalanceModel.address_id.in_(deltas.keys())
+    )
+    existing = set(await session.scalars(stmt))
+    for address_id in deltas.keys() - existing:
+        session.add(BalanceModel(address_id=address_id, confirmed=0, pending=0))
+    await session.flush()
+    table = BalanceModel.__table__
+    delta = bindparam("delta")
+    values = {}
+    if confirm:
+        values["confirmed"] = table.c.confirmed + delta
+        if pending:
+            values["pending"] = table.c.pending - delta
+    elif pending:
+        values["pending"] = table.c.pending + delta
+    # One executemany instead of a statement per address
+    stmt = (
+        update(table)
+        .where(table.c.address_id == bindparam("b_address_id"))
+        .values(**values)
+    )
+    connection = await session.connection()
+    await connection.execute(
+        stmt,
+        [
+            {"b_address_id": address_id, "delta": delta}
+            for address_id, delta in deltas.items()
+        ],
+    )
+
+
+async def has_balances(session: AsyncSession) -> bool:
+    return await session.scalar(select(BalanceModel.id).limit(1)) is not None
+
+
+async def rebuild_balances(
+    session: AsyncSession, base: dict[int, int] | None = None, after_block_id: int = 0
+) -> int:
+    # base holds confirmed balances up to and including block after_block_id,
+    # only the transactions of later blocks and open ones are summed
+    base = base or {}
+    await session.execute(delete(BalanceModel))
+    balances = {
+        address_id: {"confirmed": base.get(address_id, 0), "pending": 0}
+        for address_id in await session.scalars(select(AddressModel.id))
+    }
+    confirmed = TransactionModel.block_id.is_not(None)
+    columns = (
+        (TransactionModel.toAddr_id, TransactionModel.value),
+        (
+            TransactionModel.fromAddr_id,
+            -TransactionModel.value - TransactionModel.fee,
+        ),
+    )
+    for address_column, delta in columns:
+        stmt = (
+            select(address_column, confirmed, func.sum(delta))
+            .where(
+                address_column.is_not(None),
+                or_(
+                    TransactionModel.block_id.is_(None),
+                    TransactionModel.block_id > after_block_id,
+                ),
+            )
+            .group_by(address_column, confirmed)
+        )
+        for address_id, is_confirmed, total in await session.execute(stmt):
+            key = "confirmed" if is_confirmed else "pending"
+            balances[address_id][key] += total
+    session.add_all(
+        BalanceModel(address_id=address_id, **balance)
+        for address_id, balance in balances.items()
+    )
+    await session.commit()
+    return len(balances)
+
+
 async def get_address(session: AsyncSession, address: str) -> AddressModel | None:
     stmt = select(AddressModel).where(AddressModel.address == address)
     return await session.scalar(stmt)
 
 
+async def get_or_create_addresses(
+    session: AsyncSession, addresses: set[str]
+) -> dict[str, int]:
+    # Addresses of other nodes have no private key here. Runs inside the
+    # caller's transaction.
+    stmt = select(AddressModel.address, AddressModel.id).where(
+        AddressModel.address.in_(addresses)
+    )
+    ret = dict((await session.execute(stmt)).all())
+    missing = [
+        AddressModel(address=address, ckey="") for address in addresses - ret.keys()
+    ]
+    if missing:
+        session.add_all(missing)
+        await session.flush()
+        session.add_all(
+            BalanceModel(address_id=address.id, confirmed=0, pending=0)
+            for address in missing
+        )
+        await session.flush()
+        ret.update((address.address, address.id) for address in missing)
+    return ret
+
+
 async def get_address_by_id(
     session: AsyncSession, address_id: int
 ) -> AddressModel | None:
     return await session.get(AddressModel, address_id)
 
 
-async def get_all_addresses(session: AsyncSession) -> list[AddressModel]:
-    stmt = select(AddressModel)
-    return list((await session.execute(stmt)).scalars().all())
-
-
-async def get_all_transactions(session: AsyncSession) -> list[TransactionModel]:
-    stmt = select(TransactionModel)
-    stmt_result = list(await session.scalars(stmt))
-    result = []
-    for tr in stmt_result:
-        if tr.fromAddr is None:
-            fromaddr = None
-        else:
-            address = await get_address_by_id(session, tr.fromAddr)
-            fromaddr = AddressModel(id=address.id, address=address.address)
-        if tr.toAddr is None:
-            toaddr = None
-        else:
-            address = await get_address_by_id(session, tr.toAddr)
-            toaddr = AddressModel(id=address.id, address=address.address)
-        tr_schema = tr
-        tr_schema.fromAddr = fromaddr
-        tr_schema.toAddr = toaddr
-        result.append(tr_schema)
-    return result
+async def get_addresses_by_ids(
+    session: AsyncSession, address_ids: set[int]
+) -> dict[int, AddressModel]:
+    stmt = select(AddressModel).where(AddressModel.id.in_(address_ids))
+    return {address.id: address for address in await session.scalars(stmt)}
+
+
+async def get_all_addresses(
+    session: AsyncSession, after: int = 0, limit: int | None = None
+) -> list[AddressModel]:
+    return await get_page(session, AddressModel, after, limit)
+
+
+async def get_all_transactions(
+    session: AsyncSession, after: int = 0, limit: int | None = None
+) -> list[TransactionModel]:
+    return await get_page(session, TransactionModel, after, limit)
 
 
 async def get_transaction_by_id(
@@ -108,115 +452,223 @@ async def get_transaction_by_id(
     return result
 
 
-async def get_balance_by_address_id(session: AsyncSession, address_id: int) -> float:
-    address = (await get_address_by_id(session, address_id)).id
-    stmt1 = select(TransactionModel.value).where(TransactionModel.toAddr == address)
-    stmt2 = select(TransactionModel.value).where(TransactionModel.fromAddr == address)
-    incoming_list = list((await session.execute(stmt1)).scalars().all())
-    outgoing_list = list((await session.execute(stmt2)).scalars().all())
-    return sum(incoming_list) - sum(outgoing_list)
+async def get_transactions_by_signatures(
+    session: AsyncSession, signatures: list[str]
+) -> dict[str, tuple[int, int | None]]:
+    # signature -> (id, block_id)
+    stmt = select(
+        TransactionModel.signature, TransactionModel.id, TransactionModel.block_id
+    ).where(TransactionModel.signature.in_(signatures))
+    return {
+        signature: (id, block_id)
+        for signature, id, block_id in await session.execute(stmt)
+    }
 
 
-async def get_open_transaction_by_fee(
-    session: AsyncSession, limit: int
-) -> list[TransactionModel]:
+async def get_balance_by_address_id(
+    session: AsyncSession, address_id: int
+) -> tuple[AddressModel, BalanceModel | None] | None:
     stmt = (
-        select(TransactionModel)
-        .where(TransactionModel.block_id.is_(None))
-        .order_by(TransactionModel.fee)
-        .limit(limit)
+        select(AddressModel, BalanceModel)
+        .outerjoin(BalanceModel, BalanceModel.address_id == AddressModel.id)
+        .where(AddressModel.id == address_id)
     )
-    result = list(await session.scalars(stmt))
-    return result
+    return (await session.execute(stmt)).first()
 
 
-async def get_blocks(session: AsyncSession) -> list[Block]:
-    stmt = select(Block).order_by(Block.id)
-    stmt_result: Result = await session.execute(stmt)
-    blocks = stmt_result.scalars().all()
-    blocks_result = list(blocks)
-    result = []
-    for block in blocks_result:
-        tr_list = []
-        for tr in block.transactionList:
-            if tr.fromAddr is None:
-                fromaddr = None
-            else:
-                address = await get_address_by_id(
-                    session=session, address_id=tr.fromAddr
-                )
-                fromaddr = AddressModel(id=address.id, address=address.address)
-            if tr.toAddr is None:
-                toaddr = None
-            else:
-                address = await get_address_by_id(session=session, address_id=tr.toAddr)
-                toaddr = AddressModel(id=address.id, address=address.address)
-            tr_schema = tr
-            tr_schema.fromAddr = fromaddr
-            tr_schema.toAddr = toaddr
-            tr_list.append(tr_schema)
-        block_schema = block
-        block_schema.transactionList = tr_list
-        result.append(block_schema)
-    return result
+async def get_blocks(
+    session: AsyncSession, after: int = 0, limit: int | None = None
+) -> list[Block]:
+    return await get_page(session, Block, after, limit)
+
+
+async def get_page(
+    session: AsyncSession, model: type, after: int = 0, limit: int | None = None
+) -> list:
+    # Keyset pagination, the id index makes every page as cheap as the first
+    stmt = select(model).where(model.id > after).order_by(model.id).limit(limit)
+    return list(await session.scalars(stmt))
+
+
+async def stream_rows(
+    session_factory: async_sessionmaker, model: type, after: int, chunk_size: int
+):
+    # Each chunk gets a fresh session so the identity map never grows
+    while True:
+        async with session_factory() as session:
+            rows = await get_page(session, model, after, chunk_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        after = rows[-1].id
+
+
+async def get_last_block_hash(session: AsyncSession) -> str | None:
+    tip = await get_chain_tip(session)
+    return tip.hash if tip is not None else None
 
 
 async def get_chain_length(session: AsyncSession) -> int:
-    stmt = select(Block)
-    return len((await session.execute(stmt)).scalars().all())
+    tip = await get_chain_tip(session)
+    return tip.length if tip is not None else 0
+
+
+async def get_chain_tip(session: AsyncSession) -> ChainTipSchema | None:
+    tip = chain_tip_cache.get()
+    if tip is None:
+        row = await session.scalar(select(ChainTipModel))
+        if row is not None:
+            tip = ChainTipSchema.model_validate(row, from_attributes=True)
+            chain_tip_cache.set(tip)
+    return tip
+
+
+async def advance_chain_tip(session: AsyncSession, block: Block) -> ChainTipSchema:
+    # Runs inside the block's transaction, the caller commits and caches
+    row = await session.scalar(select(ChainTipModel).with_for_update())
+    if row is None:
+        row = ChainTipModel(height=-1, length=0, work=f"{0:064x}")
+        session.add(row)
+    row.block_id = block.id
+    row.hash = block.hash
+    row.height = block.height
+    row.length += 1
+    row.work = f"{int(row.work, 16) + Constants.Work():064x}"
+    await session.flush()
+    return ChainTipSchema.model_validate(row, from_attributes=True)
+
+
+async def retreat_chain_tip(session: AsyncSession, parent) -> ChainTipSchema | None:
+    # The opposite of advance_chain_tip, parent has the id and hash of the
+    # new tip block or is None when the chain becomes empty
+    row = await session.scalar(select(ChainTipModel).with_for_update())
+    if parent is None:
+        await session.delete(row)
+        await session.flush()
+        return None
+    row.block_id = parent.id
+    row.hash = parent.hash
+    row.height -= 1
+    row.length -= 1
+    row.work = f"{int(row.work, 16) - Constants.Work():064x}"
+    await session.flush()
+    return ChainTipSchema.model_validate(row, from_attributes=True)
+
+
+async def get_blocks_after(session: AsyncSession, height: int) -> list[tuple[int, str]]:
+    # (id, prevHash) of the blocks above height, newest first
+    stmt = (
+        select(Block.id, Block.prevHash)
+        .where(Block.height > height)
+        .order_by(Block.height.desc())
+    )
+    return list((await session.execute(stmt)).all())
+
+
+async def reset_chain_tip(
+    session: AsyncSession, base: ChainTipSchema | None = None
+) -> ChainTipSchema | None:
+    # Recomputes the record from the block rows, used after deletes and for
+    # databases created before the record existed. base is an earlier record
+    # whose block is still in the chain, the blocks after it are added to it.
+    row = await session.scalar(select(ChainTipModel).with_for_update())
+    last = await session.scalar(select(Block).order_by(Block.height.desc()).limit(1))
+    if last is None:
+        if row is not None:
+            await session.delete(row)
+        return None
+    if row is None:
+        row = ChainTipModel()
+        session.add(row)
+    row.block_id = last.id
+    row.hash = last.hash
+    row.height = last.height
+    if base is None:
+        row.length = await session.scalar(select(func.count(Block.id)))
+        row.work = f"{row.length * Constants.Work():064x}"
+    else:
+        later = last.height - base.height
+        row.length = base.length + later
+        row.work = f"{int(base.work, 16) + later * Constants.Work():064x}"
+    await session.flush()
+    return ChainTipSchema.model_validate(row, from_attributes=True)
+
+
+async def rebuild_chain_tip(
+    session: AsyncSession, base: ChainTipSchema | None = None
+) -> ChainTipSchema | None:
+    tip = await reset_chain_tip(session, base)
+    await session.commit()
+    chain_tip_cache.set(tip)
+    block_cache.clear()
+    return tip
 
 
 async def get_block_by_id(session: AsyncSession, block_id: int) -> Block | None:
-    stmt = select(Block).where(Block.id == block_id)
-    block = (await session.execute(stmt)).scalar()
+    block = await session.get(Block, block_id)
     if block is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No block with id {block_id} found!",
         )
-    tr_list = []
-    for tr in block.transactionList:
-        if tr.fromAddr is None:
-            fromaddr = None
-        else:
-            address = await get_address(session, tr.fromAddr)
-            fromaddr = AddressModel(id=address.id, address=address.address)
-        if tr.toAddr is None:
-            toaddr = None
-        else:
-            address = await get_address(session, tr.toAddr)
-            toaddr = AddressModel(id=address.id, address=address.address)
-        tr_schema = tr
-        tr_schema.fromAddr = fromaddr
-        tr_schema.toAddr = toaddr
-        tr_list.append(tr_schema)
-    block_schema = block
-    block_schema.transactionList = tr_list
-    return block_schema
+    return block
+
+
+async def get_block_by_hash(session: AsyncSession, block_hash: str) -> Block | None:
+    stmt = select(Block).where(Block.hash == block_hash)
+    return await session.scalar(stmt)
 
 
 async def get_last_block(session: AsyncSession) -> Block | None:
-    stmt = select(Block).order_by(Block.id.desc()).limit(1)
-    block = (await session.execute(stmt)).scalar()
-    temp_list = []
-    for tr in block.transactionList:
-        if tr.fromAddr is None:
-            fromaddr = None
-        else:
-            address = await get_address_by_id(session, tr.fromAddr)
-            fromaddr = AddressModel(id=address.id, address=address.address)
-        if tr.toAddr is None:
-            toaddr = None
-        else:
-            address = await get_address_by_id(session, tr.toAddr)
-            toaddr = AddressModel(id=address.id, address=address.address)
-        tr_schema = tr
-        tr_schema.fromAddr = fromaddr
-        tr_schema.toAddr = toaddr
-        temp_list.append(tr_schema)
-    dump = block
-    dump.transactionList = temp_list
-    return dump
+    tip = await get_chain_tip(session)
+    return await session.get(Block, tip.block_id) if tip is not None else None
+
+
+async def get_locator(session: AsyncSession) -> list[str]:
+    # Hashes of the tip and then exponentially further back down to genesis,
+    # a peer finds the fork point from the first one it knows
+    tip = await get_chain_tip(session)
+    if tip is None:
+        return []
+    heights = []
+    height, step = tip.height, 1
+    while height > 0:
+        heights.append(height)
+        if len(heights) >= 10:
+            step *= 2
+        height -= step
+    heights.append(0)
+    stmt = (
+        select(Block.hash)
+        .where(Block.height.in_(heights))
+        .order_by(Block.height.desc())
+    )
+    return list(await session.scalars(stmt))
+
+
+async def get_headers(
+    session: AsyncSession, locator: list[str], limit: int
+) -> list[tuple[int, str, str]]:
+    # (height, hash, prevHash) of the blocks after the last locator hash known
+    # here, from genesis if none is
+    stmt = select(func.max(Block.height)).where(Block.hash.in_(locator))
+    after = await session.scalar(stmt) if locator else None
+    stmt = (
+        select(Block.height, Block.hash, Block.prevHash)
+        .where(Block.height > (-1 if after is None else after))
+        .order_by(Block.height)
+        .limit(limit)
+    )
+    return list((await session.execute(stmt)).all())
+
+
+async def get_block_bodies(
+    session: AsyncSession, hashes: list[str]
+) -> list[tuple[str, str]]:
+    stmt = select(Block.hash, Block.datastring).where(Block.hash.in_(hashes))
+    found = dict((await session.execute(stmt)).all())
+    return [(hash, found[hash]) for hash in hashes if hash in found]
 
 
 async def update_transaction(
@@ -225,21 +677,34 @@ async def update_transaction(
     transaction_update: TransactionUpdate | TransactionUpdatePartial,
     partial: bool = False,
 ) -> TransactionModel:
+    confirmed = transaction.block_id is not None
+    deltas = await get_balance_deltas(session, [transaction.id])
+    await update_balances(
+        session=session,
+        deltas={address_id: -delta for address_id, delta in deltas.items()},
+        confirm=confirmed,
+        pending=not confirmed,
+    )
     for name, value in transaction_update.model_dump(exclude_unset=partial).items():
+        if name in ("fromAddr", "toAddr"):
+            name = f"{name}_id"
+            if isinstance(value, dict):
+                value = value["id"]
         setattr(transaction, name, value)
+    await session.flush()
+    await update_balances(
+        session=session,
+        deltas=await get_balance_deltas(session, [transaction.id]),
+        confirm=confirmed,
+        pending=not confirmed,
+    )
     await session.commit()
+    await session.refresh(transaction, ["fromAddr", "toAddr"])
+    mempool.discard_ids([transaction.id])
+    add_to_mempool(transaction)
     return transaction
 
 
-async def update_transaction_parent(
-    session: AsyncSession, transaction_id: int, inp_block_id: int
-) -> TransactionModel:
-    tr = await get_transaction_by_id(session=session, transaction_id=transaction_id)
-    setattr(tr, "block_id", inp_block_id)
-    await session.commit()
-    return tr
-
-
 async def update_block(
     session: AsyncSession,
     block: Block,
@@ -253,5 +718,33 @@ async def update_block(
 
 
 async def delete_block_by_id(session: AsyncSession, block: Block) -> None:
+    # Like disconnect_block, rewards are deleted and the other transactions
+    # become pending again
+    rewards = [tr for tr in block.transactionList if tr.ttype in REWARD_TYPES]
+    transactions = [tr for tr in block.transactionList if tr not in rewards]
+    reward_deltas = await get_balance_deltas(session, [tr.id for tr in rewards])
+    deltas = await get_balance_deltas(session, [tr.id for tr in transactions])
+    await session.execute(
+        delete(BlockUndoModel).where(BlockUndoModel.block_id == block.id)
+    )
+    for tr in rewards:
+        await session.delete(tr)
     await session.delete(block)
+    await update_balances(
+        session=session,
+        deltas={address_id: -delta for address_id, delta in reward_deltas.items()},
+        confirm=True,
+        pending=False,
+    )
+    await update_balances(
+        session=session,
+        deltas={address_id: -delta for address_id, delta in deltas.items()},
+        confirm=True,
+    )
+    await session.flush()
+    tip = await reset_chain_tip(session)
     await session.commit()
+    chain_tip_cache.set(tip)
+    block_cache.discard(block.id)
+    for tr in transactions:
+        add_to_mempool(tr)
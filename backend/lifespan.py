@@ -2,7 +2,14 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, status
 import backend.crud as crud
-from backend.core.models import Base, db_helper
+from backend.core.config import settings
+from backend.core.models import db_helper
+from backend.migrations import migrate
+from backend.mining import mining_jobs
+from backend.relay import block_relay
+from backend.snapshot import state_snapshots
+from backend.sync import chain_sync
+from backend.workers import batch_pool
 from backend.schemas import (
     Address as AddressSchema,
     AddressCreate,
@@ -16,66 +23,82 @@ from ellipticcurve import PrivateKey
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with db_helper.engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await migrate(db_helper.engine)
+    batch_pool.start()
+    await state_snapshots.recover(
+        db_helper.session_factory, settings.startup_audit, settings.audit_chunk_size
+    )
+    chain_sync.open()
+    mining_jobs.mined_callbacks.append(block_relay.announce_later)
 
-    session = db_helper.get_scoped_session()
-    blocks = await crud.get_blocks(session)
+    async with db_helper.session_factory() as session:
+        await crud.load_mempool(session)
+        if await crud.get_last_block(session) is None:
+            ckey1 = PrivateKey()
+            pkey1 = ckey1.publicKey()
+            ckey2 = PrivateKey()
+            pkey2 = ckey2.publicKey()
+            addr1 = AddressClass(pkey=pkey1)
+            addr2 = AddressClass(pkey=pkey2)
+            address1 = AddressCreate(address=addr1.address, ckey=ckey1.toString())
+            await crud.create_address(session=session, address_inp=address1)
+            address2 = AddressCreate(address=addr2.address, ckey=ckey2.toString())
+            await crud.create_address(session=session, address_inp=address2)
 
-    if len(blocks) == 0:
-        ckey1 = PrivateKey()
-        pkey1 = ckey1.publicKey()
-        ckey2 = PrivateKey()
-        pkey2 = ckey2.publicKey()
-        addr1 = AddressClass(pkey=pkey1)
-        addr2 = AddressClass(pkey=pkey2)
-        address1 = AddressCreate(address=addr1.address, ckey=ckey1.toString())
-        await crud.create_address(session=session, address_inp=address1)
-        address2 = AddressCreate(address=addr2.address, ckey=ckey2.toString())
-        await crud.create_address(session=session, address_inp=address2)
+        if await crud.get_last_block(session) is None and settings.peers:
+            # A new node joins the chain of its peers instead of starting one
+            await chain_sync.sync()
+        if await crud.get_last_block(session) is None:
+            init_block: Block = Block.createInit(ckey1)
 
-        init_block: Block = Block.createInit(ckey1)
+            tr: list[Transaction] = [
+                init_block.getTransaction(i)
+                for i in range(init_block.getTransactionListLen())
+            ]
+            created_tr = []
+            for tr_cur in tr:
+                temp_dict = tr_cur.data.copy()
+                temp_dict["ttype"] = temp_dict["ttype"].value
+                if temp_dict["fromAddr"] is not None:
+                    address_obj = await crud.get_address(
+                        session, temp_dict["fromAddr"].address
+                    )
 
-        tr: list[Transaction] = [
-            init_block.getTransaction(i)
-            for i in range(init_block.getTransactionListLen())
-        ]
-        created_tr = []
-        for tr_cur in tr:
-            temp_dict = tr_cur.data.copy()
-            temp_dict["ttype"] = temp_dict["ttype"].value
-            if temp_dict["fromAddr"] is not None:
-                address_obj = await crud.get_address(
-                    session, temp_dict["fromAddr"].address
-                )
+                    temp_dict["fromAddr"] = address_obj.id
+                else:
+                    temp_dict["fromAddr"] = None
+                if temp_dict["toAddr"] is not None:
+                    address_obj = await crud.get_address(
+                        session, temp_dict["toAddr"].address
+                    )
 
-                temp_dict["fromAddr"] = address_obj.id
-            else:
-                temp_dict["fromAddr"] = None
-            if temp_dict["toAddr"] is not None:
-                address_obj = await crud.get_address(
-                    session, temp_dict["toAddr"].address
+                    temp_dict["toAddr"] = address_obj.id
+                else:
+                    temp_dict["toAddr"] = None
+                temp_dict["ttimestamp"] = temp_dict.pop("timestamp")
+                temp_dict["block_id"] = None
+                temp_dict["data"] = tr_cur.datastring
+                temp_dict["signature"] = tr_cur.signature
+                tr_to_create = TransactionCreate(**temp_dict)
+                db_response = await crud.create_transaction(
+                    session=session, transaction_inp=tr_to_create
                 )
-
-                temp_dict["toAddr"] = address_obj.id
-            else:
-                temp_dict["toAddr"] = None
-            temp_dict["ttimestamp"] = temp_dict.pop("timestamp")
-            temp_dict["block_id"] = None
-            temp_dict["data"] = tr_cur.datastring
-            temp_dict["signature"] = tr_cur.signature
-            tr_to_create = TransactionCreate(**temp_dict)
-            db_response = await crud.create_transaction(
-                session=session, transaction_inp=tr_to_create
-            )
-            created_tr.append(db_response)
-        block_dict: dict = init_block.data.copy()
-        block_dict.pop("id")
-        block_dict["hash"] = init_block.hash
-        block_dict["datastring"] = init_block.datastring
-        block_dict["transactionList"] = [tr.id for tr in created_tr]
-        block_to_create = BlockCreate(**block_dict)
-        await crud.create_block(session=session, block_inp=block_to_create)
-    await session.close()
+                created_tr.append(db_response)
+            block_dict: dict = init_block.data.copy()
+            block_dict.pop("id")
+            block_dict["hash"] = init_block.hash
+            block_dict["datastring"] = init_block.datastring
+            block_dict["transactionList"] = [tr.id for tr in created_tr]
+            block_to_create = BlockCreate(**block_dict)
+            await crud.create_block(session=session, block_inp=block_to_create)
+    state_snapshots.start(db_helper.session_factory)
 
     yield
+
+    await mining_jobs.shutdown()
+    await state_snapshots.stop(db_helper.session_factory)
+    mining_jobs.mined_callbacks.remove(block_relay.announce_later)
+    await block_relay.shutdown()
+    await chain_sync.close()
+    await batch_pool.shutdown()
+    await db_helper.engine.dispose()
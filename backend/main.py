@@ -4,8 +4,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import crud
 from backend.core.models import Base, db_helper
-from backend.views import address_router, block_router, chain_router, transaction_router
+from backend.core.config import settings
+from backend.views import (
+    address_router,
+    block_router,
+    chain_router,
+    transaction_router,
+    admin_router,
+    mempool_router,
+    metrics_router,
+)
 from backend.lifespan import lifespan
+from backend.pagination import NEXT_CURSOR_HEADER
+from backend.metrics import RouteContext, install as install_metrics
 import argparse
 
 app = FastAPI(lifespan=lifespan)
@@ -13,6 +24,9 @@ app.include_router(address_router)
 app.include_router(transaction_router)
 app.include_router(block_router)
 app.include_router(chain_router)
+app.include_router(admin_router)
+app.include_router(mempool_router)
+app.include_router(metrics_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,7 +37,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(RouteContext)
+install_metrics(db_helper, sql=settings.sql_metrics)
 
 
 @app.get("/")
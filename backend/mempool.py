@@ -0,0 +1,156 @@
+import hashlib
+import heapq
+
+from backend.core.config import settings
+from backend.src.bchain import TTypes
+
+REWARD_TYPES = (TTypes.creationReward.value, TTypes.fee.value)
+
+
+class MempoolEntry:
+    __slots__ = ["id", "txid", "fee", "data", "signature", "seq"]
+
+    def __init__(self, id: int, fee: int, data: str, signature: str) -> None:
+        self.id = id
+        self.txid = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        self.fee = fee
+        self.data = data
+        self.signature = signature
+        self.seq = 0
+
+    @classmethod
+    def fromModel(cls, tr) -> "MempoolEntry":
+        return cls(tr.id, tr.fee, tr.data, tr.signature)
+
+
+class Mempool:
+    # Blocks are limited by transaction count, so the fee of a transaction is
+    # its fee rate. Both heaps are lazy, entries removed from _entries are
+    # skipped when they surface.
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.evicted = 0
+        self.rejected = 0
+        self._entries: dict[str, MempoolEntry] = {}
+        self._ids: dict[int, str] = {}
+        self._best: list[tuple] = []
+        self._worst: list[tuple] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._entries
+
+    def has_id(self, id: int) -> bool:
+        return id in self._ids
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def _live(self, item: tuple) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry.seq == abs(item[1])
+
+    def _lowest(self) -> MempoolEntry | None:
+        while self._worst and not self._live(self._worst[0]):
+            heapq.heappop(self._worst)
+        return self._entries[self._worst[0][2]] if self._worst else None
+
+    def accepts(self, fee: int) -> bool:
+        if len(self._entries) < self.maxsize:
+            return True
+        lowest = self._lowest()
+        return lowest is None or fee > lowest.fee
+
+    def add(self, entry: MempoolEntry) -> bool:
+        if entry.txid in self._entries:
+            return False
+        if not self.accepts(entry.fee):
+            self.rejected += 1
+            return False
+        self._seq += 1
+        entry.seq = self._seq
+        self._entries[entry.txid] = entry
+        self._ids[entry.id] = entry.txid
+        # Equal fees keep arrival order in both directions
+        heapq.heappush(self._best, (-entry.fee, entry.seq, entry.txid))
+        heapq.heappush(self._worst, (entry.fee, -entry.seq, entry.txid))
+        while len(self._entries) > self.maxsize:
+            self.discard(self._lowest().txid)
+            self.evicted += 1
+        self._compact()
+        return True
+
+    def discard(self, txid: str) -> MempoolEntry | None:
+        entry = self._entries.pop(txid, None)
+        if entry is not None:
+            self._ids.pop(entry.id, None)
+        return entry
+
+    def discard_ids(self, ids: list[int]) -> None:
+        for id in ids:
+            txid = self._ids.get(id)
+            if txid is not None:
+                self.discard(txid)
+
+    def select(self, limit: int) -> list[MempoolEntry]:
+        # Pops the best entries and pushes them back, O(k log n)
+        ret = []
+        popped = []
+        while self._best and len(ret) < limit:
+            item = heapq.heappop(self._best)
+            if self._live(item):
+                ret.append(self._entries[item[2]])
+                popped.append(item)
+        for item in popped:
+            heapq.heappush(self._best, item)
+        return ret
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._ids.clear()
+        self._best.clear()
+        self._worst.clear()
+        self.evicted = 0
+        self.rejected = 0
+
+    def _compact(self) -> None:
+        # Lazy deletion leaves dead items behind, rebuild once they dominate
+        if len(self._best) > 2 * len(self._entries) + 64:
+            self._best = [item for item in self._best if self._live(item)]
+            heapq.heapify(self._best)
+        if len(self._worst) > 2 * len(self._entries) + 64:
+            self._worst = [item for item in self._worst if self._live(item)]
+            heapq.heapify(self._worst)
+
+    def stats(self) -> dict:
+        fees = [entry.fee for entry in self._entries.values()]
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "bytes": sum(len(entry.data) for entry in self._entries.values()),
+            "total_fee": sum(fees),
+            "min_fee": min(fees, default=None),
+            "max_fee": max(fees, default=None),
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+        }
+
+    def histogram(self) -> list[dict]:
+        # Power of two buckets: 0, 1, 2-3, 4-7, ...
+        counts = {}
+        for entry in self._entries.values():
+            bucket = entry.fee.bit_length()
+            counts[bucket] = counts.get(bucket, 0) + 1
+        ret = []
+        for bucket in sorted(counts):
+            low = 0 if bucket == 0 else 1 << (bucket - 1)
+            high = 0 if bucket == 0 else (1 << bucket) - 1
+            ret.append({"min_fee": low, "max_fee": high, "count": counts[bucket]})
+        return ret
+
+
+mempool = Mempool(settings.mempool_size)
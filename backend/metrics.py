@@ -0,0 +1,314 @@
+import bisect
+import math
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from backend.cache import chain_tip_cache
+from backend.core.models import DatabaseHelper, db_helper
+from backend.mempool import mempool
+from backend.src.bchain import Block, Transaction
+from backend.workers import WorkerPool
+
+# Starlette appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# The ASGI scope of the request being served, the router adds its route
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    # Values are keyed by a tuple of label values. A metric created with `fn`
+    # has no state of its own and reads its samples when rendered, fn returns
+    # a value, a {label values: value} dict or None for no sample.
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        self.values: dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def samples(self) -> dict[tuple, float]:
+        if self.fn is None:
+            with self.lock:
+                return dict(self.values)
+        ret = self.fn()
+        if ret is None:
+            return {}
+        return ret if isinstance(ret, dict) else {(): ret}
+
+    def render(self) -> list[str]:
+        ret = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, value in sorted(self.samples().items()):
+            labels = format_labels(self.labels, values)
+            ret.append(f"{self.name}{labels} {format_value(value)}")
+        return ret
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    # Bucket counts are kept per bucket and summed up when rendered
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: tuple, labels: tuple = ()
+    ) -> None:
+        super().__init__(name, help, labels)
+        if list(buckets) != sorted(buckets):
+            raise ValueError("Histogram buckets must be sorted")
+        self.buckets = tuple(buckets) + (math.inf,)
+        # Label values -> [bucket counts, sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * len(self.buckets), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> list[str]:
+        ret = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            values = {labels: (list(c), s) for labels, (c, s) in self.values.items()}
+        names = self.labels + ("le",)
+        for labels, (counts, total) in sorted(values.items()):
+            count = 0
+            for bound, num in zip(self.buckets, counts):
+                count += num
+                le = format_labels(names, labels + (format_value(bound),))
+                ret.append(f"{self.name}_bucket{le} {count}")
+            labels = format_labels(self.labels, labels)
+            ret.append(f"{self.name}_sum{labels} {format_value(total)}")
+            ret.append(f"{self.name}_count{labels} {count}")
+        return ret
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RouteContext:
+    # Plain ASGI middleware, it only makes the request scope visible to the
+    # query listeners
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+def current_route() -> str:
+    # Queries of background tasks and unrouted requests share one label
+    scope = current_scope.get()
+    route = None if scope is None else scope.get("route")
+    return "none" if route is None else route.path
+
+
+def chain_height() -> int | None:
+    # The endpoint loads the tip into the cache before rendering
+    tip = chain_tip_cache.get()
+    return None if tip is None else tip.height
+
+
+registry = Registry()
+
+nonce_attempts = registry.register(
+    Histogram(
+        "bchain_nonce_attempts",
+        "Nonces tried to solve a block",
+        buckets=(256, 1024, 4096, 16384, 65536, 262144),
+    )
+)
+mining_seconds = registry.register(
+    Counter("bchain_mining_seconds_total", "Time spent solving blocks")
+)
+hash_rate = registry.register(
+    Gauge("bchain_hash_rate", "Nonces per second of the last solved block")
+)
+verify_seconds = registry.register(
+    Histogram(
+        "bchain_signature_verify_seconds",
+        "In-process validation time of transactions that weren't verified before",
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+    )
+)
+batch_seconds = registry.register(
+    Histogram(
+        "bchain_batch_seconds",
+        "Wall time of signing and verification batches, including worker pools",
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+        labels=("batch",),
+    )
+)
+registry.register(
+    Counter(
+        "bchain_signature_cache_hits_total",
+        "Validations answered by the verified-signature cache",
+        fn=lambda: Transaction.verified.hits,
+    )
+)
+query_seconds = registry.register(
+    Histogram(
+        "bchain_sql_query_seconds",
+        "SQL statement latency, _count is the number of statements",
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5),
+        labels=("route",),
+    )
+)
+registry.register(
+    Gauge(
+        "bchain_mempool_transactions",
+        "Transactions waiting in the mempool",
+        fn=lambda: len(mempool),
+    )
+)
+
+
+def pool_samples() -> dict:
+    stats = db_helper.stats()
+    names = ("size", "checked_in", "checked_out", "overflow")
+    ret = {(name,): stats[name] for name in names if name in stats}
+    if ("overflow",) in ret:
+        # QueuePool counts connections it hasn't opened yet as negative
+        ret[("overflow",)] = max(ret[("overflow",)], 0)
+    return ret
+
+
+registry.register(
+    Gauge(
+        "bchain_db_pool_connections",
+        "Connections of the session pool",
+        labels=("state",),
+        fn=pool_samples,
+    )
+)
+registry.register(
+    Gauge(
+        "bchain_db_sessions_open",
+        "Request sessions currently open",
+        fn=lambda: db_helper.sessions_open,
+    )
+)
+registry.register(
+    Counter(
+        "bchain_db_pool_checkouts_total",
+        "Connections handed out by the pool",
+        fn=lambda: db_helper.counters["checkouts"],
+    )
+)
+registry.register(
+    Gauge(
+        "bchain_chain_height",
+        "Height of the chain tip",
+        fn=chain_height,
+    )
+)
+
+
+def on_solve(attempts: int, seconds: float) -> None:
+    nonce_attempts.observe(attempts)
+    mining_seconds.inc(seconds)
+    if seconds > 0:
+        hash_rate.set(attempts / seconds)
+
+
+def on_verify(seconds: float) -> None:
+    verify_seconds.observe(seconds)
+
+
+def on_batch(name: str, seconds: float) -> None:
+    batch_seconds.observe(seconds, (name,))
+
+
+def before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    query_seconds.observe(seconds, (current_route(),))
+
+
+def on_error(context) -> None:
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def install(helper: DatabaseHelper, sql: bool = True) -> None:
+    # Transaction hooks only run in this process, batches handed to worker
+    # processes are timed as a whole by the pool
+    Block.onSolve = on_solve
+    Transaction.onVerify = on_verify
+    WorkerPool.on_run = on_batch
+    if not sql:
+        # Any cursor listener puts every statement on SQLAlchemy's slower
+        # event path
+        return
+    event.listen(helper.engine.sync_engine, "before_cursor_execute", before_execute)
+    event.listen(helper.engine.sync_engine, "after_cursor_execute", after_execute)
+    event.listen(helper.engine.sync_engine, "handle_error", on_error)
@@ -0,0 +1,71 @@
+import importlib
+import pkgutil
+
+from sqlalchemy import Connection, Column, Integer, MetaData, Table, inspect, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Every module named vNNNN_<name> in this package is one revision with
+# upgrade(conn) and downgrade(conn) running on a synchronous connection
+
+version_table = Table(
+    "schema_version", MetaData(), Column("version", Integer, nullable=False)
+)
+
+
+def revisions() -> dict:
+    ret = {}
+    for module in pkgutil.iter_modules(__path__):
+        if module.name.startswith("v"):
+            ret[int(module.name[1:5])] = importlib.import_module(
+                f"{__name__}.{module.name}"
+            )
+    return dict(sorted(ret.items()))
+
+
+def head() -> int:
+    return max(revisions())
+
+
+def current(conn: Connection) -> int:
+    if not inspect(conn).has_table(version_table.name):
+        return 0
+    return conn.scalar(select(version_table.c.version)) or 0
+
+
+def _stamp(conn: Connection, version: int) -> None:
+    version_table.create(conn, checkfirst=True)
+    conn.execute(version_table.delete())
+    conn.execute(version_table.insert().values(version=version))
+
+
+def upgrade(conn: Connection, target: int | None = None) -> list[int]:
+    target = head() if target is None else target
+    version = current(conn)
+    applied = []
+    for revision, module in revisions().items():
+        if version < revision <= target:
+            module.upgrade(conn)
+            _stamp(conn, revision)
+            applied.append(revision)
+    return applied
+
+
+def downgrade(conn: Connection, target: int) -> list[int]:
+    version = current(conn)
+    applied = []
+    for revision, module in reversed(revisions().items()):
+        if target < revision <= version:
+            module.downgrade(conn)
+            _stamp(conn, revision - 1)
+            applied.append(revision)
+    return applied
+
+
+async def migrate(engine: AsyncEngine, target: int | None = None) -> list[int]:
+    # SQLite and Postgres both have transactional DDL, a failed step leaves
+    # the schema at the version it started from
+    target = head() if target is None else target
+    async with engine.begin() as conn:
+        if target < await conn.run_sync(current):
+            return await conn.run_sync(downgrade, target)
+        return await conn.run_sync(upgrade, target)
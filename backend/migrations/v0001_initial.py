@@ -0,0 +1,86 @@
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+)
+
+# Snapshot of the schema before migrations existed. Databases created by
+# the old create_all at startup may miss some of these tables, checkfirst
+# adds just those.
+
+metadata = MetaData()
+
+Table(
+    "address_table",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("address", String(42), nullable=False),
+    Column("ckey", String, nullable=False),
+)
+Table(
+    "block_table",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("prevHash", String, nullable=False),
+    Column("hash", String, nullable=False),
+    Column("nonce", Integer, nullable=False),
+    Column("datastring", String, nullable=False),
+)
+Table(
+    "transaction_table",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("ttype", Integer, nullable=False),
+    Column(
+        "ttimestamp",
+        DateTime,
+        nullable=False,
+        server_default=func.CURRENT_TIMESTAMP(),
+    ),
+    Column("fromAddr", Integer, ForeignKey("address_table.id"), nullable=True),
+    Column("toAddr", Integer, ForeignKey("address_table.id"), nullable=True),
+    Column("pkey", String, nullable=False),
+    Column("value", Integer, nullable=False),
+    Column("fee", Integer, nullable=False),
+    Column("data", String, nullable=False),
+    Column("block_id", Integer, ForeignKey("block_table.id"), nullable=True),
+    Column("signature", String, nullable=False),
+)
+Table(
+    "balance_table",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column(
+        "address_id",
+        Integer,
+        ForeignKey("address_table.id"),
+        nullable=False,
+        unique=True,
+    ),
+    Column("confirmed", Integer, nullable=False),
+    Column("pending", Integer, nullable=False),
+)
+Table(
+    "chaintip_table",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("block_id", Integer, ForeignKey("block_table.id"), nullable=False),
+    Column("height", Integer, nullable=False),
+    Column("hash", String, nullable=False),
+    Column("length", Integer, nullable=False),
+    Column("work", String(64), nullable=False),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn, checkfirst=True)
+
+
+def downgrade(conn: Connection) -> None:
+    metadata.drop_all(conn, checkfirst=True)
@@ -0,0 +1,32 @@
+from sqlalchemy import Connection, Index, MetaData, Table
+
+# Names follow the ix_<table>_<column> convention that index=True uses on
+# the models, so create_all and the migrations produce the same schema
+
+INDEXES = [
+    ("transaction_table", "block_id", False),
+    ("transaction_table", "fromAddr", False),
+    ("transaction_table", "toAddr", False),
+    ("transaction_table", "fee", False),
+    ("address_table", "address", True),
+    ("block_table", "hash", True),
+]
+
+
+def indexes(conn: Connection) -> list[Index]:
+    metadata = MetaData()
+    ret = []
+    for table_name, column, unique in INDEXES:
+        table = Table(table_name, metadata, autoload_with=conn)
+        ret.append(Index(f"ix_{table_name}_{column}", table.c[column], unique=unique))
+    return ret
+
+
+def upgrade(conn: Connection) -> None:
+    for index in indexes(conn):
+        index.create(conn, checkfirst=True)
+
+
+def downgrade(conn: Connection) -> None:
+    for index in indexes(conn):
+        index.drop(conn, checkfirst=True)
@@ -0,0 +1,17 @@
+from sqlalchemy import Connection, Index, MetaData, Table
+
+# Lets blocks and relayed transactions from peers find the rows they
+# already have without scanning the table
+
+
+def index(conn: Connection) -> Index:
+    table = Table("transaction_table", MetaData(), autoload_with=conn)
+    return Index("ix_transaction_table_signature", table.c.signature)
+
+
+def upgrade(conn: Connection) -> None:
+    index(conn).create(conn, checkfirst=True)
+
+
+def downgrade(conn: Connection) -> None:
+    index(conn).drop(conn, checkfirst=True)
@@ -0,0 +1,41 @@
+from sqlalchemy import (
+    JSON,
+    Column,
+    Connection,
+    ForeignKey,
+    Integer,
+    MetaData,
+    Table,
+)
+
+# Blocks connected before this revision have no undo record, a reorg
+# computes theirs from the transaction rows
+
+
+def blockundo_table(conn: Connection) -> Table:
+    metadata = MetaData()
+    Table("block_table", metadata, autoload_with=conn)
+    return Table(
+        "blockundo_table",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column(
+            "block_id",
+            Integer,
+            ForeignKey("block_table.id"),
+            nullable=False,
+            unique=True,
+        ),
+        Column("confirmed", JSON, nullable=False),
+        Column("pending", JSON, nullable=False),
+        Column("transactions", JSON, nullable=False),
+        Column("rewards", JSON, nullable=False),
+    )
+
+
+def upgrade(conn: Connection) -> None:
+    blockundo_table(conn).create(conn, checkfirst=True)
+
+
+def downgrade(conn: Connection) -> None:
+    blockundo_table(conn).drop(conn, checkfirst=True)
@@ -0,0 +1,21 @@
+from sqlalchemy import Connection, Index, MetaData, Table, text
+
+# Until now a block's height was its row id - 1, which only held while
+# SQLite reused the ids of disconnected blocks. Existing rows still follow
+# that, so they are backfilled from it.
+
+
+def index(conn: Connection) -> Index:
+    table = Table("block_table", MetaData(), autoload_with=conn)
+    return Index("ix_block_table_height", table.c.height, unique=True)
+
+
+def upgrade(conn: Connection) -> None:
+    conn.execute(text("ALTER TABLE block_table ADD COLUMN height INTEGER"))
+    conn.execute(text("UPDATE block_table SET height = id - 1"))
+    index(conn).create(conn)
+
+
+def downgrade(conn: Connection) -> None:
+    index(conn).drop(conn, checkfirst=True)
+    conn.execute(text("ALTER TABLE block_table DROP COLUMN height"))
@@ -0,0 +1,229 @@
+import asyncio
+from collections import OrderedDict
+
+import backend.crud as crud
+from backend.core.config import settings
+from backend.core.models import db_helper, Block
+from backend.schemas import BlockCreate, TransactionCreate
+from backend.src.bchain import (
+    Block as BlockClass,
+    Transaction as TransactionClass,
+    Miner,
+)
+
+
+class MiningJob:
+    __slots__ = [
+        "id",
+        "block",
+        "transaction_ids",
+        "miner_address_id",
+        "workers",
+        "miner",
+        "status",
+        "error",
+        "result",
+        "done",
+    ]
+
+    def __init__(
+        self,
+        id: int,
+        block: BlockClass,
+        transaction_ids: list[int],
+        miner_address_id: int,
+        workers: int,
+    ) -> None:
+        self.id = id
+        self.block = block
+        self.transaction_ids = transaction_ids
+        self.miner_address_id = miner_address_id
+        self.workers = workers
+        # Lent by the manager while the job runs
+        self.miner: Miner | None = None
+        self.status = "pending"
+        self.error = None
+        self.result: Block | None = None
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.done.is_set()
+
+    def finish(self, status: str, error: str | None = None) -> None:
+        if self.finished:
+            return
+        self.status = status
+        self.error = error
+        if self.miner is not None:
+            self.miner.cancel()
+        self.done.set()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "workers": self.workers,
+            "prevHash": self.block.data["prevHash"],
+            "hash": self.block.hash if self.status == "done" else None,
+            "block_id": self.result.id if self.result is not None else None,
+            "error": self.error,
+        }
+
+
+class MiningJobManager:
+    def __init__(self, tip_poll_interval: float, history: int = 100) -> None:
+        self.tip_poll_interval = tip_poll_interval
+        self.history = history
+        self.jobs: OrderedDict[int, MiningJob] = OrderedDict()
+        self._next_id = 1
+        self._tasks: set[asyncio.Task] = set()
+        self.commit_lock = asyncio.Lock()
+        # Called with every block mined here once it is stored
+        self.mined_callbacks: list = []
+        # Worker count -> idle miners, which keep their processes between jobs
+        self.miners: dict[int, list[Miner]] = {}
+
+    def submit(
+        self,
+        block: BlockClass,
+        transaction_ids: list[int],
+        miner_address_id: int,
+        workers: int,
+    ) -> MiningJob:
+        job = MiningJob(
+            self._next_id, block, transaction_ids, miner_address_id, workers
+        )
+        self._next_id += 1
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history:
+            oldest = next(iter(self.jobs.values()))
+            if not oldest.finished:
+                break
+            self.jobs.popitem(last=False)
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: int) -> MiningJob | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: int) -> MiningJob | None:
+        job = self.get(job_id)
+        if job is not None:
+            job.finish("cancelled")
+        return job
+
+    def tip_changed(self, tip_hash: str) -> None:
+        for job in self.jobs.values():
+            if job.block.data["prevHash"] != tip_hash:
+                job.finish("stale", "Chain tip has changed while mining")
+
+    async def shutdown(self) -> None:
+        for job in self.jobs.values():
+            job.finish("cancelled")
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for miners in self.miners.values():
+            for miner in miners:
+                miner.close()
+        self.miners.clear()
+
+    async def _watch_tip(self, job: MiningJob) -> None:
+        while not job.finished:
+            await asyncio.sleep(self.tip_poll_interval)
+            async with db_helper.session_factory() as session:
+                tip_hash = await crud.get_last_block_hash(session)
+            if tip_hash != job.block.data["prevHash"]:
+                self.tip_changed(tip_hash)
+
+    async def _run(self, job: MiningJob) -> None:
+        try:
+            await self._mine(job)
+        except Exception as e:
+            job.finish("failed", f"Unexpected error while mining: {e}")
+        finally:
+            # Whatever stopped the job, nobody waits on it forever
+            job.finish("failed", "Mining stopped unexpectedly")
+
+    async def _mine(self, job: MiningJob) -> None:
+        if job.finished:
+            # Cancelled or stale before it got to run
+            return
+        job.status = "running"
+        idle = self.miners.get(job.workers)
+        job.miner = idle.pop() if idle else Miner(job.workers)
+        watcher = asyncio.create_task(self._watch_tip(job))
+        try:
+            await job.block.mine(miner=job.miner)
+            job.block.validate()
+        except Exception as e:
+            if not job.finished:
+                job.finish(
+                    "failed", f"Unexpected error while validating mined block: {e}"
+                )
+            return
+        finally:
+            watcher.cancel()
+            # A later finish of this job mustn't cancel the next one's search
+            miner, job.miner = job.miner, None
+            self.miners.setdefault(miner.workers, []).append(miner)
+        if job.finished:
+            return
+
+        try:
+            async with self.commit_lock:
+                async with db_helper.session_factory() as session:
+                    tip_hash = await crud.get_last_block_hash(session)
+                    if tip_hash != job.block.data["prevHash"]:
+                        self.tip_changed(tip_hash)
+                        return
+                    rewards = await crud.create_transactions(
+                        session=session,
+                        transactions_inp=[
+                            reward_create(
+                                job.block.getTransaction(num), job.miner_address_id
+                            )
+                            for num in (0, job.block.getTransactionListLen() - 1)
+                        ],
+                        commit=False,
+                    )
+                    transaction_ids = [rewards[0]] + job.transaction_ids + [rewards[1]]
+                    job.result = await crud.create_block(
+                        session=session,
+                        block_inp=block_create(job.block, transaction_ids),
+                    )
+        except Exception as e:
+            job.finish("failed", f"Unexpected error while saving mined block: {e}")
+            return
+        job.finish("done")
+        self.tip_changed(job.block.hash)
+        for callback in self.mined_callbacks:
+            callback(job.block)
+
+
+def reward_create(tr: TransactionClass, address_id: int) -> TransactionCreate:
+    return TransactionCreate(
+        ttype=tr.data["ttype"].value,
+        fromAddr=None,
+        toAddr=address_id,
+        value=tr.data["value"],
+        fee=tr.data["fee"],
+        ttimestamp=tr.data["timestamp"],
+        pkey=tr.data["pkey"],
+        data=tr.datastring,
+        signature=tr.signature,
+    )
+
+
+def block_create(block: BlockClass, transaction_ids: list[int]) -> BlockCreate:
+    block_dict: dict = block.data.copy()
+    block_dict.pop("id")
+    block_dict["hash"] = block.hash
+    block_dict["datastring"] = block.datastring
+    block_dict["transactionList"] = transaction_ids
+    return BlockCreate(**block_dict)
+
+
+mining_jobs = MiningJobManager(tip_poll_interval=settings.mining_tip_poll_interval)
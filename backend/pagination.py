@@ -0,0 +1,38 @@
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+import backend.crud as crud
+from backend.core.config import settings
+from backend.core.models import db_helper
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    def __init__(
+        self,
+        after: int = Query(default=0, ge=0),
+        limit: int = Query(default=settings.page_size, ge=1, le=settings.max_page_size),
+    ) -> None:
+        self.after = after
+        self.limit = limit
+
+    def paginate(self, response: Response, rows: list) -> list:
+        # A short page is the last one, otherwise the client continues after it
+        if len(rows) == self.limit:
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+        return rows
+
+
+def ndjson_response(
+    model: type, schema: type[BaseModel], after: int
+) -> StreamingResponse:
+    async def lines():
+        async for row in crud.stream_rows(
+            db_helper.session_factory, model, after, settings.stream_chunk_size
+        ):
+            row = schema.model_validate(row, from_attributes=True)
+            yield row.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
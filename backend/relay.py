@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+from collections import Counter
+
+import backend.crud as crud
+from backend.core.models import db_helper
+from backend.mempool import mempool, MempoolEntry
+from backend.schemas import (
+    AnnounceResult,
+    CompactBlock,
+    PrefilledTransaction,
+    RawTransaction,
+)
+from backend.src.bchain import Block as BlockClass, TransactionList
+from backend.sync import ChainSync, PEER_ERRORS, chain_sync
+
+SHORT_ID_LENGTH = 12
+
+
+def short_id(salt: str, txid: str) -> str:
+    # Salted with the block hash, so nobody can prepare colliding
+    # transactions before the block exists
+    return hashlib.sha256((salt + txid).encode("ascii")).hexdigest()[:SHORT_ID_LENGTH]
+
+
+def compact_block(block: BlockClass, prefill: set[int] = frozenset()) -> CompactBlock:
+    # The rewards at both ends of the list are never in anyone's mempool
+    last = block.getTransactionListLen() - 1
+    prefill = set(prefill) | {0, last}
+    prefilled = []
+    short_ids = []
+    for num in range(last + 1):
+        tr = block.getTransaction(num)
+        if num in prefill:
+            prefilled.append(
+                PrefilledTransaction(
+                    index=num, datastring=tr.datastring, signature=tr.signature
+                )
+            )
+        else:
+            short_ids.append(short_id(block.hash, tr.txid))
+    return CompactBlock(
+        height=block.data["id"],
+        prevHash=block.data["prevHash"],
+        hash=block.hash,
+        nonce=block.data["nonce"],
+        version=block.data["version"],
+        shortIds=short_ids,
+        prefilled=prefilled,
+    )
+
+
+def reconstruct(
+    compact: CompactBlock, entries: list[MempoolEntry]
+) -> tuple[list, list[int]]:
+    # (datastring, signature) pairs in block order and the positions that
+    # couldn't be filled. Short ids fill the positions left by prefilled
+    # transactions in order.
+    size = len(compact.shortIds) + len(compact.prefilled)
+    pairs = [None] * size
+    for tr in compact.prefilled:
+        if not 0 <= tr.index < size or pairs[tr.index] is not None:
+            raise ValueError(f"Prefilled transaction index {tr.index} is not right")
+        pairs[tr.index] = (tr.datastring, tr.signature)
+    known = {}
+    ambiguous = set()
+    for entry in entries:
+        key = short_id(compact.hash, entry.txid)
+        if key in known:
+            ambiguous.add(key)
+        known[key] = entry
+    missing = []
+    positions = [num for num in range(size) if pairs[num] is None]
+    for num, key in zip(positions, compact.shortIds):
+        if key in known and key not in ambiguous:
+            pairs[num] = (known[key].data, known[key].signature)
+        else:
+            missing.append(num)
+    return pairs, missing
+
+
+class BlockRelay:
+    # Mined and accepted blocks go to every peer as compact blocks, the
+    # full transactions only travel when a peer asks for them
+
+    def __init__(self, sync: ChainSync) -> None:
+        self.sync = sync
+        self.received = Counter()
+        self.requested = 0
+        self._lock = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+
+    def later(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def announce_later(self, block: BlockClass) -> None:
+        if self.sync.client is not None and self.sync.peers:
+            self.later(self.announce(block))
+
+    def relay_transactions_later(self, pairs: list[tuple[str, str]]) -> None:
+        if self.sync.client is not None and self.sync.peers and pairs:
+            self.later(self.relay_transactions(pairs))
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def announce(self, block: BlockClass) -> list[AnnounceResult | None]:
+        compact = compact_block(block)
+        return await asyncio.gather(
+            *(self.announce_to(peer, block, compact) for peer in self.sync.peers)
+        )
+
+    async def announce_to(
+        self, peer: str, block: BlockClass, compact: CompactBlock
+    ) -> AnnounceResult | None:
+        try:
+            result = await self.post_announce(peer, compact)
+            if result.status == "missing":
+                # Second round trip with just the transactions the peer lacks
+                result = await self.post_announce(
+                    peer, compact_block(block, set(result.missing))
+                )
+        except PEER_ERRORS:
+            return None
+        return result
+
+    async def post_announce(self, peer: str, compact: CompactBlock) -> AnnounceResult:
+        return AnnounceResult.model_validate(
+            await self.sync.request(
+                "POST", peer, "/chain/announce/", json=compact.model_dump()
+            )
+        )
+
+    async def relay_transactions(self, pairs: list[tuple[str, str]]) -> None:
+        body = [
+            RawTransaction(datastring=datastring, signature=signature).model_dump()
+            for datastring, signature in pairs
+        ]
+
+        async def send(peer: str) -> None:
+            try:
+                await self.sync.request("POST", peer, "/transaction/raw/", json=body)
+            except PEER_ERRORS:
+                pass
+
+        await asyncio.gather(*(send(peer) for peer in self.sync.peers))
+
+    async def receive(self, compact: CompactBlock) -> AnnounceResult:
+        # One at a time, a block relayed by several peers is stored once
+        async with self._lock:
+            result = await self._receive(compact)
+        self.received[result.status] += 1
+        self.requested += len(result.missing)
+        return result
+
+    async def _receive(self, compact: CompactBlock) -> AnnounceResult:
+        async with db_helper.session_factory() as session:
+            if await crud.get_block_by_hash(session, compact.hash) is not None:
+                return AnnounceResult(status="known")
+            tip = await crud.get_chain_tip(session)
+        if (
+            tip is None
+            or compact.prevHash != tip.hash
+            or compact.height != tip.height + 1
+        ):
+            # Behind or on another branch, a full sync sorts that out
+            if not self.sync.running:
+                self.later(self.sync.sync())
+            return AnnounceResult(status="orphan")
+        try:
+            pairs, missing = reconstruct(compact, list(mempool))
+        except ValueError as e:
+            return AnnounceResult(status="rejected", error=str(e))
+        if missing:
+            return AnnounceResult(status="missing", missing=missing)
+
+        loop = asyncio.get_running_loop()
+        try:
+            block = await loop.run_in_executor(None, self.build, compact, pairs)
+        except Exception as e:
+            if compact.shortIds:
+                # A short id matched the wrong transaction, ask for all of them
+                prefilled = {tr.index for tr in compact.prefilled}
+                return AnnounceResult(
+                    status="missing",
+                    missing=[num for num in range(len(pairs)) if num not in prefilled],
+                )
+            return AnnounceResult(status="rejected", error=str(e))
+        try:
+            await self.sync.store([block])
+        except ValueError as e:
+            return AnnounceResult(status="rejected", error=str(e))
+        self.announce_later(block)
+        return AnnounceResult(status="accepted")
+
+    @staticmethod
+    def build(compact: CompactBlock, pairs: list) -> BlockClass:
+        block = BlockClass(
+            id=compact.height,
+            prevHash=compact.prevHash,
+            # Checked once by validate below
+            transactionList=TransactionList.fromPairs(pairs, verify=False),
+            nonce=compact.nonce,
+            version=compact.version,
+            hash=compact.hash,
+        )
+        block.validate()
+        return block
+
+
+block_relay = BlockRelay(chain_sync)
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import datetime
 
+from backend.src.bchain import Transaction as TransactionClass
+
 
 class AddressBase(BaseModel):
     address: str
@@ -17,6 +19,7 @@ class Address(AddressBase):
 class AddressBalance(BaseModel):
     address: Address
     balance: float
+    pending: float = 0
 
 
 class TransactionBase(BaseModel):
@@ -36,6 +39,14 @@ class TransactionCreate(TransactionBase):
     signature: str
 
 
+class TransactionBatchResult(BaseModel):
+    index: int
+    ok: bool
+    id: int | None = None
+    txid: str | None = None
+    error: str | None = None
+
+
 class TransactionUpdate(TransactionBase):
     pass
 
@@ -85,3 +96,81 @@ class BlockUpdatePartial(BlockCreate):
 class Block(BlockBase):
     id: int
     transactionList: list[Transaction]
+
+
+class MiningJob(BaseModel):
+    id: int
+    status: str
+    workers: int
+    prevHash: str
+    hash: str | None = None
+    block_id: int | None = None
+    error: str | None = None
+
+
+class ChainTip(BaseModel):
+    block_id: int
+    height: int
+    hash: str
+    length: int
+    work: str
+
+
+class BlockHeader(BaseModel):
+    height: int
+    hash: str
+    prevHash: str
+
+
+class BlockBody(BaseModel):
+    hash: str
+    datastring: str
+
+
+class PeerStatus(BaseModel):
+    url: str
+    tip: ChainTip | None = None
+    error: str | None = None
+
+
+class SyncResult(BaseModel):
+    status: str
+    peer: str | None = None
+    blocks: int = 0
+    disconnected: int = 0
+    height: int | None = None
+    error: str | None = None
+    peers: list[PeerStatus] = []
+
+
+class RawTransaction(BaseModel):
+    datastring: str
+    signature: str
+
+    @field_validator("datastring")
+    @classmethod
+    def binary_only(cls, datastring: str) -> str:
+        # Legacy datastrings are pickles and are never decoded from peers
+        if not TransactionClass.isBinary(datastring):
+            raise ValueError("Only binary transaction datastrings are accepted")
+        return datastring
+
+
+class PrefilledTransaction(RawTransaction):
+    index: int
+
+
+class CompactBlock(BaseModel):
+    height: int
+    prevHash: str
+    hash: str
+    nonce: int
+    version: int
+    shortIds: list[str]
+    prefilled: list[PrefilledTransaction]
+
+
+class AnnounceResult(BaseModel):
+    status: str
+    missing: list[int] = []
+    error: str | None = None
@@ -0,0 +1,49 @@
+from ellipticcurve import PrivateKey
+
+from backend.src.bchain import Transaction as TransactionClass, Address as AddressClass
+
+
+def _sign(item: dict) -> TransactionClass:
+    ckey = PrivateKey.fromString(item["ckey"])
+    return TransactionClass(
+        ttype=item["ttype"],
+        fromAddr=AddressClass(address=item["fromAddr"]),
+        toAddr=AddressClass(address=item["toAddr"]),
+        pkey=ckey.publicKey(),
+        value=item["value"],
+        fee=item["fee"],
+        ckey=ckey,
+        timestamp=item["timestamp"],
+    )
+
+
+def _signChunk(items: list[dict]) -> list:
+    ret = []
+    for item in items:
+        try:
+            tr = _sign(item)
+            ret.append((tr.datastring, tr.signature, tr.data["pkey"]))
+        except Exception as e:
+            ret.append(e)
+    return ret
+
+
+def sign_transactions(items: list[dict], workers: int = 1, pool=None) -> list:
+    # Returns (datastring, signature, pkey) or the exception for every item.
+    # Deriving the public key, signing and verifying are pure Python ECDSA and
+    # hold the GIL, so they only run in parallel in a process pool.
+    if pool is None or len(items) <= 1:
+        ret = _signChunk(items)
+    else:
+        size = -(-len(items) // (max(workers, 1) * 4))
+        chunks = [items[i : i + size] for i in range(0, len(items), size)]
+        ret = []
+        for results in pool.map(_signChunk, chunks):
+            ret += results
+        # Workers verified these already, later block validation can skip them
+        for result in ret:
+            if not isinstance(result, Exception):
+                TransactionClass.verified.add(
+                    TransactionClass.verified.key(result[0], result[1])
+                )
+    return ret
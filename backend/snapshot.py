@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import backend.crud as crud
+from backend.audit import ChainAudit
+from backend.core.config import settings
+from backend.core.models import Balance, Block
+from backend.mining import mining_jobs
+from backend.schemas import ChainTip
+
+SNAPSHOT_VERSION = 1
+
+
+class StateSnapshots:
+    # The tip, confirmed balances and validation watermark in files named by
+    # tip height. Startup restores the tip and balances from the newest one.
+    # A file is the sha256 of the payload, a newline and the payload. Blocks
+    # are validated on the way in, so the watermark of a running node is its
+    # tip.
+
+    def __init__(self, path: str | None, interval: float, keep: int) -> None:
+        self.path = path
+        self.interval = interval
+        self.keep = keep
+        self.last: dict | None = None
+        self.error = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def files(self) -> list[str]:
+        # Newest first
+        if not self.enabled or not os.path.isdir(self.path):
+            return []
+        names = [
+            name
+            for name in os.listdir(self.path)
+            if name.startswith("snapshot-") and name.endswith(".json")
+        ]
+        return [os.path.join(self.path, name) for name in sorted(names, reverse=True)]
+
+    @staticmethod
+    def read(path: str) -> dict:
+        with open(path, "rb") as f:
+            checksum, _, payload = f.read().partition(b"\n")
+        if hashlib.sha256(payload).hexdigest().encode("ascii") != checksum:
+            raise ValueError("Snapshot checksum doesn't match")
+        data = json.loads(payload)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unknown snapshot version {data.get('version')}")
+        return data
+
+    def write(self, data: dict) -> str:
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"snapshot-{data['tip']['height']:010d}.json")
+        # A crash while writing leaves the previous snapshots intact
+        with open(path + ".tmp", "wb") as f:
+            f.write(hashlib.sha256(payload).hexdigest().encode("ascii") + b"\n")
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        for old in self.files()[self.keep :]:
+            os.remove(old)
+        return path
+
+    async def take(self, session_factory: async_sessionmaker) -> dict | None:
+        # Blocks are committed under the lock, so tip and balances match
+        async with mining_jobs.commit_lock:
+            async with session_factory() as session:
+                tip = await crud.get_chain_tip(session)
+                if tip is None:
+                    return None
+                stmt = select(Balance.address_id, Balance.confirmed).where(
+                    Balance.confirmed != 0
+                )
+                balances = (await session.execute(stmt)).all()
+        return {
+            "version": SNAPSHOT_VERSION,
+            "created": datetime.now().isoformat(),
+            "tip": tip.model_dump(),
+            "watermark": tip.block_id,
+            "balances": [list(row) for row in balances],
+        }
+
+    async def save(self, session_factory: async_sessionmaker) -> str | None:
+        data = await self.take(session_factory)
+        if data is None or (self.last is not None and self.last["tip"] == data["tip"]):
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            path = await loop.run_in_executor(None, self.write, data)
+        except OSError as e:
+            self.error = str(e)
+            return None
+        self.last = data
+        self.error = None
+        return path
+
+    async def load(self, session_factory: async_sessionmaker) -> dict | None:
+        # The newest snapshot that is intact and whose tip is still in the chain
+        for path in self.files():
+            try:
+                data = self.read(path)
+                tip = ChainTip.model_validate(data["tip"])
+            except (OSError, ValueError, KeyError):
+                continue
+            async with session_factory() as session:
+                stmt = select(Block.hash).where(Block.id == tip.block_id)
+                if await session.scalar(stmt) == tip.hash:
+                    self.last = data
+                    return data
+        return None
+
+    async def recover(
+        self, session_factory: async_sessionmaker, audit: bool, chunk_size: int
+    ) -> dict:
+        # A missing tip record or balances table is restored from the newest
+        # snapshot plus the blocks after it. The audit, if asked for, checks
+        # only those blocks, or all of them without a snapshot.
+        snapshot = await self.load(session_factory) if self.enabled else None
+        after = snapshot["watermark"] if snapshot is not None else 0
+        ret = {"snapshot": snapshot is not None, "after": after, "checked": 0}
+        if audit:
+            chain_audit = ChainAudit(chunk_size=chunk_size)
+            if not await chain_audit.run(session_factory, after=after):
+                raise ValueError(f"Stored chain is invalid: {chain_audit.error}")
+            ret["checked"] = chain_audit.checked
+        async with session_factory() as session:
+            if not await crud.has_balances(session):
+                # Databases created before the balances table need it filled once
+                if snapshot is None:
+                    await crud.rebuild_balances(session)
+                else:
+                    await crud.rebuild_balances(
+                        session,
+                        dict(snapshot["balances"]),
+                        snapshot["tip"]["block_id"],
+                    )
+            if await crud.get_chain_tip(session) is None:
+                await crud.rebuild_chain_tip(
+                    session,
+                    None if snapshot is None else ChainTip(**snapshot["tip"]),
+                )
+        return ret
+
+    def start(self, session_factory: async_sessionmaker) -> None:
+        if self.enabled and self.interval > 0:
+            self._task = asyncio.create_task(self.run(session_factory))
+
+    async def run(self, session_factory: async_sessionmaker) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save(session_factory)
+
+    async def stop(self, session_factory: async_sessionmaker) -> None:
+        # A snapshot at shutdown lets the next start skip every block
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.enabled:
+            await self.save(session_factory)
+
+
+def snapshot_path(db_url: str, path: str) -> str | None:
+    if path:
+        return path
+    url = make_url(db_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database + ".snapshots"
+
+
+state_snapshots = StateSnapshots(
+    path=snapshot_path(settings.db_url, settings.snapshot_path),
+    interval=settings.snapshot_interval,
+    keep=settings.snapshot_keep,
+)
@@ -2,3 +2,4 @@ from .chain import Chain
 from .block import TransactionList, Block
 from .transaction import Transaction, TTypes, Address
 from .constants import Constants
+from .miner import Miner
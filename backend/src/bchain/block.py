@@ -1,9 +1,20 @@
 from backend.src.bchain.constants import Constants
 import hashlib
-from backend.src.bchain.transaction import Transaction, TTypes, Address
-from pickle import dumps, loads
+import asyncio
+from backend.src.bchain.transaction import (
+    Transaction,
+    TTypes,
+    Address,
+    LEGACY_CLASSES,
+    legacyLoads,
+)
+from backend.src.bchain.miner import Miner
+from backend.src.bchain.encoding import Writer, Reader
+from pickle import dumps
 import type_enforced
 import base64
+import struct
+import time
 from ellipticcurve import PrivateKey, PublicKey
 
 
@@ -17,7 +28,7 @@ class TransactionList:
             self.data += [Transaction.fromDatastring(tr.datastring, tr.signature)]
 
     @staticmethod
-    def validate(transactionList) -> bool:
+    def validate(transactionList, workers: int = 1) -> bool:
         ret = True
         if transactionList.getLen() != (Constants.BlockSize() + 2):
             ret = False
@@ -40,6 +51,7 @@ class TransactionList:
         if transactionList.data[-1].data["value"] != sfee:
             ret = False
             raise ValueError("Fee reward is not right")
+        ret = Transaction.validateBatch(transactionList.getPairs(), workers)
         return ret
 
     @classmethod
@@ -62,15 +74,51 @@ class TransactionList:
         trlist = [trcreation] + trlist + [trfee]
         return cls(*trlist)
 
+    @classmethod
+    def fromPairs(cls, pairs: list, verify: bool = True):
+        # Without verify nothing is checked until TransactionList.validate
+        ret = cls()
+        ret.data = [Transaction.fromDatastring(ds, sig, verify) for ds, sig in pairs]
+        return ret
+
     def getTransaction(self, num: int) -> Transaction:
         return self.data[num]
 
     def getLen(self) -> int:
         return len(self.data)
 
+    def getPairs(self) -> list:
+        return [(tr.datastring, tr.signature) for tr in self.data]
+
+
+LEGACY_CLASSES[("block", "TransactionList")] = TransactionList
+
+
+class BlockHeader:
+    __slots__ = ["prefix", "target", "_midstate"]
+
+    def __init__(self, prefix: bytes) -> None:
+        self.prefix = prefix
+        self.target = Constants.Target()
+        self._midstate = hashlib.sha256(prefix)
+
+    def __reduce__(self):
+        return (self.__class__, (self.prefix,))
+
+    def __call__(self, nonce: int) -> bool:
+        return self.digest(nonce) < self.target
+
+    def digest(self, nonce: int) -> bytes:
+        ret = self._midstate.copy()
+        ret.update(nonce.to_bytes(8, "big"))
+        return ret.digest()
+
 
 class Block:
-    __slots__ = ["data", "_datastring", "_hash"]
+    __slots__ = ["data", "_datastring", "_hash", "_header"]
+
+    # Called with (nonce attempts, seconds) after every solved block
+    onSolve = None
 
     def __init__(
         self,
@@ -80,17 +128,22 @@ class Block:
         nonce: int = 0,
         datastring: [None, str] = None,
         hash: [None, str] = None,
+        version: int = Constants.BlockVersion(),
     ) -> None:
-        self.data = dict.fromkeys(["id", "prevHash", "transactionList", "nonce"])
+        self.data = dict.fromkeys(
+            ["id", "prevHash", "transactionList", "nonce", "version"]
+        )
         self.data["id"] = id
         self.data["prevHash"] = prevHash
         self.data["transactionList"] = transactionList
         self.data["nonce"] = nonce
+        self.data["version"] = version
 
         self._datastring = self.encodeDatastring(self.data)
         if datastring and self._datastring != datastring:
             raise ValueError("Datastrings from created and imported blocks don't match")
-        self._hash = hashlib.sha256(self._datastring.encode("utf-8")).hexdigest()
+        self._header = BlockHeader(self.encodeHeader(self.data))
+        self._hash = self.computeHash()
         if hash and self._hash != hash:
             raise ValueError("Hashes from created and imported blocks don't match")
 
@@ -102,16 +155,55 @@ class Block:
     def hash(self) -> str:
         return self._hash
 
+    @property
+    def header(self) -> BlockHeader:
+        return self._header
+
     def isMined(self) -> bool:
-        return self.hash[: Constants.Difficulty()] == "0" * Constants.Difficulty()
+        return self.checkHash(self.hash)
 
-    async def mine(self) -> None:
-        while not self.isMined():
-            self.data["nonce"] += 1
-            self._datastring = self.encodeDatastring(self.data)
-            self._hash = hashlib.sha256(self.datastring.encode("utf-8")).hexdigest()
+    async def mine(self, workers: int = 1, miner: [None, Miner] = None) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.solve, workers, miner)
 
-    def validate(self) -> bool:
+    def solve(self, workers: int = 1, miner: [None, Miner] = None) -> None:
+        if self.data["version"] < 2:
+            raise ValueError("Legacy blocks can't be mined")
+        nonce = self.data["nonce"]
+        start = nonce
+        begin = time.perf_counter()
+        if miner is None and workers > 1:
+            # A one-off search, its pool goes away with it
+            owned = Miner(workers)
+            try:
+                nonce = owned.search(self.header, nonce)
+            finally:
+                owned.close()
+        elif miner is not None:
+            nonce = miner.search(self.header, nonce)
+            if nonce is None:
+                raise ValueError("Mining has been cancelled")
+        else:
+            while not self.header(nonce):
+                nonce += 1
+        if Block.onSolve is not None:
+            # Parallel workers hash a little past the winning nonce
+            Block.onSolve(nonce - start + 1, time.perf_counter() - begin)
+        self.data["nonce"] = nonce
+        self._datastring = self.encodeDatastring(self.data)
+        self._hash = self.computeHash()
+
+    def computeHash(self) -> str:
+        if self.data["version"] < 2:
+            datastring = self.encodeDatastring(self.data)
+            return hashlib.sha256(datastring.encode("utf-8")).hexdigest()
+        return self.header.digest(self.data["nonce"]).hex()
+
+    @staticmethod
+    def checkHash(hash: str) -> bool:
+        return bytes.fromhex(hash) < Constants.Target()
+
+    def validate(self, workers: int = 1) -> bool:
         ret = True
         datastring = self.encodeDatastring(self.data)
         if not isinstance(self, Block):
@@ -120,7 +212,7 @@ class Block:
         if self.datastring != datastring:
             ret = False
             raise ValueError("Datastring is not right")
-        hash = hashlib.sha256(self.datastring.encode("utf-8")).hexdigest()
+        hash = self.computeHash()
         if self.hash != hash:
             ret = False
             raise ValueError("Hash is not right")
@@ -129,8 +221,8 @@ class Block:
             ret = True
             return ret
 
-        if not isinstance(self.data["transactionList"], TransactionList) and not (
-            self.data["transactionList"].validate()
+        if not isinstance(self.data["transactionList"], TransactionList) or not (
+            TransactionList.validate(self.data["transactionList"], workers)
         ):
             ret = False
             raise ValueError("Transaction list isn't right")
@@ -140,22 +232,99 @@ class Block:
         return ret
 
     @classmethod
-    def fromDatastring(cls, datastring: str, hash: str):
-        data = cls.decodeDatastring(datastring)
+    def fromDatastring(
+        cls, datastring: str, hash: str, verify: bool = True, binary: bool = False
+    ):
+        # binary refuses legacy block and transaction datastrings, which are
+        # pickles, for datastrings from the network
+        data = cls.decodeDatastring(datastring, verify, binary)
         return cls(**data, datastring=datastring, hash=hash)
 
-    @staticmethod
-    def encodeDatastring(data: dict) -> str:
-        ret = dumps(data)
+    MAGIC = b"BB"
+
+    @classmethod
+    def encodeDatastring(cls, data: dict) -> str:
+        if data["version"] < 2:
+            data = {k: v for k, v in data.items() if k != "version"}
+        if data.get("version", 1) < 3:
+            ret = dumps(data)
+        else:
+            ret = cls.encodeBody(data) + struct.pack(">Q", data["nonce"])
         ret = base64.b64encode(ret).decode("ascii")
         return ret
 
-    @staticmethod
-    def decodeDatastring(datastring: str) -> dict:
+    @classmethod
+    def decodeDatastring(
+        cls, datastring: str, verify: bool = True, binary: bool = False
+    ) -> dict:
         ret = base64.b64decode(datastring)
-        ret = loads(ret)
+        if ret[: len(cls.MAGIC)] == cls.MAGIC:
+            return cls.decodeBinary(ret, verify, binary)
+        if binary:
+            raise ValueError("Block datastring isn't binary encoded")
+        ret = legacyLoads(ret)
+        ret.setdefault("version", 1)
+        # Rebuilt from datastrings so the transactions are verified and their
+        # dicts pickle exactly like freshly created ones
+        ret["transactionList"] = TransactionList.fromPairs(
+            ret["transactionList"].getPairs(), verify
+        )
         return ret
 
+    @classmethod
+    def encodeBody(cls, data: dict) -> bytes:
+        # The binary datastring without its trailing nonce
+        ret = Writer()
+        ret.parts.append(cls.MAGIC)
+        ret.pack("BQ", data["version"], data["id"])
+        ret.string(data["prevHash"])
+        ret.pack("I", data["transactionList"].getLen())
+        for datastring, signature in data["transactionList"].getPairs():
+            ret.bytes(base64.b64decode(datastring))
+            ret.bytes(base64.b64decode(signature))
+        return ret.getvalue()
+
+    @classmethod
+    def decodeBinary(
+        cls, raw: bytes, verify: bool = True, binary: bool = False
+    ) -> dict:
+        reader = Reader(raw, len(cls.MAGIC))
+        version, id = reader.unpack("BQ")
+        prevHash = reader.string()
+        pairs = []
+        for _ in range(reader.unpack("I")[0]):
+            datastring = base64.b64encode(reader.bytes()).decode("ascii")
+            signature = base64.b64encode(reader.bytes()).decode("ascii")
+            pairs.append((datastring, signature))
+        nonce = reader.unpack("Q")[0]
+        reader.end()
+        if binary and not all(Transaction.isBinary(pair[0]) for pair in pairs):
+            raise ValueError("Transaction datastring isn't binary encoded")
+        return {
+            "id": id,
+            "prevHash": prevHash,
+            "transactionList": TransactionList.fromPairs(pairs, verify),
+            "nonce": nonce,
+            "version": version,
+        }
+
+    @classmethod
+    def encodeHeader(cls, data: dict) -> bytes:
+        # Everything but the nonce, so mining only has to hash the nonce bytes
+        if data["version"] >= 3:
+            return cls.encodeBody(data)
+        trhash = hashlib.sha256()
+        for tr in data["transactionList"].data:
+            for field in (tr.datastring, tr.signature):
+                field = field.encode("utf-8")
+                trhash.update(struct.pack(">I", len(field)) + field)
+        prevHash = data["prevHash"].encode("utf-8")
+        return (
+            struct.pack(">BQH", data["version"], data["id"], len(prevHash))
+            + prevHash
+            + trhash.digest()
+        )
+
     @classmethod
     def createInit(cls, ckey: PrivateKey):
         pkey = ckey.publicKey()
@@ -167,11 +336,16 @@ class Block:
 
     @classmethod
     async def construct(
-        cls, id: int, prevHash: str, ckey: PrivateKey, *transactions: Transaction
+        cls,
+        id: int,
+        prevHash: str,
+        ckey: PrivateKey,
+        *transactions: Transaction,
+        workers: int = 1
     ):
         trlist = TransactionList.create(ckey, None, *transactions)
         block = cls(id, prevHash, trlist)
-        await block.mine()
+        await block.mine(workers)
         ret = block.validate()
         if ret:
             return block
@@ -184,6 +358,10 @@ class Block:
     def getTransactionListLen(self) -> int:
         return self.data["transactionList"].getLen()
 
+    def getWork(self) -> int:
+        # Every block is mined against the same target
+        return Constants.Work()
+
     def to_dict(self) -> dict:
         result = self.data.copy()
         result["hash"] = self.hash
@@ -1,41 +1,109 @@
 from .block import Block
+from .transaction import Transaction
 
 
 class Chain:
     def __init__(self, blocks: list[Block]):
-        self.blocks = blocks.copy()
+        self.blocks = []
+        self._positions = {}
+        self._hashes = {}
+        self._transactions = {}
+        # Cumulative work up to and including the block at each position
+        self._work = []
+        # Position of the last block of the prefix that is known to be valid
+        self.validated_height = -1
+        for block in blocks:
+            self._append(block)
+
+    def _append(self, block: Block) -> None:
+        self._positions[block.data["id"]] = len(self.blocks)
+        self._hashes[block.hash] = block
+        for num in range(block.getTransactionListLen()):
+            tr = block.getTransaction(num)
+            self._transactions[tr.signature] = (block, num)
+            self._transactions[tr.txid] = (block, num)
+        self._work.append(self.work + block.getWork())
+        self.blocks.append(block)
 
     def __len__(self):
         return len(self.blocks)
 
+    @property
+    def work(self) -> int:
+        return self._work[-1] if self._work else 0
+
     def __gt__(self, other):
-        return len(self) > len(other)
+        return self.work > other.work
 
     def __lt__(self, other):
-        return len(self) < len(other)
+        return self.work < other.work
 
-    def validate(self) -> bool:
-        for i in range(1, len(self.blocks)):
-            temp_res = self.blocks[i].validate()
-            if not temp_res:
-                return False
-            if self.blocks[i - 1].data["id"] + 1 != self.blocks[i].data["id"]:
-                return False
-            if self.blocks[i - 1].hash != self.blocks[i].hash:
-                return False
+    def validate(self, workers: int = 1, full: bool = False, pool=None) -> bool:
+        if full:
+            self.validated_height = -1
+        start = self.validated_height + 1
+        prev = self.blocks[start - 1] if start > 0 else None
+        blocks = self.blocks[start:]
+        for i, _ in enumerate(self.validate_links(prev, blocks, workers, pool), start):
+            self.validated_height = i
+        return self.validated_height == len(self.blocks) - 1
+
+    @staticmethod
+    def validate_links(prev: Block | None, blocks: list, workers: int = 1, pool=None):
+        # Yields the blocks in order while they are valid and linked. With
+        # workers or a pool the signatures of a window of blocks are checked
+        # in one batch first. A window never outgrows the verified cache, so
+        # the block checks find every pair there instead of verifying again.
+        # Decode the blocks without verify, or they are checked twice.
+        parallel = workers > 1 or pool is not None
+        maxsize = Transaction.verified.maxsize
+        window, pairs = [], []
+        for num, block in enumerate(blocks):
+            window.append(block)
+            if block.data["id"] != 0:
+                pairs += block.data["transactionList"].getPairs()
+            if num + 1 < len(blocks) and (
+                len(pairs) + blocks[num + 1].getTransactionListLen() <= maxsize
+            ):
+                continue
+            if parallel and 1 < len(pairs) <= maxsize:
+                # Errors surface below in block order
+                Transaction.verifyBatch(pairs, workers, pool)
+            for item in window:
+                if not Chain.validate_link(prev, item):
+                    return
+                yield item
+                prev = item
+            window, pairs = [], []
+
+    @staticmethod
+    def validate_link(prev: Block | None, block: Block) -> bool:
+        temp_res = block.validate()
+        if not temp_res:
+            return False
+        if prev is None:
+            return True
+        if prev.data["id"] + 1 != block.data["id"]:
+            return False
+        if prev.hash != block.data["prevHash"]:
+            return False
         return True
 
     def find_block_by_id(self, id: int) -> Block | None:
-        for block in self.blocks:
-            if block.data["id"] == id:
-                return block
-        return None
+        position = self._positions.get(id)
+        return None if position is None else self.blocks[position]
 
     def find_block_by_hash(self, hash_inp: str) -> Block | None:
-        for block in self.blocks:
-            if block.hash == hash_inp:
-                return block
-        return None
+        return self._hashes.get(hash_inp)
+
+    def find_block_by_transaction(self, key: str) -> Block | None:
+        found = self._transactions.get(key)
+        return None if found is None else found[0]
+
+    def find_transaction(self, key: str) -> Transaction | None:
+        # key is either the transaction signature or its txid
+        found = self._transactions.get(key)
+        return None if found is None else found[0].getTransaction(found[1])
 
     def most_recent_block(self):
         return self.blocks[-1]
@@ -44,9 +112,59 @@ class Chain:
         return self.blocks[-1].data["id"]
 
     def add_block(self, block: Block) -> bool:
-        if block.data["id"] > len(self):
+        # Only the new block is checked, against the tip that is already held
+        prev = self.blocks[-1] if self.blocks else None
+        if block.hash in self._hashes:
             return False
-        self.blocks.append(block)
+        for num in range(block.getTransactionListLen()):
+            if block.getTransaction(num).signature in self._transactions:
+                return False
+        try:
+            if not self.validate_link(prev, block):
+                return False
+        except ValueError:
+            return False
+        if self.validated_height == len(self.blocks) - 1:
+            self.validated_height += 1
+        self._append(block)
+        return True
+
+    def rollback(self, height: int) -> list[Block]:
+        # Drops the blocks above height and returns them in chain order
+        position = self._positions[height] if height >= 0 else -1
+        removed = self.blocks[position + 1 :]
+        for block in removed:
+            del self._positions[block.data["id"]]
+            del self._hashes[block.hash]
+            for num in range(block.getTransactionListLen()):
+                tr = block.getTransaction(num)
+                self._transactions.pop(tr.signature, None)
+                self._transactions.pop(tr.txid, None)
+        del self.blocks[position + 1 :]
+        del self._work[position + 1 :]
+        self.validated_height = min(self.validated_height, len(self.blocks) - 1)
+        return removed
+
+    def reorganize(self, blocks: list[Block]) -> bool:
+        # Switches to a branch that forks off this chain if it has more work.
+        # Only the blocks above the fork point are touched.
+        fork = self.find_block_by_hash(blocks[0].data["prevHash"])
+        if fork is None and blocks[0].data["id"] != 0:
+            return False
+        height = fork.data["id"] if fork is not None else -1
+        position = self._positions[height] if fork is not None else -1
+        work = self._work[position] if position >= 0 else 0
+        if work + sum(block.getWork() for block in blocks) <= self.work:
+            return False
+        validated_height = self.validated_height
+        removed = self.rollback(height)
+        for block in blocks:
+            if not self.add_block(block):
+                self.rollback(height)
+                for old in removed:
+                    self._append(old)
+                self.validated_height = validated_height
+                return False
         return True
 
     def block_list_dict(self):
@@ -4,10 +4,30 @@ class Constants:
     def Difficulty() -> int:
         return 3
     
+    @staticmethod
+    def Target() -> bytes:
+        return (16 ** (64 - Constants.Difficulty())).to_bytes(32, "big")
+
+    @staticmethod
+    def Work() -> int:
+        return 2 ** 256 // int.from_bytes(Constants.Target(), "big")
+
+    @staticmethod
+    def BlockVersion() -> int:
+        return 3
+
+    @staticmethod
+    def TransactionVersion() -> int:
+        return 2
+    
     @staticmethod
     def BlockSize() -> int:
         return 1
     
     @staticmethod
     def CreationReward() -> int:
-        return 100
\ No newline at end of file
+        return 100
+
+    @staticmethod
+    def VerifiedCacheSize() -> int:
+        return 10000
@@ -0,0 +1,106 @@
+import struct
+
+NONE, TEXT, HEX, PREFIXED_HEX, BYTES = range(5)
+
+
+class Writer:
+    __slots__ = ["parts"]
+
+    def __init__(self) -> None:
+        self.parts = []
+
+    def pack(self, fmt: str, *values) -> None:
+        self.parts.append(struct.pack(">" + fmt, *values))
+
+    def bytes(self, value: bytes) -> None:
+        self.pack("I", len(value))
+        self.parts.append(value)
+
+    def string(self, value: [None, str]) -> None:
+        # Hex strings (keys, addresses, hashes) are stored as raw bytes
+        if value is None:
+            self.pack("B", NONE)
+            return
+        tag, body = HEX, value
+        if value.startswith("0x"):
+            tag, body = PREFIXED_HEX, value[2:]
+        raw = self.fromHex(body)
+        if raw is None:
+            tag, raw = TEXT, value.encode("utf-8")
+        self.pack("BH", tag, len(raw))
+        self.parts.append(raw)
+
+    def message(self, value) -> None:
+        if value is None:
+            self.pack("B", NONE)
+        elif isinstance(value, str):
+            self.pack("B", TEXT)
+            self.bytes(value.encode("utf-8"))
+        elif isinstance(value, bytes):
+            self.pack("B", BYTES)
+            self.bytes(value)
+        else:
+            raise ValueError(f"Message of type {type(value).__name__} can't be encoded")
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+    @staticmethod
+    def fromHex(value: str) -> [None, bytes]:
+        # Only exact lowercase hex round-trips through bytes.hex()
+        try:
+            ret = bytes.fromhex(value)
+        except ValueError:
+            return None
+        return ret if ret.hex() == value else None
+
+
+class Reader:
+    __slots__ = ["buffer", "offset"]
+
+    def __init__(self, buffer: bytes, offset: int = 0) -> None:
+        self.buffer = buffer
+        self.offset = offset
+
+    def unpack(self, fmt: str) -> tuple:
+        fmt = ">" + fmt
+        ret = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return ret
+
+    def take(self, length: int) -> bytes:
+        if self.offset + length > len(self.buffer):
+            raise ValueError("Datastring is truncated")
+        ret = self.buffer[self.offset : self.offset + length]
+        self.offset += length
+        return ret
+
+    def bytes(self) -> bytes:
+        return self.take(self.unpack("I")[0])
+
+    def string(self) -> [None, str]:
+        tag = self.unpack("B")[0]
+        if tag == NONE:
+            return None
+        raw = self.take(self.unpack("H")[0])
+        if tag == TEXT:
+            return raw.decode("utf-8")
+        if tag == HEX:
+            return raw.hex()
+        if tag == PREFIXED_HEX:
+            return "0x" + raw.hex()
+        raise ValueError(f"Unknown string tag {tag}")
+
+    def message(self):
+        tag = self.unpack("B")[0]
+        if tag == NONE:
+            return None
+        if tag == TEXT:
+            return self.bytes().decode("utf-8")
+        if tag == BYTES:
+            return self.bytes()
+        raise ValueError(f"Unknown message tag {tag}")
+
+    def end(self) -> None:
+        if self.offset != len(self.buffer):
+            raise ValueError("Datastring has trailing bytes")
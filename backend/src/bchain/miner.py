@@ -0,0 +1,127 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+_found = None
+
+
+def _initWorker(found) -> None:
+    global _found
+    _found = found
+
+
+def _searchRange(check, start: int, stop: int) -> int | None:
+    # Plain reads skip the lock, only the write below has to be atomic
+    best = _found.get_obj()
+    for nonce in range(start, stop):
+        # Another worker already has a smaller nonce, nothing here can win
+        if best.value < nonce:
+            return None
+        if check(nonce):
+            with _found.get_lock():
+                if nonce < best.value:
+                    best.value = nonce
+            return nonce
+    return None
+
+
+class Miner:
+    # Ranges are handed out in ascending order and only a smaller nonce can
+    # cancel a range, so the result is the same nonce the serial loop finds.
+    # One worker searches in this process, more share a pool that is kept
+    # across searches until close().
+
+    __slots__ = ["workers", "chunkSize", "cancelled", "_found", "_pool"]
+
+    NONCE_LIMIT = 2**63 - 1
+
+    def __init__(self, workers: int, chunkSize: int = 2048) -> None:
+        if workers < 1:
+            raise ValueError("Miner needs at least one worker")
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.cancelled = False
+        self._found = multiprocessing.Value("q", self.NONCE_LIMIT)
+        self._pool = None
+
+    def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def cancel(self) -> None:
+        # Every nonce is above -1, so all running ranges give up
+        self.cancelled = True
+        with self._found.get_lock():
+            self._found.value = -1
+
+    def search(self, check, start: int = 0) -> int | None:
+        # A cancel that came before the search still stops it, the state of an
+        # earlier search doesn't carry over
+        with self._found.get_lock():
+            if not self.cancelled:
+                self._found.value = self.NONCE_LIMIT
+        try:
+            return self._search(check, start)
+        finally:
+            with self._found.get_lock():
+                self.cancelled = False
+                self._found.value = self.NONCE_LIMIT
+
+    def _search(self, check, start: int) -> int | None:
+        if self.cancelled:
+            return None
+        if self.workers == 1:
+            return self._searchSerial(check, start)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_initWorker,
+                initargs=(self._found,),
+            )
+        pending = set()
+        nextStart = start
+        best = None
+        try:
+            while True:
+                while len(pending) < self.workers * 2 and (
+                    best is None and not self.cancelled and nextStart < self.NONCE_LIMIT
+                ):
+                    stop = min(nextStart + self.chunkSize, self.NONCE_LIMIT)
+                    pending.add(self._pool.submit(_searchRange, check, nextStart, stop))
+                    nextStart = stop
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    nonce = future.result()
+                    if nonce is not None and (best is None or nonce < best):
+                        best = nonce
+        except BrokenProcessPool:
+            # The next search starts a fresh pool
+            self._pool.shutdown(wait=False)
+            self._pool = None
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+            # Ranges still running give up once they see the found nonce
+            wait(pending)
+        if self.cancelled:
+            return None
+        if best is None:
+            raise ValueError("Nonce space is exhausted")
+        return best
+
+    def _searchSerial(self, check, start: int) -> int | None:
+        # The cancel flag is checked between chunks
+        nextStart = start
+        while nextStart < self.NONCE_LIMIT:
+            if self.cancelled:
+                return None
+            stop = min(nextStart + self.chunkSize, self.NONCE_LIMIT)
+            for nonce in range(nextStart, stop):
+                if check(nonce):
+                    return nonce
+            nextStart = stop
+        raise ValueError("Nonce space is exhausted")
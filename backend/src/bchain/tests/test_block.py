@@ -1,6 +1,13 @@
 import pytest
+import asyncio
+import base64
+import hashlib
+import operator
+import pickle
+from functools import partial
 from backend.src.bchain.constants import Constants
 from backend.src.bchain.block import Block, TransactionList
+from backend.src.bchain.miner import Miner
 from backend.src.bchain.transaction import TTypes, Transaction, Address
 from ellipticcurve import PrivateKey, PublicKey
 
@@ -79,3 +86,95 @@ class TestBlock:
             == Address(pkey=self.pkeyMiner).getAddr()
         )
         assert block.validate()
+
+    def test_ParallelMine(self):
+        trlist = TransactionList.create(self.ckeyMiner, None, self.tr)
+        serial = Block(1, self.initBlock.hash, trlist)
+        parallel = Block(1, self.initBlock.hash, trlist)
+        asyncio.run(serial.mine())
+        asyncio.run(parallel.mine(workers=2))
+
+        assert parallel.data["nonce"] == serial.data["nonce"]
+        assert parallel.hash == serial.hash
+        assert parallel.validate()
+
+    def test_MinerReuse(self):
+        # The nonce found first mustn't cut the next search short, a cancel
+        # only stops the search it was meant for
+        for workers in (1, 2):
+            miner = Miner(workers, chunkSize=64)
+            try:
+                assert miner.search(partial(operator.le, 100)) == 100
+                pool = miner._pool
+                assert miner.search(partial(operator.le, 5000)) == 5000
+                miner.cancel()
+                assert miner.search(partial(operator.le, 10)) is None
+                assert miner.search(partial(operator.le, 10)) == 10
+                # One pool for every search, none for a single worker
+                assert miner._pool is pool
+                assert (pool is None) == (workers == 1)
+            finally:
+                miner.close()
+
+    def test_HeaderHash(self):
+        block = Block(1, self.initBlock.hash, TransactionList.create(self.ckeyMiner))
+        asyncio.run(block.mine())
+
+        nonce = block.data["nonce"].to_bytes(8, "big")
+        assert block.hash == hashlib.sha256(block.header.prefix + nonce).hexdigest()
+        assert bytes.fromhex(block.hash) < Constants.Target()
+        assert block.hash.startswith("0" * Constants.Difficulty())
+        assert Block.fromDatastring(block.datastring, block.hash).hash == block.hash
+
+    def test_LegacyDatastring(self):
+        data = self.initBlock.data.copy()
+        data.pop("version")
+        datastring = base64.b64encode(pickle.dumps(data)).decode("ascii")
+        hash = hashlib.sha256(datastring.encode("utf-8")).hexdigest()
+
+        block = Block.fromDatastring(datastring, hash)
+        assert block.data["version"] == 1
+        assert block.datastring == datastring
+        assert block.validate()
+
+    def test_BinaryOnly(self):
+        # Datastrings from peers: legacy blocks and transactions are pickles
+        data = self.initBlock.data.copy()
+        data.pop("version")
+        legacy = base64.b64encode(pickle.dumps(data)).decode("ascii")
+        with pytest.raises(ValueError):
+            Block.fromDatastring(legacy, "", binary=True)
+
+        tr = self.initBlock.getTransaction(0)
+        old = Transaction.fromDatastring(tr.datastring, tr.signature)
+        old = Transaction(
+            old.data["ttype"],
+            old.data["fromAddr"],
+            old.data["toAddr"],
+            self.pkeyMiner,
+            old.data["value"],
+            old.data["fee"],
+            self.ckeyMiner,
+            version=1,
+        )
+        block = Block(0, "", TransactionList(old))
+        block.solve()
+        assert Block.fromDatastring(block.datastring, block.hash).hash == block.hash
+        with pytest.raises(ValueError):
+            Block.fromDatastring(block.datastring, block.hash, binary=True)
+
+    def test_BinaryDatastring(self):
+        block = Block(1, self.initBlock.hash, TransactionList.create(self.ckeyMiner))
+        asyncio.run(block.mine())
+        raw = base64.b64decode(block.datastring)
+
+        assert raw.startswith(Block.MAGIC)
+        assert block.hash == hashlib.sha256(raw).hexdigest()
+        assert raw[:-8] == block.header.prefix
+        imported = Block.fromDatastring(block.datastring, block.hash)
+        assert imported.data["version"] == Constants.BlockVersion()
+        assert imported.data["nonce"] == block.data["nonce"]
+        assert imported.getTransaction(1).signature == block.getTransaction(1).signature
+
+        older = Block(1, self.initBlock.hash, block.data["transactionList"], version=2)
+        assert Block.fromDatastring(older.datastring, older.hash).hash == older.hash
@@ -0,0 +1,126 @@
+import asyncio
+from backend.src.bchain.block import Block
+from backend.src.bchain.chain import Chain
+from backend.src.bchain.transaction import TTypes, Transaction, Address
+from ellipticcurve import PrivateKey
+
+
+class TestChain:
+    ckeyFrom = PrivateKey()
+    pkeyFrom = ckeyFrom.publicKey()
+    addrFrom = Address(pkey=pkeyFrom)
+    addrTo = Address(pkey=PrivateKey().publicKey())
+
+    ckeyMiner = PrivateKey()
+
+    initBlock = Block.createInit(ckeyMiner)
+    tr = Transaction(TTypes.transfer, addrFrom, addrTo, pkeyFrom, 100, 1, ckeyFrom)
+    block = asyncio.run(Block.construct(1, initBlock.hash, ckeyMiner, tr))
+
+    def test_Lookups(self):
+        chain = Chain([self.initBlock])
+        assert chain.add_block(self.block)
+
+        assert chain.find_block_by_id(0) is self.initBlock
+        assert chain.find_block_by_id(1) is self.block
+        assert chain.find_block_by_id(2) is None
+        assert chain.find_block_by_hash(self.block.hash) is self.block
+        assert chain.find_block_by_hash("0" * 64) is None
+
+        assert chain.find_block_by_transaction(self.tr.signature) is self.block
+        assert chain.find_transaction(self.tr.txid).datastring == self.tr.datastring
+        assert chain.find_transaction(self.tr.signature).txid == self.tr.txid
+        assert chain.find_transaction("missing") is None
+
+    def test_AddBlock(self):
+        chain = Chain([self.initBlock])
+        assert chain.validated_height == -1
+        assert chain.validate()
+        assert chain.validated_height == 0
+
+        unlinked = asyncio.run(Block.construct(1, "0" * 64, self.ckeyMiner, self.tr))
+        skipped = asyncio.run(
+            Block.construct(2, self.initBlock.hash, self.ckeyMiner, self.tr)
+        )
+        assert not chain.add_block(unlinked)
+        assert not chain.add_block(skipped)
+        assert chain.add_block(self.block)
+        assert not chain.add_block(self.block)
+        assert chain.validated_height == 1
+        assert len(chain) == 2
+
+        assert Chain([self.initBlock, self.block]).validate()
+        assert not Chain([self.initBlock, unlinked]).validate()
+        assert chain.validate(full=True)
+
+    def test_ValidateOnce(self):
+        blocks = [self.initBlock]
+        for value in (1, 2, 3):
+            tr = Transaction(
+                TTypes.transfer,
+                self.addrFrom,
+                self.addrTo,
+                self.pkeyFrom,
+                value,
+                1,
+                self.ckeyFrom,
+            )
+            blocks.append(
+                asyncio.run(Block.construct(value, blocks[-1].hash, self.ckeyMiner, tr))
+            )
+        maxsize = Transaction.verified.maxsize
+        try:
+            # Windows of two blocks, smaller than the chain
+            Transaction.verified.maxsize = 6
+            for workers in (1, 2):
+                Transaction.verified.clear()
+                decoded = [
+                    Block.fromDatastring(block.datastring, block.hash, verify=False)
+                    for block in blocks
+                ]
+                assert Transaction.verified.stats()["misses"] == 0
+                assert Chain(decoded).validate(workers)
+                assert Transaction.verified.stats()["misses"] == 9
+        finally:
+            Transaction.verified.maxsize = maxsize
+
+    def test_Reorganize(self):
+        chain = Chain([self.initBlock, self.block])
+        assert chain.validate()
+        assert chain.work == 2 * self.block.getWork()
+
+        trs = [
+            Transaction(
+                TTypes.transfer,
+                self.addrFrom,
+                self.addrTo,
+                self.pkeyFrom,
+                5,
+                1,
+                self.ckeyFrom,
+            )
+            for _ in range(2)
+        ]
+        first = asyncio.run(
+            Block.construct(1, self.initBlock.hash, self.ckeyMiner, trs[0])
+        )
+        second = asyncio.run(Block.construct(2, first.hash, self.ckeyMiner, trs[1]))
+        branch = Chain([self.initBlock, first, second])
+        assert branch > chain and chain < branch
+
+        # Same work as the current chain is not enough
+        assert not chain.reorganize([first])
+        assert chain.most_recent_block() is self.block
+
+        unlinked = asyncio.run(Block.construct(2, "0" * 64, self.ckeyMiner, trs[1]))
+        assert not chain.reorganize([first, unlinked])
+        assert chain.most_recent_block() is self.block
+        assert chain.find_transaction(self.tr.txid) is not None
+        assert chain.validated_height == 1
+
+        assert chain.reorganize([first, second])
+        assert len(chain) == 3
+        assert chain.work == branch.work
+        assert chain.find_transaction(self.tr.txid) is None
+        assert chain.find_block_by_id(1) is first
+        assert chain.validated_height == 2
@@ -1,8 +1,18 @@
 import pytest
+import base64
+import pickle
+from datetime import datetime, timedelta, timezone
 from ellipticcurve import PrivateKey, PublicKey
 from backend.src.bchain.transaction import Address, Transaction, TTypes
 from backend.src.bchain.constants import Constants
 
+ran = []
+
+class Payload():
+    # Unpickling calls ran.append
+    def __reduce__(self):
+        return (ran.append, (1,))
+
 class TestConstants():
     def test_creationReward(self):
         assert Constants.CreationReward() == 100
@@ -89,3 +99,73 @@ class TestTransaction():
         
         Transaction.fromDatastring(datastring1, signature1)
         Transaction.fromDatastring(datastring2, signature2)
+
+    def test_verifiedCache(self):
+        t1 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 100, 1, self.ckeyFrom)
+        t2 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 1000, 1, self.ckeyFrom)
+        hits = Transaction.verified.hits
+        misses = Transaction.verified.misses
+
+        Transaction.fromDatastring(t1.datastring, t1.signature)
+        assert Transaction.validate(t1.datastring, t1.signature)
+        assert Transaction.verified.hits == hits + 2
+        assert Transaction.verified.misses == misses
+
+        with pytest.raises(Exception):
+            Transaction.validate(t1.datastring, t2.signature)
+        assert Transaction.verified.misses == misses + 1
+
+    def test_validateBatch(self):
+        t1 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 100, 1, self.ckeyFrom)
+        t2 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 1000, 1, self.ckeyFrom)
+        good = [(t1.datastring, t1.signature), (t2.datastring, t2.signature)]
+        bad = good + [(t1.datastring, t2.signature), (t2.datastring, t1.signature)]
+
+        Transaction.verified.clear()
+        assert Transaction.validateBatch(good, workers=2)
+        assert Transaction.verified.stats()["size"] == 2
+
+        with pytest.raises(ValueError) as serial:
+            Transaction.validateBatch(bad)
+        with pytest.raises(ValueError) as parallel:
+            Transaction.validateBatch(bad, workers=2)
+        assert str(serial.value) == str(parallel.value)
+        errors = Transaction.verifyBatch(bad, workers=2)
+        assert errors[:2] == [None, None] and all(errors[2:])
+
+        # One miss per unverified pair, whatever the worker count
+        for workers in (1, 2):
+            Transaction.verified.clear()
+            Transaction.verifyBatch(good, workers=workers)
+            assert Transaction.verified.stats()["misses"] == 2
+
+    def test_binaryDatastring(self):
+        stamp = datetime(2023, 11, 26, 16, 2, 13, 123456, tzinfo=timezone(timedelta(hours=3)))
+        t1 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 100, 1, self.ckeyFrom, msg="hi", timestamp=stamp)
+        assert base64.b64decode(t1.datastring).startswith(Transaction.MAGIC)
+
+        data = Transaction.decodeDatastring(t1.datastring)
+        assert data["ttype"] == TTypes.transfer
+        assert data["timestamp"] == stamp
+        assert data["fromAddr"].getAddr() == self.addrFrom.getAddr()
+        assert data["pkey"] == self.pkeyFrom.toCompressed()
+        assert data["msg"] == "hi"
+        assert Transaction.fromDatastring(t1.datastring, t1.signature).datastring == t1.datastring
+
+    def test_legacyDatastring(self):
+        t1 = Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 100, 1, self.ckeyFrom, version=1)
+        data = pickle.loads(base64.b64decode(t1.datastring))
+        assert "version" not in data
+        t2 = Transaction.fromDatastring(t1.datastring, t1.signature)
+        assert "version" not in t2.data
+        assert t2.datastring == t1.datastring
+        assert Transaction.isBinary(Transaction(TTypes.transfer, self.addrFrom, self.addrTo, self.pkeyFrom, 100, 1, self.ckeyFrom).datastring)
+        assert not Transaction.isBinary(t1.datastring)
+
+    def test_legacyPayload(self):
+        datastring = base64.b64encode(pickle.dumps(Payload())).decode("ascii")
+        with pytest.raises(ValueError):
+            Transaction.decodeDatastring(datastring)
+        errors = Transaction.verifyBatch([(datastring, "x")])
+        assert isinstance(errors[0], ValueError)
+        assert ran == []
@@ -1,10 +1,18 @@
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from ellipticcurve import PrivateKey, PublicKey, Ecdsa, Signature
-from pickle import dumps, loads
+from pickle import dumps, Unpickler
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 import type_enforced
 import base64
+import hashlib
+import io
+import time
 from backend.src.bchain.constants import Constants
+from backend.src.bchain.encoding import Writer, Reader
 
 
 class TTypes(Enum):
@@ -51,10 +59,81 @@ class Address:
         return ret
 
 
+_EPOCH = datetime(1970, 1, 1)
+_NAIVE = -(2**15)
+
+
+# Worker count -> process pool, starting processes costs more than a batch
+_pools: dict = {}
+
+
+def _getPool(workers: int) -> ProcessPoolExecutor:
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return pool
+
+
+def _verifyChunk(pairs: list) -> list:
+    ret = []
+    for datastring, signature in pairs:
+        try:
+            Transaction.verify(datastring, signature)
+            ret.append(None)
+        except Exception as e:
+            ret.append(e)
+    return ret
+
+
+class VerifiedCache:
+    __slots__ = ["maxsize", "hits", "misses", "_data"]
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    @staticmethod
+    def key(datastring: str, signature: str) -> tuple:
+        return (hashlib.sha256(datastring.encode("utf-8")).digest(), signature)
+
+    def lookup(self, key: tuple) -> bool:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key: tuple) -> None:
+        self._data[key] = None
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
 @type_enforced.Enforcer
 class Transaction:
     __slots__ = ["data", "_datastring", "_signature"]
 
+    verified = VerifiedCache(Constants.VerifiedCacheSize())
+    # Called with the seconds a successful uncached validation took
+    onVerify = None
+
     def __init__(
         self,
         ttype,
@@ -64,13 +143,24 @@ class Transaction:
         value: int,
         fee: int,
         ckey: [None, PrivateKey] = None,
-        msg: [None, object] = None,
+        msg: [None, str, bytes] = None,
         datastring: [None, str] = None,
         timestamp: [None, datetime] = None,
         signature: [None, str] = None,
+        version: int = Constants.TransactionVersion(),
+        verify: bool = True,
     ) -> None:
         self.data = dict.fromkeys(
-            ["ttype", "timestamp", "fromAddr", "toAddr", "pkey", "value", "fee", "msg"]
+            [
+                "ttype",
+                "timestamp",
+                "fromAddr",
+                "toAddr",
+                "pkey",
+                "value",
+                "fee",
+                "msg",
+            ]
         )
         self.data["ttype"] = ttype
         self.data["timestamp"] = timestamp if timestamp else datetime.now()
@@ -83,6 +173,9 @@ class Transaction:
         self.data["value"] = value
         self.data["fee"] = fee
         self.data["msg"] = msg
+        if version >= 2:
+            # Legacy transactions keep the exact dict layout they were pickled with
+            self.data["version"] = version
 
         self._datastring = self.encodeDatastring(self.data)
         if datastring and datastring != self._datastring:
@@ -90,7 +183,8 @@ class Transaction:
                 "Datastrings from created and imported transactions don't match"
             )
         self._signature = signature or Ecdsa.sign(self._datastring, ckey).toBase64()
-        if not self.validate(self._datastring, self._signature):
+        # Without verify the caller checks the signature later, e.g. in a batch
+        if verify and not self.validate(self._datastring, self._signature):
             raise ValueError("Validation of a transaction has failed")
 
     @property
@@ -101,14 +195,29 @@ class Transaction:
     def signature(self) -> str:
         return self._signature
 
+    @property
+    def txid(self) -> str:
+        return hashlib.sha256(self._datastring.encode("utf-8")).hexdigest()
+
     @classmethod
-    def fromDatastring(cls, datastring: str, signature: str):
+    def fromDatastring(cls, datastring: str, signature: str, verify: bool = True):
         data = cls.decodeDatastring(datastring)
-        return cls(**data, datastring=datastring, signature=signature)
+        return cls(**data, datastring=datastring, signature=signature, verify=verify)
 
     @classmethod
     def validate(cls, datastring: str, signature: str) -> bool:
+        key = cls.verified.key(datastring, signature)
+        if cls.verified.lookup(key):
+            return True
+        ret = cls.verify(datastring, signature)
+        cls.verified.add(key)
+        return ret
+
+    @classmethod
+    def verify(cls, datastring: str, signature: str) -> bool:
+        # validate without the verified cache
         ret = True
+        begin = time.perf_counter()
         data = cls.decodeDatastring(datastring)
         if (
             data["ttype"] != TTypes.creationReward and data["ttype"] != TTypes.fee
@@ -147,16 +256,155 @@ class Transaction:
         if data["ttype"] == TTypes.fee and data["fee"] != 0:
             ret = False
             raise ValueError("Fee must be 0 for transactions with a type fee")
+        if cls.onVerify is not None:
+            cls.onVerify(time.perf_counter() - begin)
         return ret
 
-    @staticmethod
-    def encodeDatastring(data: dict) -> str:
-        ret = dumps(data)
+    @classmethod
+    def verifyBatch(cls, pairs: list, workers: int = 1, pool=None) -> list:
+        # Returns an exception or None for every (datastring, signature) pair.
+        # Each pair is looked up once, misses go straight to verify. Parallel
+        # batches run in `pool` or in a pool kept per worker count.
+        ret = [None] * len(pairs)
+        keys = [cls.verified.key(*pair) for pair in pairs]
+        todo = [i for i, key in enumerate(keys) if not cls.verified.lookup(key)]
+        if (pool is None and workers <= 1) or len(todo) <= 1:
+            for i in todo:
+                try:
+                    cls.verify(*pairs[i])
+                    cls.verified.add(keys[i])
+                except Exception as e:
+                    ret[i] = e
+            return ret
+
+        size = -(-len(todo) // (workers * 4))
+        chunks = [todo[i : i + size] for i in range(0, len(todo), size)]
+        if pool is None:
+            pool = _getPool(workers)
+        try:
+            results = list(
+                pool.map(_verifyChunk, [[pairs[i] for i in c] for c in chunks])
+            )
+        except BrokenProcessPool:
+            # The next batch gets a fresh pool
+            if _pools.get(workers) is pool:
+                del _pools[workers]
+            raise
+        for chunk, errors in zip(chunks, results):
+            for i, error in zip(chunk, errors):
+                ret[i] = error
+                if error is None:
+                    cls.verified.add(keys[i])
+        return ret
+
+    @classmethod
+    def validateBatch(cls, pairs: list, workers: int = 1, pool=None) -> bool:
+        # Raises the error of the first bad pair, just like validating in order
+        for error in cls.verifyBatch(pairs, workers, pool):
+            if error is not None:
+                raise error
+        return True
+
+    MAGIC = b"BT"
+
+    @classmethod
+    def encodeDatastring(cls, data: dict) -> str:
+        if data.get("version", 1) < 2:
+            ret = dumps(data)
+        else:
+            ret = _encodeBinary(data)
         ret = base64.b64encode(ret).decode("ascii")
         return ret
 
-    @staticmethod
-    def decodeDatastring(datastring: str) -> dict:
+    @classmethod
+    def decodeDatastring(cls, datastring: str) -> dict:
         ret = base64.b64decode(datastring)
-        ret = loads(ret)
+        if ret[: len(cls.MAGIC)] == cls.MAGIC:
+            return _decodeBinary(ret)
+        ret = legacyLoads(ret)
+        ret.setdefault("version", 1)
         return ret
+
+    @classmethod
+    def isBinary(cls, datastring: str) -> bool:
+        # Datastrings from the network must be binary, legacy ones are pickles
+        try:
+            return base64.b64decode(datastring[:4])[: len(cls.MAGIC)] == cls.MAGIC
+        except ValueError:
+            return False
+
+
+def _encodeBinary(data: dict) -> bytes:
+    ttype = data["ttype"]
+    timestamp = data["timestamp"]
+    offset = timestamp.utcoffset()
+    if offset is None:
+        offset = _NAIVE
+    elif offset % timedelta(minutes=1):
+        raise ValueError("Timestamp offset must be a whole number of minutes")
+    else:
+        offset //= timedelta(minutes=1)
+    micros = (timestamp.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+    ret = Writer()
+    ret.parts.append(Transaction.MAGIC)
+    ret.pack(
+        "BBqh",
+        data["version"],
+        ttype.value if isinstance(ttype, TTypes) else ttype,
+        micros,
+        offset,
+    )
+    for addr in (data["fromAddr"], data["toAddr"]):
+        ret.string(None if addr is None else addr.address)
+    ret.string(data["pkey"])
+    ret.pack("qq", data["value"], data["fee"])
+    ret.message(data["msg"])
+    return ret.getvalue()
+
+
+@lru_cache(maxsize=4096)
+def _address(address: str) -> Address:
+    # Addresses repeat across transactions and are never mutated
+    return Address(address=address)
+
+
+def _decodeBinary(raw: bytes) -> dict:
+    reader = Reader(raw, len(Transaction.MAGIC))
+    version, ttype, micros, offset = reader.unpack("BBqh")
+    timestamp = _EPOCH + timedelta(microseconds=micros)
+    if offset != _NAIVE:
+        timestamp = timestamp.replace(tzinfo=timezone(timedelta(minutes=offset)))
+    ret = {"ttype": TTypes(ttype), "timestamp": timestamp}
+    for key in ("fromAddr", "toAddr"):
+        addr = reader.string()
+        ret[key] = None if addr is None else _address(addr)
+    ret["pkey"] = reader.string()
+    ret["value"], ret["fee"] = reader.unpack("qq")
+    ret["msg"] = reader.message()
+    ret["version"] = version
+    reader.end()
+    return ret
+
+
+# (last module name, class name) -> class, everything a legacy transaction or
+# block is pickled with. The module path depends on how the node was started.
+LEGACY_CLASSES = {
+    ("datetime", "datetime"): datetime,
+    ("transaction", "TTypes"): TTypes,
+    ("transaction", "Address"): Address,
+    ("transaction", "Transaction"): Transaction,
+}
+
+
+class _LegacyUnpickler(Unpickler):
+    # A pickle can call anything while loading, so only the classes above
+    # are resolved
+    def find_class(self, module: str, name: str):
+        cls = LEGACY_CLASSES.get((module.rpartition(".")[2], name))
+        if cls is None:
+            raise ValueError(f"{module}.{name} isn't allowed in a datastring")
+        return cls
+
+
+def legacyLoads(raw: bytes):
+    return _LegacyUnpickler(io.BytesIO(raw)).load()
@@ -0,0 +1,411 @@
+import asyncio
+from contextlib import aclosing
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import backend.crud as crud
+from backend.cache import chain_tip_cache, block_cache
+from backend.core.config import settings
+from backend.core.models import db_helper, Block
+from backend.mempool import mempool
+from backend.mining import mining_jobs, block_create
+from backend.schemas import (
+    BlockBody,
+    BlockHeader,
+    ChainTip,
+    PeerStatus,
+    SyncResult,
+    TransactionCreate,
+)
+from backend.src.bchain import (
+    Block as BlockClass,
+    Transaction as TransactionClass,
+    Chain,
+)
+from backend.workers import batch_pool
+
+PEER_ERRORS = (httpx.HTTPError, ValueError)
+
+
+class ChainSync:
+    # Headers first from the peer with the most work, then bodies in windows
+    # spread over every peer that is ahead. Downloads, validation (in the
+    # batch pool) and insertion of consecutive windows overlap. A heavier chain
+    # that forks below our tip replaces only our blocks above the fork.
+
+    def __init__(
+        self,
+        peers: list[str],
+        timeout: float,
+        connections: int,
+        header_batch: int,
+        window: int,
+        parallel: int,
+    ) -> None:
+        self.peers = peers
+        self.timeout = timeout
+        self.connections = connections
+        self.header_batch = header_batch
+        self.window = window
+        self.parallel = parallel
+        self.client: httpx.AsyncClient | None = None
+        self.last: SyncResult | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def open(self) -> None:
+        # One pool for all peers, connections are kept alive between requests
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.connections,
+                max_keepalive_connections=self.connections,
+            ),
+        )
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method: str, peer: str, path: str, **kwargs):
+        response = await self.client.request(method, peer.rstrip("/") + path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def tip(self, peer: str) -> PeerStatus:
+        try:
+            tip = ChainTip.model_validate(
+                await self.request("GET", peer, "/chain/tip/")
+            )
+        except PEER_ERRORS as e:
+            return PeerStatus(url=peer, error=str(e) or type(e).__name__)
+        return PeerStatus(url=peer, tip=tip)
+
+    async def headers(self, peer: str, locator: list[str]) -> list[BlockHeader]:
+        ret = []
+        while True:
+            page = [
+                BlockHeader.model_validate(header)
+                for header in await self.request(
+                    "GET",
+                    peer,
+                    "/chain/headers/",
+                    params={"locator": locator, "limit": self.header_batch},
+                )
+            ]
+            self.checkHeaders(ret[-1] if ret else None, page)
+            ret += page
+            if len(page) < self.header_batch:
+                return ret
+            locator = [page[-1].hash]
+
+    @staticmethod
+    def checkHeaders(prev: BlockHeader | None, headers: list[BlockHeader]) -> None:
+        # Catches a wrong chain before any body is downloaded, the bodies are
+        # fully validated later
+        for header in headers:
+            if prev is not None and (
+                header.height != prev.height + 1 or header.prevHash != prev.hash
+            ):
+                raise ValueError(f"Header {header.height} doesn't follow the previous")
+            if header.height > 0 and not BlockClass.checkHash(header.hash):
+                raise ValueError(f"Header {header.height} hasn't been mined")
+            prev = header
+
+    async def bodies(
+        self, peers: list[str], headers: list[BlockHeader], num: int
+    ) -> list[BlockBody]:
+        # Window num goes to peer num first, the others are fallbacks
+        hashes = [header.hash for header in headers]
+        for attempt in range(len(peers)):
+            peer = peers[(num + attempt) % len(peers)]
+            try:
+                bodies = [
+                    BlockBody.model_validate(body)
+                    for body in await self.request(
+                        "POST", peer, "/chain/bodies/", json=hashes
+                    )
+                ]
+            except PEER_ERRORS:
+                continue
+            if [body.hash for body in bodies] == hashes:
+                return bodies
+        raise ValueError(
+            f"No peer served blocks {headers[0].height}-{headers[-1].height}"
+        )
+
+    @staticmethod
+    def validate(
+        prev: BlockClass | None,
+        bodies: list[BlockBody],
+        workers: int = 1,
+        pool=None,
+    ) -> list[BlockClass]:
+        # Decoded unverified, validate_links checks every signature once. Only
+        # the binary encoding is taken from peers, legacy ones are pickles.
+        blocks = [
+            BlockClass.fromDatastring(
+                body.datastring, body.hash, verify=False, binary=True
+            )
+            for body in bodies
+        ]
+        if prev is None and blocks and blocks[0].data["id"] != 0:
+            raise ValueError("Chain doesn't start with a genesis block")
+        ret = list(Chain.validate_links(prev, blocks, workers, pool))
+        if len(ret) != len(blocks):
+            raise ValueError(
+                f"Block {blocks[len(ret)].data['id']} doesn't follow the previous"
+            )
+        return ret
+
+    async def store(self, blocks: list[BlockClass]) -> None:
+        async with mining_jobs.commit_lock:
+            async with db_helper.session_factory() as session:
+                for block in blocks:
+                    tip_hash = await crud.get_last_block_hash(session)
+                    if tip_hash is not None and tip_hash != block.data["prevHash"]:
+                        raise ValueError("Chain tip has changed while syncing")
+                    await store_block(session, block)
+        mining_jobs.tip_changed(blocks[-1].hash)
+
+    async def fetch(
+        self, peers: list[str], headers: list[BlockHeader], prev: BlockClass | None
+    ):
+        # Yields the validated windows in order
+        windows = [
+            headers[i : i + self.window] for i in range(0, len(headers), self.window)
+        ]
+        tasks = []
+        try:
+            for num in range(len(windows)):
+                # At most `parallel` windows are downloading or waiting
+                while len(tasks) < min(num + self.parallel, len(windows)):
+                    tasks.append(
+                        asyncio.create_task(
+                            self.bodies(peers, windows[len(tasks)], len(tasks))
+                        )
+                    )
+                bodies = await tasks[num]
+                blocks = await batch_pool.run(self.validate, prev, bodies)
+                yield blocks
+                prev = blocks[-1]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def download(
+        self, peers: list[str], headers: list[BlockHeader], prev: BlockClass | None
+    ) -> None:
+        storing = None
+        try:
+            async with aclosing(self.fetch(peers, headers, prev)) as windows:
+                async for blocks in windows:
+                    if storing is not None:
+                        await storing
+                    storing = asyncio.create_task(self.store(blocks))
+            if storing is not None:
+                await storing
+        finally:
+            if storing is not None and not storing.done():
+                storing.cancel()
+
+    async def reorganize(
+        self,
+        peers: list[str],
+        headers: list[BlockHeader],
+        fork: Block | None,
+        tip_hash: str,
+    ) -> int:
+        # The whole new branch is validated before anything is touched. Then
+        # the blocks above the fork are disconnected newest first using their
+        # undo records and the new ones connected, all in one DB transaction.
+        prev = None
+        if fork is not None:
+            # Stored blocks were checked when they came in
+            prev = BlockClass.fromDatastring(fork.datastring, fork.hash, verify=False)
+        blocks = []
+        async with aclosing(self.fetch(peers, headers, prev)) as windows:
+            async for window in windows:
+                blocks += window
+        async with mining_jobs.commit_lock:
+            async with db_helper.session_factory() as session:
+                if await crud.get_last_block_hash(session) != tip_hash:
+                    raise ValueError("Chain tip has changed while syncing")
+                try:
+                    disconnected = await crud.get_blocks_after(
+                        session, -1 if fork is None else fork.height
+                    )
+                    pending = []
+                    for block_id, prev_hash in disconnected:
+                        pending += await crud.disconnect_block(
+                            session, block_id, prev_hash
+                        )
+                    for block in blocks:
+                        await store_block(session, block, commit=False)
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+                chain_tip_cache.clear()
+                # The rows of disconnected blocks are gone, SQLite may give
+                # their ids to the new ones
+                for block_id, _ in disconnected:
+                    block_cache.discard(block_id)
+                for block in blocks:
+                    for num in range(block.getTransactionListLen()):
+                        mempool.discard(block.getTransaction(num).txid)
+                await crud.readd_to_mempool(session, pending)
+        mining_jobs.tip_changed(blocks[-1].hash)
+        return len(disconnected)
+
+    async def sync(self) -> SyncResult:
+        async with self._lock:
+            self.last = await self._sync()
+        return self.last
+
+    async def _sync(self) -> SyncResult:
+        peers = list(await asyncio.gather(*(self.tip(peer) for peer in self.peers)))
+        async with db_helper.session_factory() as session:
+            tip = await crud.get_chain_tip(session)
+            locator = await crud.get_locator(session)
+            prev = await crud.get_last_block(session)
+            if prev is not None:
+                prev = BlockClass.fromDatastring(
+                    prev.datastring, prev.hash, verify=False
+                )
+        length = tip.length if tip is not None else 0
+        work = int(tip.work, 16) if tip is not None else 0
+        ret = SyncResult(
+            status="up_to_date", height=None if tip is None else tip.height, peers=peers
+        )
+        ahead = sorted(
+            (
+                peer
+                for peer in peers
+                if peer.tip is not None and int(peer.tip.work, 16) > work
+            ),
+            key=lambda peer: int(peer.tip.work, 16),
+            reverse=True,
+        )
+        for peer in ahead:
+            try:
+                headers = await self.headers(peer.url, locator)
+            except PEER_ERRORS as e:
+                peer.error = str(e)
+                ret.status = "failed"
+                continue
+            if not headers:
+                continue
+            if tip is None:
+                extends = headers[0].height == 0
+            else:
+                extends = headers[0].prevHash == tip.hash
+            fork = None
+            if not extends and headers[0].height > 0:
+                async with db_helper.session_factory() as session:
+                    fork = await crud.get_block_by_hash(session, headers[0].prevHash)
+                if fork is None or fork.height != headers[0].height - 1:
+                    peer.error = "Headers don't connect to our chain"
+                    ret.status = "failed"
+                    continue
+            # Every block has the same work, so the heavier branch is the
+            # longer one
+            if not extends and headers[-1].height <= tip.height:
+                peer.error = f"Chain diverges below height {length} and isn't heavier"
+                ret.status = "diverged"
+                continue
+            ret.peer = peer.url
+            break
+        else:
+            return ret
+
+        urls = [ret.peer] + [peer.url for peer in ahead if peer.url != ret.peer]
+        try:
+            if extends:
+                await self.download(urls, headers, prev)
+            else:
+                ret.disconnected = await self.reorganize(urls, headers, fork, tip.hash)
+        except Exception as e:
+            ret.status = "failed"
+            ret.error = str(e)
+        else:
+            ret.status = "synced" if extends else "reorganized"
+        async with db_helper.session_factory() as session:
+            tip = await crud.get_chain_tip(session)
+        ret.height = None if tip is None else tip.height
+        ret.blocks = (tip.length if tip is not None else 0) - length + ret.disconnected
+        return ret
+
+
+def transaction_create(
+    tr: TransactionClass, address_ids: dict[str, int]
+) -> TransactionCreate:
+    return TransactionCreate(
+        ttype=tr.data["ttype"].value,
+        fromAddr=(
+            None
+            if tr.data["fromAddr"] is None
+            else address_ids[tr.data["fromAddr"].address]
+        ),
+        toAddr=address_ids[tr.data["toAddr"].address],
+        value=tr.data["value"],
+        fee=tr.data["fee"],
+        ttimestamp=tr.data["timestamp"],
+        pkey=tr.data["pkey"],
+        data=tr.datastring,
+        signature=tr.signature,
+    )
+
+
+async def store_block(
+    session: AsyncSession, block: BlockClass, commit: bool = True
+) -> Block:
+    # Pending transactions that are already stored keep their rows, the rest
+    # are inserted in the block's DB transaction
+    tr_list = [
+        block.getTransaction(num) for num in range(block.getTransactionListLen())
+    ]
+    address_ids = await crud.get_or_create_addresses(
+        session,
+        {
+            addr.address
+            for tr in tr_list
+            for addr in (tr.data["fromAddr"], tr.data["toAddr"])
+            if addr is not None
+        },
+    )
+    known = await crud.get_transactions_by_signatures(
+        session, [tr.signature for tr in tr_list]
+    )
+    ids = [None] * len(tr_list)
+    new = []
+    for num, tr in enumerate(tr_list):
+        if tr.signature in known:
+            ids[num] = known[tr.signature][0]
+        else:
+            new.append(num)
+    created = await crud.create_transactions(
+        session=session,
+        transactions_inp=[transaction_create(tr_list[num], address_ids) for num in new],
+        commit=False,
+    )
+    for num, id in zip(new, created):
+        ids[num] = id
+    return await crud.create_block(
+        session=session, block_inp=block_create(block, ids), commit=commit
+    )
+
+
+chain_sync = ChainSync(
+    peers=settings.peers,
+    timeout=settings.sync_timeout,
+    connections=settings.sync_connections,
+    header_batch=settings.sync_header_batch,
+    window=settings.sync_window,
+    parallel=settings.sync_parallel,
+)
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from backend.cache import chain_tip_cache
+from backend.core.models import DatabaseHelper
+from backend.mempool import mempool
+from backend.migrations import migrate
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A migrated SQLite database of its own for every test. Tests drive it
+    # from their own asyncio.run, aiosqlite connections aren't tied to a loop.
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{tmp_path}/test.sqlite3")
+    asyncio.run(migrate(helper.engine))
+    chain_tip_cache.clear()
+    mempool.clear()
+    yield helper
+    asyncio.run(helper.engine.dispose())
+    chain_tip_cache.clear()
+    mempool.clear()
+
+
+@pytest.fixture
+def session(database):
+    session = database.session_factory()
+    yield session
+    asyncio.run(session.close())
@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Node:
+    # A node in its own process with its own database, for multi-node tests
+
+    def __init__(self, path: str, peers: list["Node"] = (), **settings) -> None:
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.peers = list(peers)
+        self.env = dict(os.environ)
+        self.env.update(
+            PYTHONPATH=os.pathsep.join([ROOT, os.path.join(ROOT, "backend")]),
+            DB_URL=f"sqlite+aiosqlite:///{path}/{self.port}.sqlite3",
+        )
+        self.env.update({key.upper(): str(value) for key, value in settings.items()})
+        self.process = None
+        self.client = httpx.Client(base_url=self.url, timeout=30)
+
+    def __enter__(self) -> "Node":
+        # Peers can be added until the node starts, so two nodes can know
+        # each other
+        self.env["PEERS"] = json.dumps([peer.url for peer in self.peers])
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app"]
+            + ["--port", str(self.port), "--log-level", "warning"],
+            cwd=ROOT,
+            env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                self.client.get("/chain/tip/").raise_for_status()
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"Node on port {self.port} didn't start")
+
+    def __exit__(self, *exc) -> None:
+        self.client.close()
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+    def tip(self) -> dict:
+        return self.client.get("/chain/tip/").json()
+
+    def transfer(self) -> dict:
+        # The node's own address 1 pays a new address
+        to_addr = self.client.post("/address/").json()["id"]
+        response = self.client.post(
+            "/transaction/",
+            json={
+                "ttype": 1,
+                "fromAddr": 1,
+                "toAddr": to_addr,
+                "value": 1,
+                "fee": 1,
+                "ttimestamp": "2024-01-01T00:00:00",
+            },
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def mine(self, blocks: int) -> None:
+        for _ in range(blocks):
+            self.transfer()
+            self.client.post("/chain/mine/").raise_for_status()
+
+    def wait(self, check, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while not check():
+            if time.monotonic() > deadline:
+                raise AssertionError("Nodes didn't converge in time")
+            time.sleep(0.1)
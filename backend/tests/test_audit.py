@@ -0,0 +1,109 @@
+import asyncio
+import io
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import update
+
+import backend.audit as audit
+import backend.cli as cli
+import backend.views.admin_views as admin_views
+from backend.archive import ChainImport
+from backend.audit import ChainAudit
+from backend.cache import chain_tip_cache
+from backend.core.models import DatabaseHelper, Transaction
+from backend.tests.test_archive import archive, chain
+from backend.workers import WorkerPool
+
+
+async def stored(helper: DatabaseHelper, blocks: int) -> None:
+    await ChainImport(workers=1, window=2).run(
+        helper.engine, helper.session_factory, io.BytesIO(archive(chain(blocks), 3))
+    )
+    chain_tip_cache.clear()
+
+
+class TestAudit:
+    @staticmethod
+    async def runs(helper, monkeypatch) -> dict:
+        await stored(helper, 5)
+        pool = WorkerPool(workers=2)
+        monkeypatch.setattr(audit, "batch_pool", pool)
+        pool.start()
+        chain_audit = ChainAudit(chunk_size=2)
+        progress = []
+        ret = {}
+        try:
+            ret["ok"] = await chain_audit.run(
+                helper.session_factory,
+                progress=lambda chain_audit: progress.append(chain_audit.checked),
+            )
+            ret["progress"] = progress
+            ret["height"] = chain_audit.height
+            await chain_audit.run(helper.session_factory, after=3)
+            ret["after"] = chain_audit.to_dict()
+            async with helper.session_factory() as session:
+                await session.execute(
+                    update(Transaction)
+                    .where(Transaction.block_id == 4)
+                    .values(signature="x")
+                )
+                await session.commit()
+            ret["tampered"] = await chain_audit.run(helper.session_factory)
+            ret["failed"] = chain_audit.to_dict()
+        finally:
+            await pool.shutdown()
+        return ret
+
+    def test_Run(self, database, monkeypatch):
+        ret = asyncio.run(self.runs(database, monkeypatch))
+        assert ret["ok"] is True
+        # One call per chunk, in order
+        assert ret["progress"] == [2, 4, 5]
+        assert ret["height"] == 4
+        assert ret["after"]["status"] == "ok"
+        assert (ret["after"]["checked"], ret["after"]["total"]) == (2, 2)
+        assert ret["tampered"] is False
+        assert ret["failed"]["status"] == "failed"
+        assert ret["failed"]["checked"] == 3 and ret["failed"]["height"] == 2
+        assert ret["failed"]["error"] == (
+            "Block row 4: Stored transactions don't match the datastring"
+        )
+
+    def test_Cli(self, database, monkeypatch, capsys):
+        asyncio.run(stored(database, 4))
+        monkeypatch.setattr(cli, "db_helper", database)
+        assert cli.main(["audit", "--chunk-size", "3"]) == 0
+        captured = capsys.readouterr()
+        assert captured.out == "Chain is valid up to block 3\n"
+        assert "Checked 4/4 blocks" in captured.err
+
+    @staticmethod
+    async def endpoint(helper, monkeypatch) -> list:
+        await stored(helper, 3)
+        chain_audit = ChainAudit(chunk_size=2)
+        monkeypatch.setattr(admin_views, "db_helper", helper)
+        monkeypatch.setattr(admin_views, "chain_audit", chain_audit)
+        app = FastAPI()
+        app.include_router(admin_views.router)
+        transport = httpx.ASGITransport(app=app)
+        ret = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            response = await c.post("/admin/audit/")
+            ret.append((response.status_code, response.json()["status"]))
+            response = await c.post("/admin/audit/")
+            ret.append((response.status_code, response.json()["detail"]))
+            await chain_audit._task
+            response = await c.get("/admin/audit/")
+            ret.append((response.status_code, response.json()["status"]))
+            ret.append(response.json()["height"])
+        return ret
+
+    def test_Endpoint(self, database, monkeypatch):
+        ret = asyncio.run(self.endpoint(database, monkeypatch))
+        assert ret == [
+            (202, "running"),
+            (409, "Audit is already running"),
+            (200, "ok"),
+            2,
+        ]
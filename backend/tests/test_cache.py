@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+import backend.views.block_views as block_views
+from backend.cache import BlockCache, CachedBlock
+from backend.views.block_views import block_response, etag_matches
+
+
+class TestBlockCache:
+    def test_Eviction(self):
+        cache = BlockCache(2)
+        for i in range(3):
+            cache.add(CachedBlock(i, f"hash{i}", b"{}", i - 1))
+        assert cache.get(0) is None
+        assert cache.get_by_hash("hash0") is None
+        assert cache.get_by_hash("hash1").id == 1
+        cache.add(CachedBlock(3, "hash3", b"{}", 2))
+        assert cache.get(2) is None
+        assert cache.get(1).etag == '"hash1"'
+
+    def test_Discard(self):
+        cache = BlockCache(2)
+        cache.add(CachedBlock(1, "old", b"{}", 0))
+        cache.add(CachedBlock(1, "new", b"{}", 0))
+        assert cache.get_by_hash("old") is None
+        cache.discard(1)
+        assert cache.get(1) is None
+        assert cache.get_by_hash("new") is None
+        assert cache.stats()["size"] == 0
+
+
+class TestBlockResponse:
+    @staticmethod
+    def respond(monkeypatch, tip_height: int, by_hash: bool, if_none_match: str = ""):
+        async def get_chain_tip(session):
+            return SimpleNamespace(height=tip_height)
+
+        monkeypatch.setattr(block_views.crud, "get_chain_tip", get_chain_tip)
+        headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+        request = Request({"type": "http", "headers": headers})
+        entry = CachedBlock(1, "abc", b"{}", 0)
+        return asyncio.run(block_response(request, None, entry, by_hash=by_hash))
+
+    def test_CacheControl(self, monkeypatch):
+        response = self.respond(monkeypatch, 10, by_hash=True)
+        assert (
+            response.headers["cache-control"] == "public, max-age=31536000, immutable"
+        )
+        # A reorg can put another block at the same id
+        response = self.respond(monkeypatch, 10, by_hash=False)
+        assert response.headers["cache-control"] == "public, max-age=60"
+        assert response.headers["etag"] == '"abc"'
+        response = self.respond(monkeypatch, 2, by_hash=True)
+        assert response.headers["cache-control"] == "no-cache"
+
+    def test_NotModified(self, monkeypatch):
+        assert self.respond(monkeypatch, 10, False, '"x", W/"abc"').status_code == 304
+        assert self.respond(monkeypatch, 10, False, '"abcd"').status_code == 200
+        assert self.respond(monkeypatch, 10, False, "*").status_code == 304
+
+    def test_EtagMatches(self):
+        assert etag_matches('"abc"', '"abc"')
+        assert etag_matches('"a", "abc"', '"abc"')
+        assert not etag_matches('"xabcx"', '"abc"')
+        assert not etag_matches('"ab"', '"abc"')
+        assert not etag_matches("", '"abc"')
@@ -0,0 +1,386 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import event, select, func
+
+import backend.crud as crud
+from backend.schemas import BlockCreate, TransactionCreate
+from backend.src.bchain import Constants
+from backend.cache import chain_tip_cache
+from backend.mempool import mempool
+from backend.core.models import (
+    Address,
+    Transaction,
+    Block,
+    BlockUndo,
+    Balance,
+    ChainTip,
+)
+
+
+class TestCrud:
+    @staticmethod
+    async def fill(session, blocks: int) -> None:
+        # Adds blocks of 3 transactions on top of the stored ones
+        addresses = list(await session.scalars(select(Address).order_by(Address.id)))
+        if not addresses:
+            addresses = [Address(address=f"0x{i:040x}", ckey="") for i in range(4)]
+            session.add_all(addresses)
+            await session.flush()
+        start = await session.scalar(select(func.count(Block.id)))
+        blocks += start
+        for i in range(start, blocks):
+            transactions = [
+                Transaction(
+                    ttype=1,
+                    ttimestamp=datetime(2024, 1, 1),
+                    fromAddr_id=addresses[j % 4].id,
+                    toAddr_id=addresses[(j + 1) % 4].id,
+                    pkey="",
+                    value=1,
+                    fee=0,
+                    data="",
+                    signature=f"{i}-{j}",
+                )
+                for j in range(3)
+            ]
+            session.add(
+                Block(
+                    prevHash="",
+                    hash=str(i),
+                    height=i,
+                    nonce=0,
+                    datastring="",
+                    transactionList=transactions,
+                )
+            )
+        await session.flush()
+        await session.merge(
+            ChainTip(
+                id=1,
+                block_id=blocks,
+                height=blocks - 1,
+                hash="",
+                length=blocks,
+                work="",
+            )
+        )
+        await session.commit()
+
+    @classmethod
+    async def countQueries(cls, helper, blocks: int) -> dict:
+        async with helper.session_factory() as session:
+            await cls.fill(session, blocks)
+
+        statements = []
+
+        def listener(*args):
+            statements.append(args[2])
+
+        event.listen(helper.engine.sync_engine, "before_cursor_execute", listener)
+        readers = {
+            "get_blocks": crud.get_blocks,
+            "get_last_block": crud.get_last_block,
+            "get_all_transactions": crud.get_all_transactions,
+            "get_block_by_id": lambda session: crud.get_block_by_id(session, 1),
+        }
+        ret = {}
+        for name, reader in readers.items():
+            async with helper.session_factory() as session:
+                chain_tip_cache.clear()
+                statements.clear()
+                result = await reader(session)
+                for block in result if isinstance(result, list) else [result]:
+                    for tr in getattr(block, "transactionList", [block]):
+                        assert tr.fromAddr.address and tr.toAddr.address
+                ret[name] = len(statements)
+        event.remove(helper.engine.sync_engine, "before_cursor_execute", listener)
+        return ret
+
+    def test_QueryCount(self, database):
+        small = asyncio.run(self.countQueries(database, 2))
+        large = asyncio.run(self.countQueries(database, 18))
+        assert small == large
+        assert max(large.values()) <= 5
+
+    @classmethod
+    async def streamIds(cls, helper, session, chunk_size: int) -> list:
+        await cls.fill(session, 10)
+        page = await crud.get_blocks(session, after=4, limit=3)
+        ret = [block.id for block in page]
+        async for block in crud.stream_rows(
+            helper.session_factory, Block, 2, chunk_size
+        ):
+            ret.append(block.id)
+            assert len(block.transactionList) == 3
+        return ret
+
+    def test_Pagination(self, database, session):
+        ids = asyncio.run(self.streamIds(database, session, 3))
+        assert ids == [5, 6, 7] + list(range(3, 11))
+
+    @staticmethod
+    async def locate(session) -> tuple:
+        # Row ids after a reorg on Postgres, the sequence doesn't reuse ids
+        for height, id in enumerate([1, 2, 8, 9, 10]):
+            session.add(
+                Block(
+                    id=id,
+                    prevHash=str(height - 1),
+                    hash=str(height),
+                    height=height,
+                    nonce=0,
+                    datastring="",
+                )
+            )
+        session.add(ChainTip(block_id=10, height=4, hash="4", length=5, work=""))
+        await session.commit()
+        locator = await crud.get_locator(session)
+        headers = await crud.get_headers(session, ["2", "x"], 10)
+        start = await crud.get_headers(session, [], 2)
+        after = await crud.get_blocks_after(session, 2)
+        return locator, headers, start, after
+
+    def test_Locator(self, session):
+        locator, headers, start, after = asyncio.run(self.locate(session))
+        assert locator == ["4", "3", "2", "1", "0"]
+        assert [tuple(row) for row in headers] == [(3, "3", "2"), (4, "4", "3")]
+        assert [tuple(row) for row in start] == [(0, "0", "-1"), (1, "1", "0")]
+        assert [tuple(row) for row in after] == [(10, "3"), (9, "2")]
+
+    @staticmethod
+    async def createBlocks(helper, blocks: int) -> tuple:
+        async with helper.session_factory() as session:
+            for i in range(blocks):
+                block = BlockCreate(
+                    prevHash=str(i - 1),
+                    hash=str(i),
+                    nonce=0,
+                    datastring="",
+                    transactionList=[],
+                )
+                await crud.create_block(session=session, block_inp=block)
+        cached = chain_tip_cache.get()
+        chain_tip_cache.clear()
+        async with helper.session_factory() as session:
+            stored = await crud.get_chain_tip(session)
+            last = await crud.get_last_block(session)
+        return cached, stored, last
+
+    def test_ChainTip(self, database):
+        cached, stored, last = asyncio.run(self.createBlocks(database, 3))
+        assert cached == stored
+        assert (stored.height, stored.length, stored.hash) == (2, 3, "2")
+        assert int(stored.work, 16) == 3 * Constants.Work()
+        assert last.id == stored.block_id and last.hash == "2"
+
+    @staticmethod
+    async def commitBlocks(session) -> tuple:
+        session.add(Address(address="0x" + "0" * 40, ckey=""))
+        await session.flush()
+        session.add_all(
+            Transaction(
+                ttype=1,
+                ttimestamp=datetime(2024, 1, 1),
+                fromAddr_id=None,
+                toAddr_id=1,
+                pkey="",
+                value=1,
+                fee=0,
+                data="",
+                signature=str(i),
+            )
+            for i in range(4)
+        )
+        await session.commit()
+        blocks = []
+        for i, ids in enumerate(([1, 2], [2, 3], [3, 4])):
+            block = BlockCreate(
+                prevHash="",
+                hash=str(i),
+                nonce=0,
+                datastring="",
+                transactionList=ids,
+            )
+            try:
+                block = await crud.create_block(session, block)
+                blocks.append(len(block.transactionList))
+            except ValueError:
+                blocks.append(None)
+        stmt = select(Transaction.block_id).order_by(Transaction.id)
+        block_ids = list(await session.scalars(stmt))
+        count = await session.scalar(select(func.count(Block.id)))
+        tip = await crud.get_chain_tip(session)
+        return blocks, block_ids, count, tip
+
+    def test_CreateBlockAtomic(self, session):
+        blocks, block_ids, count, tip = asyncio.run(self.commitBlocks(session))
+        assert blocks == [2, None, 2]
+        assert block_ids == [1, 1, 2, 2]
+        assert count == 2
+        assert (tip.length, tip.hash) == (2, "2")
+
+    @staticmethod
+    async def disconnectBlocks(session) -> tuple:
+        async def balances(session) -> dict:
+            rows = await session.execute(
+                select(Balance.address_id, Balance.confirmed, Balance.pending)
+            )
+            return {row.address_id: (row.confirmed, row.pending) for row in rows}
+
+        ids = await crud.get_or_create_addresses(session, {"0x1", "0x2"})
+        states = []
+        for i, ttype in enumerate((2, 2, 1)):
+            # A reward to 0x1 in the first two blocks, a transfer in the third
+            transaction = TransactionCreate(
+                ttype=ttype,
+                fromAddr=None if ttype == 2 else ids["0x1"],
+                toAddr=ids["0x2"] if ttype == 1 else ids["0x1"],
+                value=5,
+                fee=1,
+                ttimestamp=datetime(2024, 1, 1),
+                pkey="",
+                data=str(i),
+                signature=str(i),
+            )
+            tr_ids = await crud.create_transactions(
+                session, [transaction], commit=False
+            )
+            await crud.create_block(
+                session,
+                BlockCreate(
+                    prevHash=str(i - 1),
+                    hash=str(i),
+                    nonce=0,
+                    datastring="",
+                    transactionList=tr_ids,
+                ),
+            )
+            states.append(await balances(session))
+        pending = []
+        for block_id, prev_hash in await crud.get_blocks_after(session, 0):
+            pending += await crud.disconnect_block(session, block_id, prev_hash)
+        await session.commit()
+        tip = await session.scalar(select(ChainTip))
+        undo = await session.scalar(select(func.count(BlockUndo.id)))
+        transactions = list(
+            await session.execute(
+                select(Transaction.id, Transaction.block_id).order_by(Transaction.id)
+            )
+        )
+        after = await balances(session)
+        readded = await crud.readd_to_mempool(session, pending)
+        states = [[state[ids[k]] for k in ("0x1", "0x2")] for state in states]
+        after = [after[ids[k]] for k in ("0x1", "0x2")]
+        return states, after, pending, readded, tip, undo, transactions
+
+    def test_DisconnectBlock(self, session):
+        states, after, pending, readded, tip, undo, transactions = asyncio.run(
+            self.disconnectBlocks(session)
+        )
+        # The reward is gone and the transfer is pending again
+        assert pending == [3] and readded == 1
+        assert [tuple(row) for row in transactions] == [(1, 1), (3, None)]
+        assert after[0] == (states[0][0][0], -6)
+        assert after[1] == (0, 5)
+        assert (tip.height, tip.hash, undo) == (0, "0", 1)
+
+    @staticmethod
+    async def rejectedTransactions(session) -> tuple:
+        maxsize = mempool.maxsize
+        mempool.maxsize = 2
+        try:
+            ids = await crud.get_or_create_addresses(session, {"0x1", "0x2"})
+            tr_ids = await crud.create_transactions(
+                session,
+                [
+                    TransactionCreate(
+                        ttype=1,
+                        fromAddr=ids["0x1"],
+                        toAddr=ids["0x2"],
+                        value=5,
+                        fee=fee,
+                        ttimestamp=datetime(2024, 1, 1),
+                        pkey="",
+                        data=str(i),
+                        signature=str(i),
+                    )
+                    for i, fee in enumerate((1, 3, 2))
+                ],
+            )
+            rows = list(
+                await session.scalars(select(Transaction.id).order_by(Transaction.id))
+            )
+            balance = await session.scalar(
+                select(Balance.pending).where(Balance.address_id == ids["0x1"])
+            )
+            entries = sorted(entry.id for entry in mempool)
+        finally:
+            mempool.maxsize = maxsize
+        return tr_ids, rows, balance, entries
+
+    def test_RejectedTransactions(self, session):
+        tr_ids, rows, balance, entries = asyncio.run(self.rejectedTransactions(session))
+        # The third row evicts the first, which is deleted along with its balance
+        assert tr_ids == [None, 2, 3]
+        assert rows == entries == [2, 3]
+        assert balance == -15
+
+    @staticmethod
+    async def balanceUpdates(session) -> tuple:
+        async def balances(session) -> tuple:
+            rows = await session.execute(
+                select(Balance.address_id, Balance.confirmed, Balance.pending)
+            )
+            ret = {row.address_id: (row.confirmed, row.pending) for row in rows}
+            return tuple(ret[ids[k]] for k in ("0x1", "0x2"))
+
+        states = {}
+        ids = await crud.get_or_create_addresses(session, {"0x1", "0x2"})
+        transactions = [
+            TransactionCreate(
+                ttype=ttype,
+                fromAddr=None if ttype == 2 else ids["0x1"],
+                toAddr=ids["0x2"] if ttype == 1 else ids["0x1"],
+                value=5,
+                fee=1,
+                ttimestamp=datetime(2024, 1, 1),
+                pkey="",
+                data=str(i),
+                signature=str(i),
+            )
+            for i, ttype in enumerate((2, 1))
+        ]
+        # A reward confirmed with the block, a transfer that waits first
+        transfer = await crud.create_transactions(session, transactions[1:])
+        states["insert"] = await balances(session)
+        reward = await crud.create_transactions(session, transactions[:1], commit=False)
+        block = await crud.create_block(
+            session,
+            BlockCreate(
+                prevHash="",
+                hash="0",
+                nonce=0,
+                datastring="",
+                transactionList=reward + transfer,
+            ),
+        )
+        states["confirm"] = await balances(session)
+        block = await crud.get_block_by_id(session, block.id)
+        await crud.delete_block_by_id(session, block)
+        states["delete"] = await balances(session)
+        rows = list(await session.execute(select(Transaction.id, Transaction.block_id)))
+        await crud.rebuild_balances(session)
+        states["rebuild"] = await balances(session)
+        pending = sorted(entry.id for entry in mempool)
+        return states, [tuple(row) for row in rows], transfer, pending
+
+    def test_BalanceUpdates(self, session):
+        states, rows, transfer, pending = asyncio.run(self.balanceUpdates(session))
+        assert states["insert"] == ((0, -6), (0, 5))
+        assert states["confirm"] == ((-1, 0), (5, 0))
+        # The reward is gone, the transfer is pending again
+        assert rows == [(transfer[0], None)]
+        assert pending == transfer
+        assert states["delete"] == ((0, -6), (0, 5))
+        assert states["rebuild"] == states["delete"]
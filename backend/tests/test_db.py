@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.core.models import DatabaseHelper
+
+
+class TestDatabaseHelper:
+    def test_NormalizeUrl(self):
+        assert (
+            DatabaseHelper.normalize_url("postgresql://u:p@db/chain")
+            == "postgresql+asyncpg://u:p@db/chain"
+        )
+        assert (
+            DatabaseHelper.normalize_url("postgres://db/chain")
+            == "postgresql+asyncpg://db/chain"
+        )
+        assert DatabaseHelper.normalize_url("sqlite+aiosqlite:///x") == (
+            "sqlite+aiosqlite:///x"
+        )
+
+    @staticmethod
+    async def load(helper: DatabaseHelper, requests: int) -> list[int]:
+        app = FastAPI()
+
+        @app.get("/ok/")
+        async def ok(session: AsyncSession = Depends(helper.scoped_session_dependency)):
+            return await session.scalar(text("SELECT 1"))
+
+        @app.get("/fail/")
+        async def fail(
+            session: AsyncSession = Depends(helper.scoped_session_dependency),
+        ):
+            await session.scalar(text("SELECT 1"))
+            raise HTTPException(status_code=404)
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            responses = await asyncio.gather(
+                *(c.get("/ok/" if i % 2 else "/fail/") for i in range(requests))
+            )
+        return [response.status_code for response in responses]
+
+    def test_NoConnectionLeaks(self, tmp_path):
+        # A pool without overflow and a short timeout fails fast on any leak
+        helper = DatabaseHelper(
+            f"sqlite+aiosqlite:///{tmp_path}/load.sqlite3",
+            pool_size=3,
+            max_overflow=0,
+            pool_timeout=5,
+            sqlite_pragmas={"journal_mode": "wal", "synchronous": "normal"},
+        )
+
+        async def run() -> tuple:
+            codes = await self.load(helper, 300)
+            async with helper.engine.connect() as conn:
+                mode = await conn.scalar(text("PRAGMA journal_mode"))
+            stats = helper.stats()
+            await helper.engine.dispose()
+            return codes, mode, stats
+
+        codes, mode, stats = asyncio.run(run())
+        assert codes.count(200) == 150 and codes.count(404) == 150
+        assert mode == "wal"
+        assert stats["checked_out"] == 0
+        assert stats["sessions_open"] == 0
+        assert stats["sessions"] == 300
+        assert stats["checkouts"] == stats["checkins"]
+        assert stats["connects"] <= 3
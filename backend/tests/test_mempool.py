@@ -0,0 +1,33 @@
+from backend.mempool import Mempool, MempoolEntry
+
+
+class TestMempool:
+    @staticmethod
+    def entry(id: int, fee: int) -> MempoolEntry:
+        return MempoolEntry(id, fee, f"data{id}", f"sig{id}")
+
+    def test_Select(self):
+        pool = Mempool(10)
+        for id, fee in enumerate([1, 5, 3, 5, 0]):
+            assert pool.add(self.entry(id, fee))
+        assert not pool.add(self.entry(0, 1))
+        assert [entry.id for entry in pool.select(3)] == [1, 3, 2]
+        pool.discard_ids([1])
+        assert [entry.id for entry in pool.select(10)] == [3, 2, 0, 4]
+        assert pool.histogram() == [
+            {"min_fee": 0, "max_fee": 0, "count": 1},
+            {"min_fee": 1, "max_fee": 1, "count": 1},
+            {"min_fee": 2, "max_fee": 3, "count": 1},
+            {"min_fee": 4, "max_fee": 7, "count": 1},
+        ]
+
+    def test_Eviction(self):
+        pool = Mempool(3)
+        for id, fee in enumerate([2, 1, 3]):
+            pool.add(self.entry(id, fee))
+        assert not pool.accepts(1)
+        assert not pool.add(self.entry(3, 1))
+        assert pool.add(self.entry(4, 4))
+        assert [entry.id for entry in pool.select(5)] == [4, 2, 0]
+        assert pool.stats()["evicted"] == 1
+        assert pool.stats()["rejected"] == 1
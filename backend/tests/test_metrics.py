@@ -0,0 +1,128 @@
+import asyncio
+
+import httpx
+import pytest
+from ellipticcurve import PrivateKey
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import backend.metrics as metrics
+from backend.metrics import Counter, Gauge, Histogram, Registry, RouteContext
+from backend.src.bchain import Block, Transaction
+from backend.workers import WorkerPool
+
+
+class TestMetrics:
+    def test_Render(self):
+        registry = Registry()
+        counter = registry.register(Counter("c_total", "Things", labels=("route",)))
+        registry.register(Gauge("g", "Level", fn=lambda: 2.5))
+        registry.register(Gauge("empty", "No sample", fn=lambda: None))
+        histogram = registry.register(Histogram("h", "Sizes", buckets=(1, 10)))
+        counter.inc(2, ('/a/"{id}"',))
+        counter.inc(1, ('/a/"{id}"',))
+        for value in (0.5, 1, 7, 20):
+            histogram.observe(value)
+        assert registry.render() == (
+            "# HELP c_total Things\n"
+            "# TYPE c_total counter\n"
+            'c_total{route="/a/\\"{id}\\""} 3\n'
+            "# HELP g Level\n"
+            "# TYPE g gauge\n"
+            "g 2.5\n"
+            "# HELP empty No sample\n"
+            "# TYPE empty gauge\n"
+            "# HELP h Sizes\n"
+            "# TYPE h histogram\n"
+            'h_bucket{le="1"} 2\n'
+            'h_bucket{le="10"} 3\n'
+            'h_bucket{le="+Inf"} 4\n'
+            "h_sum 28.5\n"
+            "h_count 4\n"
+        )
+        with pytest.raises(ValueError):
+            counter.inc(-1)
+        with pytest.raises(ValueError):
+            registry.register(Gauge("g", "Again"))
+
+    def test_Hooks(self):
+        solved, verified = [], []
+        Block.onSolve = lambda attempts, seconds: solved.append(attempts)
+        Transaction.onVerify = verified.append
+        Transaction.verified.clear()
+        try:
+            block = Block.createInit(PrivateKey())
+            block.solve()
+            tr = block.getTransaction(0)
+            Transaction.validate(tr.datastring, tr.signature)
+            Transaction.validate(tr.datastring, tr.signature)
+        finally:
+            Block.onSolve = None
+            Transaction.onVerify = None
+        # Attempts count the first nonce too, the cached check isn't timed
+        assert solved == [block.data["nonce"] + 1]
+        assert len(verified) == 1
+
+    @staticmethod
+    async def batches() -> None:
+        WorkerPool.on_run = metrics.on_batch
+        pool = WorkerPool(workers=1)
+        pool.start()
+        try:
+            await pool.run(Transaction.verifyBatch, [])
+        finally:
+            WorkerPool.on_run = None
+            await pool.shutdown()
+
+    def test_BatchHook(self):
+        # Batches sent to the worker processes are timed by the pool
+        metrics.batch_seconds.values.clear()
+        asyncio.run(self.batches())
+        assert list(metrics.batch_seconds.values) == [("verifyBatch",)]
+        assert 'bchain_batch_seconds_count{batch="verifyBatch"} 1' in (
+            metrics.registry.render()
+        )
+        metrics.batch_seconds.values.clear()
+
+    @staticmethod
+    async def routes(helper) -> dict:
+        app = FastAPI()
+        app.add_middleware(RouteContext)
+        metrics.install(helper)
+
+        @app.get("/q/{num}/")
+        async def query(
+            num: int,
+            session: AsyncSession = Depends(helper.scoped_session_dependency),
+        ):
+            for _ in range(num):
+                await session.scalar(text("SELECT 1"))
+            try:
+                await session.scalar(text("SELECT * FROM missing"))
+            except Exception:
+                pass
+            return num
+
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+                await c.get("/q/2/")
+                await c.get("/q/3/")
+            async with helper.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return {
+                labels: sum(entry[0])
+                for labels, entry in metrics.query_seconds.values.items()
+            }
+        finally:
+            Block.onSolve = None
+            Transaction.onVerify = None
+            WorkerPool.on_run = None
+
+    def test_QueriesByRoute(self, database):
+        metrics.query_seconds.values.clear()
+        counts = asyncio.run(self.routes(database))
+        metrics.query_seconds.values.clear()
+        assert counts[("/q/{num}/",)] == 5
+        assert counts[("none",)] >= 1
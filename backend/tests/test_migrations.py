@@ -0,0 +1,95 @@
+import asyncio
+
+from sqlalchemy import Connection, inspect, text
+
+from backend.core.models import Base, DatabaseHelper
+from backend.migrations import head, migrate
+
+
+class TestMigrations:
+    @staticmethod
+    def schema(conn: Connection) -> dict:
+        insp = inspect(conn)
+        return {
+            table: (
+                sorted(column["name"] for column in insp.get_columns(table)),
+                sorted(
+                    (index["name"], bool(index["unique"]))
+                    for index in insp.get_indexes(table)
+                ),
+            )
+            for table in insp.get_table_names()
+            if table != "schema_version"
+        }
+
+    @classmethod
+    async def migrateAndInspect(cls, setup=None, target=None) -> tuple:
+        helper = DatabaseHelper(url="sqlite+aiosqlite://")
+        async with helper.engine.begin() as conn:
+            if setup is not None:
+                await conn.run_sync(setup)
+        await migrate(helper.engine)
+        if target is not None:
+            await migrate(helper.engine, target)
+        async with helper.engine.connect() as conn:
+            migrated = await conn.run_sync(cls.schema)
+            version = await conn.scalar(text("SELECT version FROM schema_version"))
+        await helper.engine.dispose()
+
+        helper = DatabaseHelper(url="sqlite+aiosqlite://")
+        async with helper.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            expected = await conn.run_sync(cls.schema)
+        await helper.engine.dispose()
+        return migrated, expected, version
+
+    def test_UpgradeMatchesModels(self):
+        migrated, expected, version = asyncio.run(self.migrateAndInspect())
+        assert migrated == expected
+        assert version == head()
+        assert ("ix_block_table_hash", True) in migrated["block_table"][1]
+        assert ("ix_block_table_height", True) in migrated["block_table"][1]
+        assert ("ix_address_table_address", True) in migrated["address_table"][1]
+
+    def test_Downgrade(self):
+        migrated, expected, version = asyncio.run(self.migrateAndInspect(target=1))
+        assert version == 1
+        assert migrated["transaction_table"][1] == []
+        assert migrated["block_table"][1] == []
+        assert migrated.keys() == expected.keys() - {"blockundo_table"}
+
+    def test_UpgradeLegacyDatabase(self):
+        # Databases from before migrations have the tables but no indexes
+        def legacy(conn: Connection) -> None:
+            conn.execute(
+                text(
+                    "CREATE TABLE address_table (id INTEGER PRIMARY KEY, "
+                    "address VARCHAR(42) NOT NULL, ckey VARCHAR NOT NULL)"
+                )
+            )
+            conn.execute(text("INSERT INTO address_table VALUES (1, '0x01', '')"))
+
+        migrated, expected, version = asyncio.run(self.migrateAndInspect(legacy))
+        assert migrated == expected
+        assert version == head()
+
+    @staticmethod
+    async def backfill() -> list:
+        helper = DatabaseHelper(url="sqlite+aiosqlite://")
+        await migrate(helper.engine, 4)
+        async with helper.engine.begin() as conn:
+            for id in (1, 2):
+                await conn.execute(
+                    text(
+                        'INSERT INTO block_table (id, "prevHash", hash, nonce, '
+                        f"datastring) VALUES ({id}, '', '{id}', 0, '')"
+                    )
+                )
+        await migrate(helper.engine)
+        async with helper.engine.connect() as conn:
+            rows = list(await conn.execute(text("SELECT id, height FROM block_table")))
+        await helper.engine.dispose()
+        return [tuple(row) for row in rows]
+
+    def test_HeightBackfill(self):
+        assert asyncio.run(self.backfill()) == [(1, 0), (2, 1)]
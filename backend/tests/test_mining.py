@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from ellipticcurve import PrivateKey
+from fastapi import HTTPException
+
+import backend.crud as crud
+import backend.mining as mining
+from backend.mempool import MempoolEntry, mempool
+from backend.mining import MiningJobManager, block_create, reward_create
+from backend.schemas import AddressCreate
+from backend.src.bchain import Address, Block, Transaction, TransactionList, TTypes
+from backend.views import chain_views
+
+
+class BrokenMiner:
+    workers = 1
+
+    def search(self, check, start: int = 0) -> int:
+        raise RuntimeError("A process in the pool was terminated abruptly")
+
+    def cancel(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class TestMiningJobs:
+    @staticmethod
+    async def jobs(helper, monkeypatch) -> dict:
+        monkeypatch.setattr(mining, "db_helper", helper)
+        ckey = PrivateKey()
+        pkey = ckey.publicKey()
+        addr = Address(pkey=pkey)
+        genesis = Block.createInit(ckey)
+        async with helper.session_factory() as session:
+            ids = await crud.get_or_create_addresses(session, {addr.address})
+            tr_ids = await crud.create_transactions(
+                session,
+                [reward_create(genesis.getTransaction(0), ids[addr.address])],
+                commit=False,
+            )
+            await crud.create_block(session, block_create(genesis, tr_ids))
+
+        def block() -> Block:
+            # The transfer in the middle isn't stored, only the rewards are
+            tr = Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey)
+            return Block(1, genesis.hash, TransactionList.create(ckey, None, tr))
+
+        manager = MiningJobManager(tip_poll_interval=0.05)
+        ret = {}
+        try:
+            done = manager.submit(block(), [], ids[addr.address], workers=1)
+            ret["running"] = manager.get(done.id).to_dict()["status"]
+            await asyncio.wait_for(done.done.wait(), 30)
+            ret["done"] = done.to_dict()
+            ret["idle"] = list(manager.miners[1])
+
+            # Genesis isn't the tip any more
+            stale = manager.submit(block(), [], ids[addr.address], workers=1)
+            await asyncio.wait_for(stale.done.wait(), 30)
+            ret["stale"] = stale.to_dict()
+            ret["reused"] = manager.miners[1] == ret["idle"]
+
+            cancelled = manager.submit(block(), [], ids[addr.address], workers=1)
+            ret["cancel"] = manager.cancel(cancelled.id).to_dict()
+            await asyncio.wait_for(cancelled.done.wait(), 30)
+            ret["cancelled"] = cancelled.to_dict()
+            ret["missing"] = manager.cancel(1000)
+
+            manager.miners[1] = [BrokenMiner()]
+            broken = manager.submit(block(), [], ids[addr.address], workers=1)
+            await asyncio.wait_for(broken.done.wait(), 30)
+            ret["broken"] = broken.to_dict()
+            async with helper.session_factory() as session:
+                ret["height"] = (await crud.get_chain_tip(session)).height
+        finally:
+            await manager.shutdown()
+        return ret
+
+    def test_Jobs(self, database, monkeypatch):
+        ret = asyncio.run(self.jobs(database, monkeypatch))
+        assert ret["running"] == "pending"
+        assert ret["done"]["status"] == "done"
+        assert ret["done"]["block_id"] == 2 and ret["done"]["hash"] is not None
+        assert ret["stale"]["status"] == "stale"
+        # Jobs borrow the miner and hand it back
+        assert len(ret["idle"]) == 1 and ret["reused"]
+        assert ret["cancel"]["status"] == ret["cancelled"]["status"] == "cancelled"
+        assert ret["missing"] is None
+        # Errors other than ValueError finish the job too
+        assert ret["broken"]["status"] == "failed"
+        assert "terminated abruptly" in ret["broken"]["error"]
+        assert ret["height"] == 1
+
+    @staticmethod
+    async def noTip(session) -> int:
+        ckey = PrivateKey()
+        addr = Address(pkey=ckey.publicKey())
+        tr = Transaction(TTypes.transfer, addr, addr, ckey.publicKey(), 1, 1, ckey)
+        mempool.add(MempoolEntry(1, 1, tr.datastring, tr.signature))
+        await crud.create_address(
+            session, AddressCreate(address=addr.address, ckey=ckey.toString())
+        )
+        with pytest.raises(HTTPException) as e:
+            await chain_views.submit_mining_job(session, workers=1)
+        return e.value.status_code
+
+    def test_NoTip(self, session):
+        assert asyncio.run(self.noTip(session)) == 409
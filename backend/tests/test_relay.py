@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import pickle
+
+import httpx
+from ellipticcurve import PrivateKey
+from fastapi import FastAPI
+
+from backend.mempool import MempoolEntry
+from backend.relay import compact_block, reconstruct
+from backend.views import chain_views, transaction_views
+from backend.src.bchain import Address, Block, Transaction, TransactionList, TTypes
+from backend.tests.nodes import Node
+
+ran = []
+
+
+class Payload:
+    # Unpickling calls ran.append
+    def __reduce__(self):
+        return (ran.append, (1,))
+
+
+class TestRelay:
+    @staticmethod
+    def block() -> Block:
+        ckey = PrivateKey()
+        tr = Transaction(
+            TTypes.transfer,
+            Address(pkey=ckey.publicKey()),
+            Address(pkey=PrivateKey().publicKey()),
+            ckey.publicKey(),
+            5,
+            1,
+            ckey,
+        )
+        return Block(1, "00", TransactionList.create(ckey, None, tr))
+
+    def test_Reconstruct(self):
+        block = self.block()
+        pairs = block.data["transactionList"].getPairs()
+        compact = compact_block(block)
+        assert [tr.index for tr in compact.prefilled] == [0, 2]
+        assert len(compact.shortIds) == 1
+
+        entries = [MempoolEntry(7, 1, *pairs[1])]
+        assert reconstruct(compact, entries) == (pairs, [])
+        rebuilt, missing = reconstruct(compact, [])
+        assert missing == [1]
+        assert reconstruct(compact_block(block, {1}), []) == (pairs, [])
+
+    @staticmethod
+    def received(node: Node) -> dict:
+        return node.client.get("/chain/relay/").json()["received"]
+
+    def test_CompactAnnouncement(self, tmp_path):
+        b = Node(tmp_path)
+        a = Node(tmp_path, [b])
+        b.peers.append(a)
+        with a:
+            # Relaying this one fails, b isn't running yet
+            a.transfer()
+            with b:
+                a.client.post("/chain/mine/").raise_for_status()
+                a.wait(lambda: self.received(b).get("accepted") == 1)
+                assert b.tip() == a.tip()
+                assert b.client.get("/chain/relay/").json() == {
+                    "received": {"missing": 1, "accepted": 1},
+                    "requested": 1,
+                }
+
+                # Now the transaction reaches b before the block does
+                a.transfer()
+                a.wait(lambda: b.client.get("/mempool/stats/").json()["size"] == 1)
+                a.client.post("/chain/mine/").raise_for_status()
+                a.wait(lambda: self.received(b).get("accepted") == 2)
+                assert b.tip() == a.tip()
+                assert b.client.get("/chain/relay/").json()["requested"] == 1
+                # b relays what it accepted, a already has it
+                a.wait(lambda: self.received(a) == {"known": 2})
+
+    @staticmethod
+    async def legacy() -> list:
+        datastring = base64.b64encode(pickle.dumps(Payload())).decode("ascii")
+        app = FastAPI()
+        app.include_router(transaction_views.router)
+        app.include_router(chain_views.router)
+        compact = compact_block(TestRelay.block()).model_dump()
+        compact["prefilled"][0]["datastring"] = datastring
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            raw = await c.post(
+                "/transaction/raw/", json=[{"datastring": datastring, "signature": "x"}]
+            )
+            announce = await c.post("/chain/announce/", json=compact)
+        return [raw.status_code, announce.status_code]
+
+    def test_LegacyRefused(self):
+        # Pickled datastrings are refused before anything decodes them
+        assert asyncio.run(self.legacy()) == [422, 422]
+        assert ran == []
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime
+
+from ellipticcurve import PrivateKey
+
+from backend.signing import sign_transactions
+from backend.workers import WorkerPool
+from backend.src.bchain import Address, Transaction
+
+
+class TestSigning:
+    ckey = PrivateKey()
+    fromAddr = Address(pkey=ckey.publicKey()).address
+    toAddr = Address(pkey=PrivateKey().publicKey()).address
+
+    def item(self, **kwargs) -> dict:
+        ret = {
+            "ttype": 1,
+            "fromAddr": self.fromAddr,
+            "toAddr": self.toAddr,
+            "ckey": self.ckey.toString(),
+            "value": 10,
+            "fee": 1,
+            "timestamp": datetime(2024, 1, 1),
+        }
+        ret.update(kwargs)
+        return ret
+
+    def test_SignTransactions(self):
+        other = PrivateKey().toString()
+        results = sign_transactions([self.item(), self.item(ckey=other)])
+        datastring, signature, pkey = results[0]
+        assert Transaction.validate(datastring, signature)
+        assert pkey == self.ckey.publicKey().toCompressed()
+        assert isinstance(results[1], ValueError)
+
+    def test_WorkerPool(self):
+        async def run() -> list:
+            pool = WorkerPool(workers=2)
+            pool.start()
+            try:
+                return await pool.run(sign_transactions, [self.item()] * 3)
+            finally:
+                await pool.shutdown()
+
+        Transaction.verified.clear()
+        results = asyncio.run(run())
+        assert len(results) == 3
+        # The workers verified the signatures, this process only caches them
+        for datastring, signature, _ in results:
+            assert Transaction.verified.lookup(
+                Transaction.verified.key(datastring, signature)
+            )
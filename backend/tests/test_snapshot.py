@@ -0,0 +1,144 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, select, update
+
+import backend.crud as crud
+from backend.cache import chain_tip_cache
+from backend.core.models import Balance, Block, ChainTip
+from backend.schemas import BlockCreate, TransactionCreate
+from backend.snapshot import StateSnapshots, snapshot_path
+
+
+class TestSnapshot:
+    def test_Files(self, tmp_path):
+        snapshots = StateSnapshots(str(tmp_path), interval=0, keep=2)
+        for height in (5, 7, 6):
+            snapshots.write({"version": 1, "tip": {"height": height}})
+        files = snapshots.files()
+        assert [os.path.basename(path) for path in files] == [
+            "snapshot-0000000007.json",
+            "snapshot-0000000006.json",
+        ]
+        assert snapshots.read(files[0])["tip"]["height"] == 7
+        with open(files[0], "r+b") as f:
+            f.seek(-2, os.SEEK_END)
+            f.write(b"8}")
+        with pytest.raises(ValueError):
+            snapshots.read(files[0])
+
+    def test_SnapshotPath(self):
+        assert snapshot_path("sqlite+aiosqlite:///./db.sqlite3", "") == (
+            "./db.sqlite3.snapshots"
+        )
+        assert snapshot_path("sqlite+aiosqlite:///:memory:", "") is None
+        assert snapshot_path("postgresql+asyncpg://localhost/chain", "") is None
+        assert snapshot_path("postgresql+asyncpg://localhost/chain", "s") == "s"
+
+    @staticmethod
+    async def recoverBalances(helper, tmp_path) -> tuple:
+        snapshots = StateSnapshots(f"{tmp_path}/snapshots", interval=0, keep=2)
+
+        async def balances() -> dict:
+            async with helper.session_factory() as session:
+                stmt = select(Balance.address_id, Balance.confirmed, Balance.pending)
+                return {row[0]: tuple(row[1:]) for row in await session.execute(stmt)}
+
+        async with helper.session_factory() as session:
+            ids = await crud.get_or_create_addresses(session, {"0x1", "0x2"})
+            for i in range(3):
+                # Rewards to 0x1, then it pays 0x2 once the first is confirmed
+                transaction = TransactionCreate(
+                    ttype=2 if i < 2 else 1,
+                    fromAddr=ids["0x1"] if i == 2 else None,
+                    toAddr=ids["0x2"] if i == 2 else ids["0x1"],
+                    value=5,
+                    fee=1,
+                    ttimestamp=datetime(2024, 1, 1),
+                    pkey="",
+                    data=str(i),
+                    signature=str(i),
+                )
+                tr_ids = await crud.create_transactions(
+                    session, [transaction], commit=False
+                )
+                if i < 2:
+                    await crud.create_block(
+                        session,
+                        BlockCreate(
+                            prevHash=str(i - 1),
+                            hash=str(i),
+                            nonce=0,
+                            datastring="",
+                            transactionList=tr_ids,
+                        ),
+                    )
+                else:
+                    await session.commit()
+                if i == 0:
+                    first = await snapshots.save(helper.session_factory)
+        expected = await balances()
+        second = await snapshots.save(helper.session_factory)
+        snapshots.last = None
+        # Only the first snapshot describes this chain once the tip is replaced
+        async with helper.session_factory() as session:
+            (await session.scalar(select(ChainTip))).hash = "other"
+            await session.execute(
+                update(Block).where(Block.id == 2).values(hash="other")
+            )
+            await session.execute(delete(Balance))
+            await session.commit()
+        chain_tip_cache.clear()
+        recovered = await snapshots.recover(
+            helper.session_factory, audit=False, chunk_size=10
+        )
+        restored = await balances()
+        return first, second, recovered, expected, restored
+
+    def test_RecoverBalances(self, database, tmp_path):
+        first, second, recovered, expected, restored = asyncio.run(
+            self.recoverBalances(database, tmp_path)
+        )
+        assert first != second
+        assert recovered == {"snapshot": True, "after": 1, "checked": 0}
+        assert restored == expected
+
+    @staticmethod
+    async def recoverTip(helper, tmp_path) -> tuple:
+        snapshots = StateSnapshots(f"{tmp_path}/snapshots", interval=0, keep=2)
+        async with helper.session_factory() as session:
+            for i in range(4):
+                # The datastrings are empty, the height can't come from them
+                await crud.create_block(
+                    session,
+                    BlockCreate(
+                        prevHash=str(i - 1),
+                        hash=str(i),
+                        nonce=0,
+                        datastring="",
+                        transactionList=[],
+                    ),
+                )
+                if i == 1:
+                    await snapshots.save(helper.session_factory)
+            expected = await crud.get_chain_tip(session)
+            await session.execute(delete(ChainTip))
+            await session.commit()
+        chain_tip_cache.clear()
+        snapshots.last = None
+        recovered = await snapshots.recover(
+            helper.session_factory, audit=False, chunk_size=10
+        )
+        chain_tip_cache.clear()
+        async with helper.session_factory() as session:
+            restored = await crud.get_chain_tip(session)
+        return recovered, expected, restored
+
+    def test_RecoverTip(self, database, tmp_path):
+        recovered, expected, restored = asyncio.run(self.recoverTip(database, tmp_path))
+        # Two blocks after the snapshot are counted onto its tip
+        assert recovered == {"snapshot": True, "after": 2, "checked": 0}
+        assert restored == expected
+        assert (restored.height, restored.length) == (3, 4)
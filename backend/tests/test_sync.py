@@ -0,0 +1,74 @@
+import pytest
+
+from backend.schemas import BlockHeader
+from backend.sync import ChainSync
+from backend.tests.nodes import Node
+
+
+class TestSync:
+    def test_CheckHeaders(self):
+        genesis = BlockHeader(height=0, hash="ab" * 32, prevHash="FunnyMonke")
+        mined = BlockHeader(height=1, hash="000f" + "0" * 60, prevHash=genesis.hash)
+        ChainSync.checkHeaders(None, [genesis, mined])
+        with pytest.raises(ValueError):
+            ChainSync.checkHeaders(genesis, [mined.model_copy(update={"height": 2})])
+        with pytest.raises(ValueError):
+            ChainSync.checkHeaders(
+                genesis, [mined.model_copy(update={"hash": "f" * 64})]
+            )
+
+    def test_SyncFromPeers(self, tmp_path):
+        with Node(tmp_path) as a:
+            a.mine(3)
+            with Node(tmp_path, [a]) as b, Node(
+                tmp_path, [a, b], sync_window=1, sync_parallel=2
+            ) as c:
+                # New nodes fetch the chain while starting up
+                assert b.tip() == a.tip()
+                assert c.tip() == a.tip()
+                a.mine(2)
+                result = c.client.post("/chain/sync/").json()
+                assert result["status"] == "synced"
+                assert result["blocks"] == 2
+                assert c.tip() == a.tip()
+                assert c.client.post("/chain/sync/").json()["status"] == "up_to_date"
+                address = a.client.get("/address/balance/1/").json()
+                synced = c.client.get("/address/all_addresses/").json()
+                synced = next(
+                    row
+                    for row in synced
+                    if row["address"] == address["address"]["address"]
+                )
+                balance = c.client.get(f"/address/balance/{synced['id']}/").json()
+                assert balance["balance"] == address["balance"]
+
+    def test_Reorganize(self, tmp_path):
+        # b starts before its peer and creates a genesis block of its own
+        a = Node(tmp_path)
+        with Node(tmp_path, [a]) as b, a:
+            b.mine(1)
+            a.mine(3)
+            result = b.client.post("/chain/sync/").json()
+            assert result["status"] == "reorganized"
+            assert (result["disconnected"], result["blocks"]) == (2, 4)
+            assert b.tip() == a.tip()
+            # b relayed its transfer to a, so it is back in a block and not
+            # in the mempool
+            assert b.client.get("/mempool/stats/").json()["size"] == 0
+            address = a.client.get("/address/balance/1/").json()
+            synced = b.client.get("/address/all_addresses/").json()
+            synced = next(
+                row for row in synced if row["address"] == address["address"]["address"]
+            )
+            balance = b.client.get(f"/address/balance/{synced['id']}/").json()
+            assert balance["balance"] == address["balance"]
+            assert b.client.post("/chain/sync/").json()["status"] == "up_to_date"
+            # Heights stay right for blocks synced on top of the new branch
+            a.mine(2)
+            result = b.client.post("/chain/sync/").json()
+            assert result["status"] == "synced"
+            assert (result["blocks"], result["height"]) == (2, 5)
+            assert b.tip() == a.tip()
+            headers = b.client.get("/chain/headers/").json()
+            assert [header["height"] for header in headers] == list(range(6))
+            assert headers == a.client.get("/chain/headers/").json()
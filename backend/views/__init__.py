@@ -2,3 +2,6 @@ from .address_views import router as address_router
 from .block_views import router as block_router
 from .chain_views import router as chain_router
 from .transaction_views import router as transaction_router
+from .admin_views import router as admin_router
+from .mempool_views import router as mempool_router
+from .metrics_views import router as metrics_router
@@ -1,9 +1,10 @@
 from ellipticcurve import PrivateKey
-from fastapi import APIRouter, status, Depends, HTTPException, status
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Response
 from backend.schemas import Address, AddressCreate, AddressBalance
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.core.models import db_helper
+from backend.core.models import db_helper, Address as AddressModel
 from backend.dependencies import address_by_id
+from backend.pagination import PageParams, ndjson_response
 import backend.crud as crud
 from backend.src.bchain import (
     Address as AddressClass,
@@ -17,9 +18,17 @@ router = APIRouter(prefix="/address", tags=["Address"])
 
 @router.get("/all_addresses/", response_model=list[Address])
 async def get_all_addresses(
+    response: Response,
+    page: PageParams = Depends(),
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
-    return await crud.get_all_addresses(session)
+    result = await crud.get_all_addresses(session, after=page.after, limit=page.limit)
+    return page.paginate(response, result)
+
+
+@router.get("/all_addresses/stream/")
+async def stream_addresses(after: int = Query(default=0, ge=0)):
+    return ndjson_response(AddressModel, Address, after)
 
 
 @router.post(
@@ -48,18 +57,17 @@ async def get_address_balance(
     address_id: int,
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
-    address_result = await crud.get_address_by_id(
+    result = await crud.get_balance_by_address_id(
         session=session, address_id=address_id
     )
-    if address_result is None:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Address with ID {address_id} does not exist",
         )
-    balance_result = await crud.get_balance_by_address_id(
-        session=session, address_id=address_id
-    )
+    address_result, balance_result = result
     return AddressBalance(
         address=Address(address=address_result.address, id=address_result.id),
-        balance=balance_result,
+        balance=balance_result.confirmed if balance_result is not None else 0,
+        pending=balance_result.pending if balance_result is not None else 0,
     )
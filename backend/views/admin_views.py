@@ -0,0 +1,27 @@
+from fastapi import APIRouter, status, HTTPException
+
+from backend.audit import chain_audit
+from backend.core.models import db_helper
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.post("/audit/", status_code=status.HTTP_202_ACCEPTED)
+async def start_audit():
+    if chain_audit.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Audit is already running",
+        )
+    chain_audit.start(db_helper.session_factory)
+    return chain_audit.to_dict()
+
+
+@router.get("/audit/")
+async def get_audit():
+    return chain_audit.to_dict()
+
+
+@router.get("/db/")
+async def get_db_stats():
+    return db_helper.stats()
@@ -1,7 +1,17 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+import re
+
+from fastapi import (
+    APIRouter,
+    status,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
 from backend.schemas import Block, BlockCreate, Transaction, Address
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.core.models import db_helper
+from backend.core.models import db_helper, Block as BlockModel
 from backend.dependencies import block_by_id
 from backend.src.bchain import (
     Address as AddressClass,
@@ -9,6 +19,9 @@ from backend.src.bchain import (
     TransactionList,
     Block as BlockClass,
 )
+from backend.cache import block_cache, CachedBlock
+from backend.core.config import settings
+from backend.pagination import PageParams, ndjson_response
 import backend.crud as crud
 
 router = APIRouter(prefix="/block", tags=["Block"])
@@ -16,24 +29,112 @@ router = APIRouter(prefix="/block", tags=["Block"])
 
 @router.get("s/", response_model=list[Block])
 async def get_blocks(
+    response: Response,
+    page: PageParams = Depends(),
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
-    result = await crud.get_blocks(session=session)
+    result = await crud.get_blocks(session=session, after=page.after, limit=page.limit)
+
+    return page.paginate(response, result)
+
+
+@router.get("s/stream/")
+async def stream_blocks(after: int = Query(default=0, ge=0)):
+    return ndjson_response(BlockModel, Block, after)
+
+
+async def cached_block(
+    session: AsyncSession, block_id: int | None = None, block_hash: str | None = None
+) -> CachedBlock | None:
+    if block_id is not None:
+        entry = block_cache.get(block_id)
+    else:
+        entry = block_cache.get_by_hash(block_hash)
+    if entry is not None:
+        return entry
+    if block_id is not None:
+        block = await session.get(BlockModel, block_id)
+    else:
+        block = await crud.get_block_by_hash(session=session, block_hash=block_hash)
+    if block is None:
+        return None
+    body = Block.model_validate(block, from_attributes=True).model_dump_json()
+    entry = CachedBlock(block.id, block.hash, body.encode("utf-8"), block.height)
+    block_cache.add(entry)
+    return entry
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match is "*" or a list of entity tags, compared weakly
+    for tag in re.findall(r'\*|(?:W/)?"[^"]*"', header):
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
 
-    return result
+
+async def block_response(
+    request: Request,
+    session: AsyncSession,
+    entry: CachedBlock | None,
+    by_hash: bool = False,
+) -> Response:
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Block not found!",
+        )
+    # Only blocks buried deep enough are unlikely to be replaced by a reorg.
+    # A hash always names the same block, an id names whatever block holds
+    # that row after the last reorg, so those are only cached briefly.
+    tip = await crud.get_chain_tip(session=session)
+    depth = tip.height - entry.height + 1 if tip is not None else 0
+    if depth < settings.block_confirmations:
+        cache_control = "no-cache"
+    elif by_hash:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = f"public, max-age={settings.block_max_age}"
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match", ""), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 
 @router.get("/last_block/", response_model=Block)
 async def get_last_block(
+    request: Request,
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
-    result = await crud.get_last_block(session)
-    return result
+    tip = await crud.get_chain_tip(session=session)
+    entry = None
+    if tip is not None:
+        entry = await cached_block(session=session, block_id=tip.block_id)
+    return await block_response(request, session, entry)
+
+
+@router.get("/cache/")
+async def get_block_cache_stats():
+    return block_cache.stats()
+
+
+@router.get("/by_hash/{block_hash}/", response_model=Block)
+async def get_block_by_hash(
+    block_hash: str,
+    request: Request,
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    entry = await cached_block(session=session, block_hash=block_hash)
+    return await block_response(request, session, entry, by_hash=True)
 
 
 @router.get("/{block_id}/", response_model=Block)
-async def get_block_by_id(block: Block = Depends(block_by_id)):
-    return block
+async def get_block_by_id(
+    block_id: int,
+    request: Request,
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    entry = await cached_block(session=session, block_id=block_id)
+    return await block_response(request, session, entry)
 
 
 @router.get("/get_length")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Body
 from backend.schemas import (
     Address as AddressSchema,
     AddressCreate,
@@ -6,6 +6,13 @@ from backend.schemas import (
     BlockCreate,
     TransactionCreate,
     Transaction as TransactionSchema,
+    MiningJob as MiningJobSchema,
+    ChainTip as ChainTipSchema,
+    BlockHeader,
+    BlockBody,
+    SyncResult,
+    CompactBlock,
+    AnnounceResult,
 )
 from backend.src.bchain import (
     Address as AddressClass,
@@ -16,96 +23,113 @@ from backend.src.bchain import (
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend.core.models import db_helper
+from backend.core.config import settings
 from backend.dependencies import block_by_id
+from backend.mining import mining_jobs, MiningJob
+from backend.mempool import mempool
+from backend.sync import chain_sync
+from backend.relay import block_relay
 import backend.crud as crud
+from ellipticcurve import PrivateKey
 
 router = APIRouter(prefix="/chain", tags=["Chain"])
 
 
-@router.post("/mine/", response_model=Block)
-async def mine_new_block(
-    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
-):
-    tr = await crud.get_open_transaction_by_fee(
-        session=session, limit=Constants.BlockSize()
-    )
-    if tr is None or len(tr) == 0:
+async def submit_mining_job(session: AsyncSession, workers: int) -> MiningJob:
+    entries = mempool.select(Constants.BlockSize())
+    if len(entries) == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No open transactions!",
         )
-    tr_list = []
-    for tr_cur in tr:
-        temp_tr = TransactionClass.fromDatastring(
-            datastring=tr_cur.data,
-            signature=tr_cur.signature,
+    tr_list = [
+        TransactionClass.fromDatastring(
+            datastring=entry.data,
+            signature=entry.signature,
+        )
+        for entry in entries
+    ]
+    miner_address = await crud.get_address_by_id(
+        session=session, address_id=settings.miner_address_id
+    )
+    if miner_address is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Miner address {settings.miner_address_id} does not exist",
+        )
+    ckey = PrivateKey.fromString(miner_address.ckey)
+    tr_list_class = TransactionList.create(ckey, None, *tr_list)
+    # The chain id is the tip height, the row id is off by one from genesis
+    tip = await crud.get_chain_tip(session)
+    if tip is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Chain has no blocks yet",
         )
-        tr_list.append(temp_tr)
-    tr_list_class = TransactionList(*tr_list)
-    last_block = await crud.get_last_block(session)
 
     mining_block = BlockClass(
-        id=last_block.id + 1, prevHash=last_block.hash, transactionList=tr_list_class
+        id=tip.height + 1, prevHash=tip.hash, transactionList=tr_list_class
     )
-    await mining_block.mine()
-    try:
-        mining_block.validate()
-    except ValueError as e:
+    return mining_jobs.submit(
+        block=mining_block,
+        transaction_ids=[entry.id for entry in entries],
+        miner_address_id=miner_address.id,
+        workers=workers,
+    )
+
+
+def mining_job_by_id(job_id: int) -> MiningJob:
+    job = mining_jobs.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Unexpected error while validating mined block: {e}",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Mining job {job_id} not found!",
         )
-    get_tr = []
-    for tr_obj in tr:
-        get_tr.append(
-            await crud.get_transaction_by_id(session=session, transaction_id=tr_obj.id)
+    return job
+
+
+@router.post("/mine/", response_model=Block)
+async def mine_new_block(
+    workers: int = Query(default=settings.mining_workers, ge=1),
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    job = await submit_mining_job(session=session, workers=workers)
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=job.error,
         )
-    block_dict: dict = mining_block.data.copy()
-    block_dict.pop("id")
-    block_dict["hash"] = mining_block.hash
-    block_dict["datastring"] = mining_block.datastring
-    block_dict["transactionList"] = [tr.id for tr in get_tr]
-    block_to_create = BlockCreate(**block_dict)
-    new_sesh = db_helper.get_scoped_session()
-    result = await crud.create_block(session=new_sesh, block_inp=block_to_create)
-    tr_temp = []
-    for tr in result.transactionList:
-        if tr.fromAddr:
-            from_addr = await crud.get_address_by_id(
-                session=new_sesh, address_id=tr.fromAddr
-            )
-            from_addr = AddressSchema(id=from_addr.id, address=from_addr.address)
-        else:
-            from_addr = None
-        if tr.toAddr:
-            to_addr = await crud.get_address_by_id(
-                session=new_sesh, address_id=tr.fromAddr
-            )
-            to_addr = AddressSchema(id=to_addr.id, address=to_addr.address)
-        else:
-            to_addr = None
-        tr_temp.append(
-            TransactionSchema(
-                ttype=tr.ttype,
-                ttimestamp=tr.ttimestamp,
-                fromAddr=from_addr,
-                toAddr=to_addr,
-                value=tr.value,
-                fee=tr.fee,
-                data=tr.data,
-                id=tr.id,
-                signature=tr.signature,
-                block_id=tr.block_id,
-            )
+    if job.status != "done":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Mining job {job.id} is {job.status}",
         )
-    return Block(
-        prevHash=result.prevHash,
-        nonce=result.nonce,
-        datastring=result.datastring,
-        hash=result.hash,
-        id=result.id,
-        transactionList=tr_temp,
-    )
+    return await crud.get_block_by_id(session=session, block_id=job.result.id)
+
+
+@router.post(
+    "/mine/jobs/",
+    response_model=MiningJobSchema,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_mining_job(
+    workers: int = Query(default=settings.mining_workers, ge=1),
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    job = await submit_mining_job(session=session, workers=workers)
+    return job.to_dict()
+
+
+@router.get("/mine/jobs/{job_id}/", response_model=MiningJobSchema)
+async def get_mining_job(job: MiningJob = Depends(mining_job_by_id)):
+    return job.to_dict()
+
+
+@router.delete("/mine/jobs/{job_id}/", response_model=MiningJobSchema)
+async def cancel_mining_job(job: MiningJob = Depends(mining_job_by_id)):
+    mining_jobs.cancel(job.id)
+    return job.to_dict()
 
 
 @router.get("/chain_size/")
@@ -113,10 +137,80 @@ async def get_chain_size(
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
     return {
-        "size": len(await crud.get_blocks(session=session)),
+        "size": await crud.get_chain_length(session=session),
     }
 
 
-@router.post("/sync/")
+@router.get("/tip/", response_model=ChainTipSchema)
+async def get_chain_tip(
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    tip = await crud.get_chain_tip(session=session)
+    if tip is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chain is empty",
+        )
+    return tip
+
+
+@router.get("/headers/", response_model=list[BlockHeader])
+async def get_headers(
+    locator: list[str] = Query(default=[]),
+    limit: int = Query(
+        default=settings.sync_header_batch, ge=1, le=settings.sync_header_batch
+    ),
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    rows = await crud.get_headers(session=session, locator=locator, limit=limit)
+    return [
+        BlockHeader(height=height, hash=hash, prevHash=prevHash)
+        for height, hash, prevHash in rows
+    ]
+
+
+@router.post("/bodies/", response_model=list[BlockBody])
+async def get_bodies(
+    hashes: list[str] = Body(),
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    if len(hashes) > settings.max_page_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.max_page_size} blocks per request",
+        )
+    rows = await crud.get_block_bodies(session=session, hashes=hashes)
+    return [BlockBody(hash=hash, datastring=datastring) for hash, datastring in rows]
+
+
+@router.post("/sync/", response_model=SyncResult)
 async def sync_chain_with_peers():
-    self_chain_size = (await get_chain_size())["size"]
+    if chain_sync.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Sync is already running",
+        )
+    return await chain_sync.sync()
+
+
+@router.get("/sync/", response_model=SyncResult)
+async def get_sync_status():
+    if chain_sync.last is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No sync has run yet",
+        )
+    return chain_sync.last
+
+
+@router.post("/announce/", response_model=AnnounceResult)
+async def receive_compact_block(compact: CompactBlock):
+    return await block_relay.receive(compact)
+
+
+@router.get("/relay/")
+async def get_relay_stats():
+    return {
+        "received": dict(block_relay.received),
+        "requested": block_relay.requested,
+    }
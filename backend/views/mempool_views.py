@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+from backend.mempool import mempool
+
+router = APIRouter(prefix="/mempool", tags=["Mempool"])
+
+
+@router.get("/stats/")
+async def get_mempool_stats():
+    return mempool.stats()
+
+
+@router.get("/histogram/")
+async def get_mempool_histogram():
+    return mempool.histogram()
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.core.models import db_helper
+from backend.metrics import CONTENT_TYPE, registry
+import backend.crud as crud
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    # Fills the chain tip cache the height gauge reads
+    await crud.get_chain_tip(session=session)
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+import hashlib
+
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Response
 from backend.schemas import (
     Address as AddressSchema,
     Transaction,
@@ -6,6 +8,8 @@ from backend.schemas import (
     TransactionUpdatePartial,
     TransactionUpdate,
     TransactionBase,
+    TransactionBatchResult,
+    RawTransaction,
 )
 from backend.src.bchain import (
     Address as AddressClass,
@@ -15,8 +19,15 @@ from backend.src.bchain import (
     TTypes,
 )
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.core.models import db_helper
+from backend.core.models import db_helper, Transaction as TransactionModel
 from backend.dependencies import transaction_by_id
+from backend.core.config import settings
+from backend.mempool import mempool, REWARD_TYPES
+from backend.relay import block_relay
+from backend.sync import transaction_create
+from backend.signing import sign_transactions
+from backend.workers import batch_pool
+from backend.pagination import PageParams, ndjson_response
 import backend.crud as crud
 from ellipticcurve import PrivateKey
 
@@ -25,9 +36,19 @@ router = APIRouter(prefix="/transaction", tags=["Transaction"])
 
 @router.get("/", response_model=list[Transaction])
 async def get_all_transactions(
+    response: Response,
+    page: PageParams = Depends(),
     session: AsyncSession = Depends(db_helper.scoped_session_dependency),
 ):
-    return await crud.get_all_transactions(session)
+    result = await crud.get_all_transactions(
+        session, after=page.after, limit=page.limit
+    )
+    return page.paginate(response, result)
+
+
+@router.get("/stream/")
+async def stream_transactions(after: int = Query(default=0, ge=0)):
+    return ndjson_response(TransactionModel, Transaction, after)
 
 
 @router.post(
@@ -60,6 +81,12 @@ async def create_transaction(
                 detail=f"Address with ID {address} does not exist",
             )
 
+    if not mempool.accepts(transaction_inp.fee):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Mempool is full, the fee is too low to replace anything",
+        )
+
     try:
         if from_addr_db:
             ckey = PrivateKey.fromString(from_addr_db.ckey)
@@ -83,6 +110,11 @@ async def create_transaction(
             status_code=status.HTTP_406_NOT_ACCEPTABLE,
             detail=f"Error validating transaction: {e}",
         )
+    if tr_class.txid in mempool:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Transaction {tr_class.txid} is already in the mempool",
+        )
     temp_dict = transaction_inp.model_dump()
     temp_dict["pkey"] = tr_class.data["pkey"]
     temp_dict["data"] = tr_class.datastring
@@ -91,14 +123,9 @@ async def create_transaction(
     temp_result = await crud.create_transaction(
         session=session, transaction_inp=transaction_inp_create
     )
-    from_addr = await crud.get_address_by_id(
-        session=session, address_id=temp_result.fromAddr
-    )
-    from_addr = AddressSchema(id=from_addr.id, address=from_addr.address)
-    to_addr = await crud.get_address_by_id(
-        session=session, address_id=temp_result.toAddr
-    )
-    to_addr = AddressSchema(id=to_addr.id, address=to_addr.address)
+    block_relay.relay_transactions_later([(temp_result.data, temp_result.signature)])
+    from_addr = AddressSchema(id=from_addr_db.id, address=from_addr_db.address)
+    to_addr = AddressSchema(id=to_addr_db.id, address=to_addr_db.address)
     result = Transaction(
         ttype=temp_result.ttype,
         ttimestamp=temp_result.ttimestamp,
@@ -114,12 +141,182 @@ async def create_transaction(
     return result
 
 
-@router.get("/{transaction_id}/")
+@router.post("/batch/", response_model=list[TransactionBatchResult])
+async def create_transactions_batch(
+    transactions_inp: list[TransactionBase],
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    if len(transactions_inp) > settings.batch_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.batch_max_size} transactions per batch",
+        )
+    address_ids = set()
+    for transaction_inp in transactions_inp:
+        address_ids.update([transaction_inp.fromAddr, transaction_inp.toAddr])
+    address_ids.discard(None)
+    addresses = await crud.get_addresses_by_ids(session, address_ids)
+
+    results = [
+        TransactionBatchResult(index=i, ok=False) for i in range(len(transactions_inp))
+    ]
+    items = []
+    positions = []
+    for i, transaction_inp in enumerate(transactions_inp):
+        from_addr_db = addresses.get(transaction_inp.fromAddr)
+        to_addr_db = addresses.get(transaction_inp.toAddr)
+        if from_addr_db is None or to_addr_db is None:
+            missing = (
+                transaction_inp.toAddr if from_addr_db else transaction_inp.fromAddr
+            )
+            results[i].error = f"Address with ID {missing} does not exist"
+        elif not mempool.accepts(transaction_inp.fee):
+            results[i].error = "Mempool is full, the fee is too low to replace anything"
+        else:
+            items.append(
+                {
+                    "ttype": transaction_inp.ttype,
+                    "fromAddr": from_addr_db.address,
+                    "toAddr": to_addr_db.address,
+                    "ckey": from_addr_db.ckey,
+                    "value": transaction_inp.value,
+                    "fee": transaction_inp.fee,
+                    "timestamp": transaction_inp.ttimestamp,
+                }
+            )
+            positions.append(i)
+
+    signed = await batch_pool.run(sign_transactions, items)
+
+    to_create = []
+    created_positions = []
+    seen = set()
+    for i, result in zip(positions, signed):
+        if isinstance(result, Exception):
+            results[i].error = f"Error validating transaction: {result}"
+            continue
+        datastring, signature, pkey = result
+        txid = hashlib.sha256(datastring.encode("utf-8")).hexdigest()
+        results[i].txid = txid
+        if txid in mempool or txid in seen:
+            results[i].error = f"Transaction {txid} is already in the mempool"
+            continue
+        seen.add(txid)
+        transaction_inp = transactions_inp[i]
+        to_create.append(
+            TransactionCreate(
+                **transaction_inp.model_dump(),
+                pkey=pkey,
+                data=datastring,
+                signature=signature,
+            )
+        )
+        created_positions.append(i)
+
+    ids = await crud.create_transactions(session=session, transactions_inp=to_create)
+    for i, id in zip(created_positions, ids):
+        if id is None:
+            results[i].error = "Mempool is full, the fee is too low to replace anything"
+        else:
+            results[i].ok = True
+            results[i].id = id
+    block_relay.relay_transactions_later(
+        [
+            (transaction.data, transaction.signature)
+            for transaction, id in zip(to_create, ids)
+            if id is not None
+        ]
+    )
+    return results
+
+
+@router.post("/raw/", response_model=list[TransactionBatchResult])
+async def submit_raw_transactions(
+    transactions_inp: list[RawTransaction],
+    session: AsyncSession = Depends(db_helper.scoped_session_dependency),
+):
+    # Transactions signed elsewhere, this is how peers relay their mempools
+    if len(transactions_inp) > settings.batch_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.batch_max_size} transactions per batch",
+        )
+    results = [
+        TransactionBatchResult(index=i, ok=False) for i in range(len(transactions_inp))
+    ]
+    pairs = [(tr.datastring, tr.signature) for tr in transactions_inp]
+    errors = await batch_pool.run(TransactionClass.verifyBatch, pairs)
+    known = await crud.get_transactions_by_signatures(
+        session, [signature for _, signature in pairs]
+    )
+
+    accepted = []
+    seen = set()
+    for i, (pair, error) in enumerate(zip(pairs, errors)):
+        try:
+            if error is not None:
+                raise error
+            tr_class = TransactionClass.fromDatastring(*pair)
+        except Exception as e:
+            results[i].error = f"Error validating transaction: {e}"
+            continue
+        results[i].txid = tr_class.txid
+        if tr_class.data["ttype"].value in REWARD_TYPES:
+            results[i].error = "Rewards only exist as part of a block"
+        elif (
+            tr_class.signature in known
+            or tr_class.txid in mempool
+            or tr_class.txid in seen
+        ):
+            results[i].error = f"Transaction {tr_class.txid} is already known"
+        elif not mempool.accepts(tr_class.data["fee"]):
+            results[i].error = "Mempool is full, the fee is too low to replace anything"
+        else:
+            seen.add(tr_class.txid)
+            accepted.append((i, tr_class))
+
+    address_ids = await crud.get_or_create_addresses(
+        session,
+        {
+            addr.address
+            for _, tr_class in accepted
+            for addr in (tr_class.data["fromAddr"], tr_class.data["toAddr"])
+            if addr is not None
+        },
+    )
+    ids = await crud.create_transactions(
+        session=session,
+        transactions_inp=[
+            transaction_create(tr_class, address_ids) for _, tr_class in accepted
+        ],
+    )
+    for (i, _), id in zip(accepted, ids):
+        if id is None:
+            results[i].error = "Mempool is full, the fee is too low to replace anything"
+        else:
+            results[i].ok = True
+            results[i].id = id
+    block_relay.relay_transactions_later(
+        [
+            (tr_class.datastring, tr_class.signature)
+            for (_, tr_class), id in zip(accepted, ids)
+            if id is not None
+        ]
+    )
+    return results
+
+
+@router.get("/verify_cache/")
+async def get_verify_cache_stats():
+    return TransactionClass.verified.stats()
+
+
+@router.get("/{transaction_id}/", response_model=Transaction)
 async def get_transaction_by_id(transaction: Transaction = Depends(transaction_by_id)):
     return transaction
 
 
-@router.put("/{transaction_id}/")
+@router.put("/{transaction_id}/", response_model=Transaction)
 async def update_transaction(
     transaction_update: TransactionUpdate,
     transaction: Transaction = Depends(transaction_by_id),
@@ -132,7 +329,7 @@ async def update_transaction(
     )
 
 
-@router.patch("/{transaction_id}/")
+@router.patch("/{transaction_id}/", response_model=Transaction)
 async def update_transaction_partial(
     transaction_update: TransactionUpdatePartial,
     transaction: Transaction = Depends(transaction_by_id),
@@ -0,0 +1,49 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.core.config import settings
+
+
+class WorkerPool:
+    # One process pool for the signing and signature checks of every request.
+    # Pure Python ECDSA holds the GIL, so a thread of this process would stall
+    # the event loop, the batch functions only wait on the pool from a thread.
+    # Without start() they run serially in that thread.
+    # Called with the batch function's name and its wall time
+    on_run = None
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.pool is None and self.workers > 0:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def run(self, fn, *args):
+        # Calls fn(*args, workers, pool)
+        pool = self.pool
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(None, fn, *args, self.workers, pool)
+        except BrokenProcessPool:
+            # A killed worker breaks the whole pool, the next batch gets a new one
+            if self.pool is pool:
+                self.pool = None
+                pool.shutdown(wait=False)
+                self.start()
+            raise
+        finally:
+            if WorkerPool.on_run is not None:
+                WorkerPool.on_run(fn.__name__, time.perf_counter() - start)
+
+    async def shutdown(self) -> None:
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+
+batch_pool = WorkerPool(workers=settings.batch_workers)
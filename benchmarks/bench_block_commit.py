@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+import backend.crud as crud
+from backend.cache import chain_tip_cache
+from backend.core.models import Base, DatabaseHelper, Address, Transaction, Block
+from backend.schemas import BlockCreate
+
+
+async def legacy_create_block(session, block_inp: BlockCreate) -> None:
+    # The previous implementation: one lookup per transaction, then a commit
+    # for the block and one more commit per transaction
+    tr_list = [await session.get(Transaction, id) for id in block_inp.transactionList]
+    dump = block_inp.model_dump()
+    dump["transactionList"] = []
+    block = Block(**dump)
+    session.add(block)
+    await session.commit()
+    for tr in tr_list:
+        tr.block_id = block.id
+        await session.commit()
+
+
+async def measure(path: str, transactions: int, create) -> float:
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    async with helper.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    chain_tip_cache.clear()
+    async with helper.session_factory() as session:
+        session.add_all(
+            [Address(address="0x" + "0" * 40, ckey=""), Address(address="0x1", ckey="")]
+        )
+        await session.flush()
+        session.add_all(
+            Transaction(
+                ttype=1,
+                ttimestamp=datetime(2024, 1, 1),
+                fromAddr_id=1,
+                toAddr_id=2,
+                pkey="",
+                value=1,
+                fee=1,
+                data="",
+                signature=str(i),
+            )
+            for i in range(transactions)
+        )
+        await session.commit()
+        ids = list(await session.scalars(select(Transaction.id)))
+    block = BlockCreate(
+        prevHash="", hash="0", nonce=0, datastring="", transactionList=ids
+    )
+    async with helper.session_factory() as session:
+        start = time.perf_counter()
+        await create(session, block)
+        elapsed = time.perf_counter() - start
+    await helper.engine.dispose()
+    return elapsed * 1000
+
+
+async def main(sizes: list[int]) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    print(f"{'transactions':>12} {'legacy ms':>12} {'bulk ms':>12}")
+    for size in sizes:
+        legacy = await measure(path, size, legacy_create_block)
+        bulk = await measure(path, size, crud.create_block)
+        print(f"{size:>12} {legacy:>12.1f} {bulk:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Block commit latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes))
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from ellipticcurve import PrivateKey
+from sqlalchemy import create_engine
+
+from backend.core.models import DatabaseHelper
+from backend.migrations import upgrade
+from backend.snapshot import StateSnapshots
+from backend.src.bchain import Address, Block, Constants, Transaction, TransactionList
+from backend.src.bchain import TTypes
+
+
+def build(path: str, blocks: int, pool: int) -> list[str]:
+    # Signing dominates building, so blocks reuse a pool of transaction lists.
+    # The verified-signature cache is turned off while measuring, so each
+    # block still costs a full verification.
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        upgrade(conn)
+    engine.dispose()
+
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    lists = [
+        TransactionList.create(
+            ckey, None, Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey)
+        )
+        for _ in range(pool)
+    ]
+    db = sqlite3.connect(path)
+    db.execute(
+        "INSERT INTO address_table (id, address, ckey) VALUES (1, ?, ?)",
+        (addr.address, ckey.toString()),
+    )
+    db.execute(
+        "INSERT INTO balance_table (address_id, confirmed, pending) VALUES (1, 0, 0)"
+    )
+    hashes = []
+    prev = "FunnyMonke"
+    for height in range(blocks):
+        block = Block(height, prev, lists[height % pool])
+        if height:
+            block.solve()
+        db.execute(
+            "INSERT INTO block_table (id, prevHash, hash, nonce, datastring) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (height + 1, prev, block.hash, block.data["nonce"], block.datastring),
+        )
+        db.executemany(
+            'INSERT INTO transaction_table (ttype, ttimestamp, "fromAddr", "toAddr", '
+            "pkey, value, fee, data, block_id, signature) "
+            "VALUES (?, '2024-01-01', ?, 1, '', ?, ?, ?, ?, ?)",
+            (
+                (
+                    tr.data["ttype"].value,
+                    None if tr.data["fromAddr"] is None else 1,
+                    tr.data["value"],
+                    tr.data["fee"],
+                    tr.datastring,
+                    height + 1,
+                    tr.signature,
+                )
+                for tr in (block.getTransaction(num) for num in range(3))
+            ),
+        )
+        hashes.append(block.hash)
+        prev = block.hash
+    db.execute(
+        "INSERT INTO chaintip_table (block_id, height, hash, length, work) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (blocks, blocks - 1, prev, blocks, f"{blocks * Constants.Work():064x}"),
+    )
+    db.commit()
+    db.close()
+    return hashes
+
+
+async def start(path: str, snapshots: StateSnapshots) -> tuple[float, int]:
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    Transaction.verified.maxsize = 0
+    Transaction.verified.clear()
+    begin = time.perf_counter()
+    recovered = await snapshots.recover(helper.session_factory, True, 500)
+    elapsed = time.perf_counter() - begin
+    await helper.engine.dispose()
+    return elapsed, recovered["checked"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--heights", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--behind", type=int, default=100)
+    parser.add_argument("--pool", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'height':>8}{'no snapshot, s':>16}{'snapshot, s':>14}{'checked':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for blocks in args.heights:
+            path = os.path.join(tmp, f"{blocks}.sqlite3")
+            hashes = build(path, blocks, args.pool)
+            empty = StateSnapshots(os.path.join(tmp, "none"), interval=0, keep=2)
+            full, _ = asyncio.run(start(path, empty))
+
+            # A snapshot written `behind` blocks before the tip
+            snapshots = StateSnapshots(os.path.join(tmp, str(blocks)), 0, keep=2)
+            height = blocks - 1 - args.behind
+            tip = {
+                "block_id": height + 1,
+                "height": height,
+                "hash": hashes[height],
+                "length": height + 1,
+                "work": f"{(height + 1) * Constants.Work():064x}",
+            }
+            snapshots.write(
+                {"version": 1, "tip": tip, "watermark": height + 1, "balances": []}
+            )
+            fast, checked = asyncio.run(start(path, snapshots))
+            print(f"{blocks:>8}{full:>16.2f}{fast:>14.2f}{checked:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+from datetime import datetime
+
+from ellipticcurve import PrivateKey
+
+from backend.mempool import MempoolEntry
+from backend.relay import compact_block, reconstruct
+from backend.schemas import Address as AddressSchema, Block as BlockSchema
+from backend.src.bchain import Block, TransactionList, Transaction, TTypes, Address
+
+
+def build(transactions: int) -> Block:
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    trs = [
+        Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey)
+        for _ in range(transactions)
+    ]
+    return Block(1, "0" * 64, TransactionList.create(ckey, None, *trs))
+
+
+def full_json(block: Block) -> bytes:
+    # What GET /block/{id}/ sends for the block
+    address = AddressSchema(id=1, address="0x" + "0" * 40)
+    transactions = []
+    for num in range(block.getTransactionListLen()):
+        tr = block.getTransaction(num)
+        transactions.append(
+            {
+                "ttype": tr.data["ttype"].value,
+                "fromAddr": None if tr.data["fromAddr"] is None else address,
+                "toAddr": address,
+                "value": tr.data["value"],
+                "fee": tr.data["fee"],
+                "ttimestamp": datetime.now(),
+                "id": num + 1,
+                "data": tr.datastring,
+                "signature": tr.signature,
+                "block_id": 2,
+            }
+        )
+    return (
+        BlockSchema(
+            id=2,
+            prevHash=block.data["prevHash"],
+            nonce=block.data["nonce"],
+            datastring=block.datastring,
+            hash=block.hash,
+            transactionList=transactions,
+        )
+        .model_dump_json()
+        .encode("utf-8")
+    )
+
+
+def compact_json(block: Block, entries: list[MempoolEntry]) -> tuple[int, float]:
+    # Bytes of the announcement plus the second round trip, if any, and the
+    # receiver's reconstruction time
+    compact = compact_block(block)
+    sent = len(compact.model_dump_json())
+    start = time.perf_counter()
+    _, missing = reconstruct(compact, entries)
+    elapsed = time.perf_counter() - start
+    if missing:
+        retry = compact_block(block, set(missing))
+        sent += len(retry.model_dump_json())
+        start = time.perf_counter()
+        reconstruct(retry, entries)
+        elapsed += time.perf_counter() - start
+    return sent, elapsed * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact block size and rebuild time")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--mempool", type=int, default=10000)
+    args = parser.parse_args()
+
+    noise = [MempoolEntry(i, 1, os.urandom(16).hex(), "") for i in range(args.mempool)]
+    print(
+        f"{'txs':>6} {'full JSON':>10} {'sync body':>10} {'compact':>10}"
+        f" {'10% miss':>10} {'rebuild ms':>11}"
+    )
+    for size in args.sizes:
+        block = build(size)
+        pairs = block.data["transactionList"].getPairs()[1:-1]
+        entries = [MempoolEntry(i, 1, *pair) for i, pair in enumerate(pairs)]
+        full = len(full_json(block))
+        body = len(block.hash) + len(block.datastring)
+        compact, rebuild = compact_json(block, noise + entries)
+        partial, _ = compact_json(block, noise + entries[: size - size // 10 - 1])
+        print(
+            f"{size:>6} {full:>10} {body:>10} {compact:>10} {partial:>10}"
+            f" {rebuild:>11.1f}"
+        )
@@ -0,0 +1,45 @@
+import argparse
+import time
+from ellipticcurve import PrivateKey
+from backend.src.bchain import Block, TransactionList, Transaction, TTypes, Address
+
+
+def build(transactions: int, version: int) -> Block:
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    trs = [
+        Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey, version=version)
+        for _ in range(transactions)
+    ]
+    return Block(1, "0" * 64, TransactionList(*trs), version=version + 1)
+
+
+def timed(func, arg, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def report(name: str, cls, data: dict, rounds: int) -> None:
+    datastring = cls.encodeDatastring(data)
+    encode = timed(cls.encodeDatastring, data, rounds)
+    decode = timed(cls.decodeDatastring, datastring, rounds)
+    print(f"{name:<28} {len(datastring):>8} {encode:>12.1f} {decode:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Datastring size and codec speed")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'':<28} {'bytes':>8} {'encode us':>12} {'decode us':>12}")
+    for version, name in ((1, "pickle"), (2, "binary")):
+        block = build(args.transactions, version)
+        tr = block.getTransaction(0)
+        report(f"transaction {name}", Transaction, tr.data, args.rounds)
+        report(
+            f"block/{args.transactions} tx {name}", Block, block.data, args.rounds // 10
+        )
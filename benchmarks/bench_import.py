@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from backend.archive import ChainArchive, ChainImport, export_chain
+from backend.core.models import DatabaseHelper
+from backend.migrations import migrate
+from backend.mining import block_create
+from backend.schemas import TransactionCreate
+from backend.src.bchain import Block, Transaction
+from benchmarks.bench_coldstart import build
+import backend.crud as crud
+
+
+async def export(path: str, archive: str) -> None:
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    with open(archive, "wb") as f:
+        await export_chain(helper.session_factory, f, 500)
+    await helper.engine.dispose()
+
+
+async def import_(path: str, archive: str, workers: int) -> float:
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    await migrate(helper.engine)
+    start = time.perf_counter()
+    with open(archive, "rb") as f:
+        await ChainImport(workers, window=8).run(
+            helper.engine, helper.session_factory, f
+        )
+    elapsed = time.perf_counter() - start
+    await helper.engine.dispose()
+    return elapsed
+
+
+async def replay(path: str, archive: str, verify: bool) -> float:
+    # One crud.create_transaction call per transaction and a create_block per
+    # block, what a node does when it is fed block by block
+    with open(archive, "rb") as f:
+        reader = ChainArchive(f)
+        reader.readStart()
+        pairs = [
+            pair
+            for _, body in reader.readChunks()
+            for pair in ChainArchive.decodeBlocks(body)
+        ]
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    await migrate(helper.engine)
+    start = time.perf_counter()
+    async with helper.session_factory() as session:
+        for hash, datastring in pairs:
+            block = Block.fromDatastring(datastring, hash)
+            if verify:
+                block.validate()
+            trs = [
+                block.getTransaction(num)
+                for num in range(block.getTransactionListLen())
+            ]
+            ids = await crud.get_or_create_addresses(
+                session,
+                {
+                    addr.address
+                    for tr in trs
+                    for addr in (tr.data["fromAddr"], tr.data["toAddr"])
+                    if addr is not None
+                },
+            )
+            created = []
+            for tr in trs:
+                created.append(
+                    await crud.create_transaction(
+                        session,
+                        TransactionCreate(
+                            ttype=tr.data["ttype"].value,
+                            fromAddr=(
+                                None
+                                if tr.data["fromAddr"] is None
+                                else ids[tr.data["fromAddr"].address]
+                            ),
+                            toAddr=ids[tr.data["toAddr"].address],
+                            value=tr.data["value"],
+                            fee=tr.data["fee"],
+                            ttimestamp=tr.data["timestamp"],
+                            pkey=tr.data["pkey"],
+                            data=tr.datastring,
+                            signature=tr.signature,
+                        ),
+                    )
+                )
+            await crud.create_block(
+                session, block_create(block, [tr.id for tr in created])
+            )
+    elapsed = time.perf_counter() - start
+    await helper.engine.dispose()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--pool", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.sqlite3")
+        archive = os.path.join(tmp, "chain.bin")
+        build(source, args.blocks, args.pool)
+        asyncio.run(export(source, archive))
+        print(
+            f"{args.blocks} blocks, file {os.path.getsize(archive)} bytes, "
+            f"database {os.path.getsize(source)} bytes, {args.workers} workers"
+        )
+
+        # The pool repeats signed transactions, verification is measured cold.
+        # Worker processes are forked and inherit the empty cache.
+        Transaction.verified.maxsize = 0
+        Transaction.verified.clear()
+        results = {
+            "import": asyncio.run(
+                import_(os.path.join(tmp, "import.sqlite3"), archive, args.workers)
+            ),
+            "replay, verified": asyncio.run(
+                replay(os.path.join(tmp, "verified.sqlite3"), archive, True)
+            ),
+            "replay, unverified": asyncio.run(
+                replay(os.path.join(tmp, "unverified.sqlite3"), archive, False)
+            ),
+        }
+    for name, elapsed in results.items():
+        print(f"{name:<20}{elapsed:>8.2f} s{args.blocks / elapsed:>10.0f} blocks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from sqlalchemy import create_engine, or_, select
+
+from backend.core.models import Address, Block, Transaction
+from backend.migrations import downgrade, upgrade
+
+
+def build(path: str, transactions: int, per_block: int, addresses: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        upgrade(conn, 1)
+    engine.dispose()
+
+    rng = random.Random(1)
+    db = sqlite3.connect(path)
+    db.executemany(
+        "INSERT INTO address_table (id, address, ckey) VALUES (?, ?, '')",
+        ((i, f"0x{i:040x}") for i in range(1, addresses + 1)),
+    )
+    blocks = transactions // per_block
+    db.executemany(
+        "INSERT INTO block_table (id, prevHash, hash, nonce, datastring) "
+        "VALUES (?, ?, ?, 0, '')",
+        ((i, f"{i - 1:064x}", f"{i:064x}") for i in range(1, blocks + 1)),
+    )
+    # The last block's worth of transactions stays open
+    db.executemany(
+        'INSERT INTO transaction_table (id, ttype, ttimestamp, "fromAddr", '
+        '"toAddr", pkey, value, fee, data, block_id, signature) '
+        "VALUES (?, 1, '2024-01-01', ?, ?, '', 1, ?, '', ?, '')",
+        (
+            (
+                i,
+                rng.randint(1, addresses),
+                rng.randint(1, addresses),
+                rng.randint(0, 1000),
+                i // per_block + 1 if i // per_block + 1 < blocks else None,
+            )
+            for i in range(transactions)
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+def queries(rng: random.Random, blocks: int, addresses: int) -> dict:
+    def address() -> int:
+        return rng.randint(1, addresses)
+
+    return {
+        "open by fee": lambda: select(Transaction)
+        .where(Transaction.block_id.is_(None))
+        .order_by(Transaction.fee.desc(), Transaction.id)
+        .limit(100),
+        "block transactions": lambda: select(Transaction).where(
+            Transaction.block_id == rng.randint(1, blocks - 1)
+        ),
+        "address history": lambda: select(Transaction.id).where(
+            or_(
+                Transaction.fromAddr_id == address(),
+                Transaction.toAddr_id == address(),
+            )
+        ),
+        "address by string": lambda: select(Address).where(
+            Address.address == f"0x{address():040x}"
+        ),
+        "block by hash": lambda: select(Block).where(
+            Block.hash == f"{rng.randint(1, blocks):064x}"
+        ),
+    }
+
+
+def measure(conn, stmts: dict, repeat: int) -> dict:
+    ret = {}
+    for name, stmt in stmts.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(stmt()).all()
+        ret[name] = (time.perf_counter() - start) * 1000 / repeat
+    return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--per-block", type=int, default=100)
+    parser.add_argument("--addresses", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    blocks = args.transactions // args.per_block
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        start = time.perf_counter()
+        build(path, args.transactions, args.per_block, args.addresses)
+        print(
+            f"Built {args.transactions} transactions in {time.perf_counter() - start:.1f}s"
+        )
+
+        engine = create_engine(f"sqlite:///{path}")
+        with engine.begin() as conn:
+            before = measure(
+                conn, queries(random.Random(2), blocks, args.addresses), args.repeat
+            )
+            start = time.perf_counter()
+            upgrade(conn)
+            print(f"Created indexes in {time.perf_counter() - start:.1f}s")
+            conn.exec_driver_sql("ANALYZE")
+            after = measure(
+                conn, queries(random.Random(2), blocks, args.addresses), args.repeat
+            )
+            downgrade(conn, 1)
+        engine.dispose()
+
+    print(f"{'query':<20}{'no index, ms':>14}{'indexed, ms':>14}")
+    for name in before:
+        print(f"{name:<20}{before[name]:>14.2f}{after[name]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import timeit
+
+from ellipticcurve import PrivateKey
+from sqlalchemy import text
+
+import backend.metrics as metrics
+from backend.core.models import DatabaseHelper
+from backend.src.bchain import Address, Block, Transaction, TransactionList, TTypes
+
+
+def hooks(on: bool) -> None:
+    Block.onSolve = metrics.on_solve if on else None
+    Transaction.onVerify = metrics.on_verify if on else None
+
+
+def paired(run, items: list) -> tuple[float, float]:
+    # Every item runs with and without the hooks, in alternating order, so
+    # drift hits both sides alike
+    total = {False: 0.0, True: 0.0}
+    for num, item in enumerate(items):
+        for on in (False, True) if num % 2 else (True, False):
+            hooks(on)
+            start = time.perf_counter()
+            run(item)
+            total[on] += time.perf_counter() - start
+    hooks(False)
+    return total[False], total[True]
+
+
+def mining(blocks: int) -> tuple[float, float]:
+    # Same templates on both sides, so both try the same nonces
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    trs = TransactionList.create(
+        ckey, None, Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey)
+    )
+    return paired(lambda num: Block(num, f"{num:064x}", trs).solve(), range(blocks))
+
+
+def verify(transactions: int) -> tuple[float, float]:
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    pairs = []
+    for num in range(transactions):
+        tr = Transaction(TTypes.transfer, addr, addr, pkey, num + 1, 1, ckey)
+        pairs.append((tr.datastring, tr.signature))
+
+    def run(pair: tuple) -> None:
+        Transaction.verified.clear()
+        Transaction.validate(*pair)
+
+    return paired(run, pairs)
+
+
+async def queries(path: str, rounds: int, size: int) -> tuple[float, float]:
+    # Rounds alternate between an engine with and one without the listeners
+    helpers = [
+        DatabaseHelper(f"sqlite+aiosqlite:///{path}.{on}") for on in (False, True)
+    ]
+    metrics.install(helpers[1])
+    hooks(False)
+    total = [0.0, 0.0]
+    conns = [await helper.engine.connect() for helper in helpers]
+    for num in range(rounds):
+        for on in (0, 1) if num % 2 else (1, 0):
+            start = time.perf_counter()
+            for _ in range(size):
+                await conns[on].execute(text("SELECT 1"))
+            total[on] += time.perf_counter() - start
+    for conn, helper in zip(conns, helpers):
+        await conn.close()
+        await helper.engine.dispose()
+    return total[0], total[1]
+
+
+def direct() -> dict:
+    # What the hooks themselves cost, without the work they measure
+    class Conn:
+        info = {}
+
+    number = 10**5
+    ret = {
+        "on_solve": timeit.timeit(lambda: metrics.on_solve(4096, 0.01), number=number),
+        "on_verify": timeit.timeit(lambda: metrics.on_verify(0.004), number=number),
+        "sql listeners": timeit.timeit(
+            lambda: (
+                metrics.before_execute(Conn, None, "", None, None, False),
+                metrics.after_execute(Conn, None, "", None, None, False),
+            ),
+            number=number,
+        ),
+    }
+    return {name: elapsed / number * 1e6 for name, elapsed in ret.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=300)
+    parser.add_argument("--transactions", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=40)
+    parser.add_argument("--round-size", type=int, default=250)
+    args = parser.parse_args()
+
+    for name, us in direct().items():
+        print(f"{name:<14}{us:>6.2f} us")
+
+    print(f"{'path':<12}{'off, s':>10}{'on, s':>10}{'per call, us':>14}{'%':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "mining": (args.blocks, mining(args.blocks)),
+            "verify": (args.transactions, verify(args.transactions)),
+            "sql": (
+                args.rounds * args.round_size,
+                asyncio.run(
+                    queries(
+                        os.path.join(tmp, "q.sqlite3"), args.rounds, args.round_size
+                    )
+                ),
+            ),
+        }
+    for name, (calls, (off, on)) in results.items():
+        per_call = (on - off) / calls * 1e6
+        print(
+            f"{name:<12}{off:>10.3f}{on:>10.3f}{per_call:>14.2f}"
+            f"{(on - off) / off * 100:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
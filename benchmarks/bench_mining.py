@@ -0,0 +1,51 @@
+import argparse
+import hashlib
+import time
+from ellipticcurve import PrivateKey
+from backend.src.bchain import Block, TransactionList, Transaction, TTypes, Address
+
+
+def build_block(transactions: int) -> Block:
+    ckey = PrivateKey()
+    pkey = ckey.publicKey()
+    addr = Address(pkey=pkey)
+    trs = [
+        Transaction(TTypes.transfer, addr, addr, pkey, 1, 1, ckey)
+        for _ in range(transactions)
+    ]
+    return Block(1, "0" * 64, TransactionList.create(ckey, None, *trs))
+
+
+def pickle_rate(block: Block, attempts: int) -> float:
+    data = block.data.copy()
+    data["version"] = 2
+    start = time.perf_counter()
+    for nonce in range(attempts):
+        data["nonce"] = nonce
+        datastring = Block.encodeDatastring(data)
+        hashlib.sha256(datastring.encode("utf-8")).digest()
+    return attempts / (time.perf_counter() - start)
+
+
+def midstate_rate(block: Block, attempts: int) -> float:
+    header = block.header
+    start = time.perf_counter()
+    for nonce in range(attempts):
+        header(nonce)
+    return attempts / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-nonce hashing throughput")
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    print(
+        f"{'transactions':>12} {'pickle H/s':>12} {'midstate H/s':>14} {'speedup':>8}"
+    )
+    for size in args.sizes:
+        block = build_block(size)
+        before = pickle_rate(block, args.attempts)
+        after = midstate_rate(block, args.attempts)
+        print(f"{size:>12} {before:>12.0f} {after:>14.0f} {after / before:>7.1f}x")
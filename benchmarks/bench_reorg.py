@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import create_engine, delete, func, select, update
+
+import backend.crud as crud
+from backend.core.models import Block, DatabaseHelper, Transaction
+from backend.mempool import mempool
+from backend.migrations import upgrade
+from backend.src.bchain import Constants
+
+
+def build(path: str, blocks: int, per_block: int, addresses: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        upgrade(conn)
+    engine.dispose()
+
+    rng = random.Random(1)
+    db = sqlite3.connect(path)
+    db.executemany(
+        "INSERT INTO address_table (id, address, ckey) VALUES (?, ?, '')",
+        ((i, f"0x{i:040x}") for i in range(1, addresses + 1)),
+    )
+    db.executemany(
+        "INSERT INTO block_table (id, prevHash, hash, nonce, datastring) "
+        "VALUES (?, ?, ?, 0, '')",
+        ((i, f"{i - 1:064x}", f"{i:064x}") for i in range(1, blocks + 1)),
+    )
+    balances = defaultdict(int)
+    transactions = []
+    undo = []
+    for block_id in range(1, blocks + 1):
+        # A reward first, then transfers
+        rows = []
+        for num in range(per_block):
+            from_addr = None if num == 0 else rng.randint(1, addresses)
+            rows.append(
+                (
+                    len(transactions) + len(rows) + 1,
+                    2 if num == 0 else 1,
+                    from_addr,
+                    rng.randint(1, addresses),
+                    100 if num == 0 else 1,
+                    0 if num == 0 else 1,
+                    block_id,
+                )
+            )
+        deltas = crud.balance_deltas((row[2], row[3], row[4], row[5]) for row in rows)
+        for address_id, delta in deltas.items():
+            balances[address_id] += delta
+        undo.append(
+            (
+                block_id,
+                json.dumps({str(k): v for k, v in deltas.items()}),
+                json.dumps(
+                    {
+                        str(k): v
+                        for k, v in crud.balance_deltas(
+                            (row[2], row[3], row[4], row[5]) for row in rows[1:]
+                        ).items()
+                    }
+                ),
+                json.dumps([row[0] for row in rows[1:]]),
+                json.dumps([rows[0][0]]),
+            )
+        )
+        transactions += rows
+    db.executemany(
+        'INSERT INTO transaction_table (id, ttype, ttimestamp, "fromAddr", '
+        '"toAddr", pkey, value, fee, data, block_id, signature) '
+        "VALUES (?, ?, '2024-01-01', ?, ?, '', ?, ?, '', ?, '')",
+        transactions,
+    )
+    db.executemany(
+        "INSERT INTO blockundo_table (block_id, confirmed, pending, transactions, "
+        "rewards) VALUES (?, ?, ?, ?, ?)",
+        undo,
+    )
+    db.executemany(
+        "INSERT INTO balance_table (address_id, confirmed, pending) VALUES (?, ?, 0)",
+        ((i, balances[i]) for i in range(1, addresses + 1)),
+    )
+    db.execute(
+        "INSERT INTO chaintip_table (block_id, height, hash, length, work) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            blocks,
+            blocks - 1,
+            f"{blocks:064x}",
+            blocks,
+            f"{blocks * Constants.Work():064x}",
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+async def incremental(path: str, blocks: int, depth: int) -> float:
+    # Disconnects the suffix with the undo records, as a reorg does
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    async with helper.session_factory() as session:
+        start = time.perf_counter()
+        pending = []
+        for block_id, prev_hash in await crud.get_blocks_after(session, blocks - depth):
+            pending += await crud.disconnect_block(session, block_id, prev_hash)
+        await session.commit()
+        await crud.readd_to_mempool(session, pending)
+        elapsed = time.perf_counter() - start
+    await helper.engine.dispose()
+    mempool.clear()
+    return elapsed
+
+
+async def rebuild(path: str, blocks: int, depth: int) -> float:
+    # Deletes the suffix and recomputes balances and the tip from every row
+    helper = DatabaseHelper(f"sqlite+aiosqlite:///{path}")
+    async with helper.session_factory() as session:
+        start = time.perf_counter()
+        suffix = Block.id > blocks - depth
+        await session.execute(
+            delete(Transaction).where(
+                Transaction.block_id.in_(select(Block.id).where(suffix)),
+                Transaction.ttype == 2,
+            )
+        )
+        await session.execute(
+            update(Transaction)
+            .where(Transaction.block_id.in_(select(Block.id).where(suffix)))
+            .values(block_id=None)
+        )
+        await session.execute(delete(Block).where(suffix))
+        await crud.rebuild_balances(session)
+        await session.scalar(select(func.count(Block.id)))
+        await crud.load_mempool(session)
+        elapsed = time.perf_counter() - start
+    await helper.engine.dispose()
+    mempool.clear()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--heights", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--per-block", type=int, default=10)
+    parser.add_argument("--addresses", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'height':>8}{'undo log, ms':>14}{'rebuild, ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for blocks in args.heights:
+            base = os.path.join(tmp, f"{blocks}.sqlite3")
+            build(base, blocks, args.per_block, args.addresses)
+            results = {}
+            for name, run in (("undo", incremental), ("rebuild", rebuild)):
+                times = []
+                for _ in range(args.repeat):
+                    path = os.path.join(tmp, "run.sqlite3")
+                    shutil.copy(base, path)
+                    times.append(asyncio.run(run(path, blocks, args.depth)))
+                results[name] = min(times) * 1000
+            print(f"{blocks:>8}{results['undo']:>14.1f}{results['rebuild']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
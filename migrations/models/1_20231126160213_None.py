@@ -1,22 +0,0 @@
-from tortoise import BaseDBAsyncClient
-
-
-async def upgrade(db: BaseDBAsyncClient) -> str:
-    return """
-        CREATE TABLE IF NOT EXISTS "users" (
-    "id" SERIAL NOT NULL PRIMARY KEY,
-    "username" VARCHAR(20) NOT NULL UNIQUE,
-    "full_name" VARCHAR(50),
-    "password" VARCHAR(128)
-);
-CREATE TABLE IF NOT EXISTS "aerich" (
-    "id" SERIAL NOT NULL PRIMARY KEY,
-    "version" VARCHAR(255) NOT NULL,
-    "app" VARCHAR(100) NOT NULL,
-    "content" JSONB NOT NULL
-);"""
-
-
-async def downgrade(db: BaseDBAsyncClient) -> str:
-    return """
-        """